@@ -0,0 +1,262 @@
+import io
+import json
+import logging
+import threading
+import uuid
+from datetime import datetime, timezone
+from common.rate_limiter import RateLimitTimeout
+from config import settings
+
+logger = logging.getLogger("analyzer_service")
+
+class BatchAnalyzer:
+    """
+    Offline analysis through the OpenAI Batch API, for jobs with urgency "batch"
+    (backfills, overnight imports): cheaper, and outside the per-minute rate limit,
+    but results take up to BATCH_COMPLETION_WINDOW.
+
+    Jobs are queued in MongoDB (see mongo_utils batch jobs). A background thread
+    1. submits the pending jobs as one JSONL request file once BATCH_MIN_JOBS are
+       waiting or the oldest has waited BATCH_MAX_WAIT_SECONDS,
+    2. polls the submitted batches, and
+    3. fans finished results out through on_result (the normal MinIO/Mongo/RabbitMQ
+       save path). Sessions that got some output have the missing chunks analyzed
+       synchronously; sessions that got none (a failed or expired batch) and saves
+       that fail go into the next batch, up to BATCH_MAX_ATTEMPTS times.
+
+    Every step claims its jobs atomically in MongoDB, so any number of analyzer
+    replicas can run a collector, and state survives restarts. Each submission
+    carries an id in its batch metadata, stored on the jobs before batches.create,
+    so a batch whose creation was never recorded is found again (see reconcile).
+
+    load_chunks(job) -> prompt_builder chunks for a job's transcript.
+    on_result(job, analysis_result) saves and announces a finished analysis.
+    on_failure(job, error) records a job that could not be analyzed.
+    """
+    TERMINAL = ("completed", "failed", "expired", "cancelled")
+
+    def __init__(self, llm, mongo, load_chunks, on_result, on_failure):
+        self.llm = llm
+        self.client = llm.client
+        self.mongo = mongo
+        self.load_chunks = load_chunks
+        self.on_result = on_result
+        self.on_failure = on_failure
+        self.owner = uuid.uuid4().hex
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="batch-collector", daemon=True)
+
+    def enqueue(self, user_id, video_id, transcript_filename):
+        self.mongo.add_batch_job(user_id, video_id, transcript_filename)
+        logger.info(f"Queued {video_id} for batch analysis")
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Batch collector failed: {e}", exc_info=True)
+            self._stop.wait(settings.BATCH_POLL_SECONDS)
+
+    def run_once(self):
+        self.reconcile()
+        self.mongo.reclaim_stale_saves()
+        if self._should_submit():
+            self.submit_pending()
+        for batch_id in self.mongo.submitted_batch_ids():
+            self.check_batch(batch_id)
+
+    def _should_submit(self):
+        count, oldest = self.mongo.pending_batch_jobs()
+        if not count:
+            return False
+        if oldest.tzinfo is None:
+            oldest = oldest.replace(tzinfo=timezone.utc) # pymongo returns naive UTC datetimes
+        waited = (datetime.now(timezone.utc) - oldest).total_seconds()
+        return count >= settings.BATCH_MIN_JOBS or waited >= settings.BATCH_MAX_WAIT_SECONDS
+
+    # --- Submit ---
+
+    def submit_pending(self):
+        jobs = self.mongo.claim_batch_jobs(self.owner, settings.BATCH_MAX_JOBS)
+        if not jobs:
+            return None
+
+        try:
+            # 1. One request line per uncached chunk call
+            lines, video_ids = [], []
+            for job in jobs:
+                try:
+                    requests = self.llm.batch_requests(self.load_chunks(job))
+                except Exception as e:
+                    logger.error(f"Could not prepare {job['video_id']} for batch analysis: {e}", exc_info=True)
+                    self.mongo.fail_batch_job(job["video_id"], str(e))
+                    self.on_failure(job, e)
+                    continue
+                if not requests:
+                    # Everything is cached already; nothing to wait for
+                    job = self.mongo.mark_batch_saving(self.owner, job["video_id"])
+                    if job is not None:
+                        self._save(job, {})
+                    continue
+                video_ids.append(job["video_id"])
+                for index, body in requests:
+                    lines.append(json.dumps({
+                        "custom_id": f"{job['video_id']}:{index}",
+                        "method": "POST",
+                        "url": "/v1/responses",
+                        "body": body
+                    }, ensure_ascii=False))
+            if not lines:
+                return None
+
+            # 2. Upload the request file
+            request_file = io.BytesIO(("\n".join(lines) + "\n").encode("utf-8"))
+            uploaded = self.client.files.create(file=("analysis_batch.jsonl", request_file), purpose="batch")
+        except Exception:
+            self.mongo.release_batch_jobs(self.owner)
+            raise
+
+        # 3. Start the batch; from here on a lost response must not lead to a second batch
+        submission = uuid.uuid4().hex
+        self.mongo.mark_batch_submitting(self.owner, video_ids, submission)
+        try:
+            batch = self.client.batches.create(
+                input_file_id=uploaded.id,
+                endpoint="/v1/responses",
+                completion_window=settings.BATCH_COMPLETION_WINDOW,
+                metadata={"service": settings.SERVICE_NAME, "submission": submission}
+            )
+        except Exception:
+            self._try_reconcile({submission: datetime.now(timezone.utc)})
+            raise
+
+        self.mongo.mark_batch_submitted(submission, batch.id)
+        logger.info(f"Submitted batch {batch.id}: {len(video_ids)} sessions, {len(lines)} requests")
+        return batch.id
+
+    def reconcile(self):
+        """
+        Settles submissions whose batches.create outcome was never recorded (the
+        worker died, or the call failed without saying whether the batch exists)
+        once they are older than BATCH_CLAIM_TIMEOUT_SECONDS: a batch carrying the
+        submission id in its metadata is tracked like any other, otherwise the jobs
+        go back to pending.
+        """
+        submissions = self.mongo.stale_submissions()
+        if submissions:
+            self._try_reconcile(submissions)
+
+    def _try_reconcile(self, submissions):
+        try:
+            self._reconcile(submissions)
+        except Exception as e:
+            # The markers stay; the next reconcile() looks again
+            logger.warning(f"Could not look up submission(s) {', '.join(submissions)}: {e}")
+
+    def _reconcile(self, submissions):
+        """submissions: {submission id: when it was marked}"""
+        found = self._find_batches(submissions)
+        for submission in submissions:
+            if submission in found:
+                self.mongo.mark_batch_submitted(submission, found[submission])
+                logger.info(f"Found batch {found[submission]} for submission {submission}; tracking it")
+            else:
+                self.mongo.release_submission(submission)
+                logger.info(f"No batch was created for submission {submission}; its jobs are pending again")
+
+    def _find_batches(self, submissions):
+        """{submission id: batch id} among our batches created since the oldest submission"""
+        oldest = min(submissions.values())
+        if oldest.tzinfo is None:
+            oldest = oldest.replace(tzinfo=timezone.utc) # pymongo returns naive UTC datetimes
+        since = oldest.timestamp() - 600 # our clock vs OpenAI's
+        found = {}
+        for batch in self.client.batches.list(limit=100): # newest first; the SDK fetches further pages
+            if batch.created_at < since or len(found) == len(submissions):
+                break
+            metadata = batch.metadata or {}
+            if metadata.get("service") == settings.SERVICE_NAME and metadata.get("submission") in submissions:
+                found[metadata["submission"]] = batch.id
+        return found
+
+    # --- Track & fan out ---
+
+    def check_batch(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status not in self.TERMINAL:
+            return False
+
+        # Expired and cancelled batches may still have output for some requests
+        logger.info(f"Batch {batch_id} {batch.status}; saving results")
+        outputs = self._read_outputs(batch.output_file_id) if batch.output_file_id else {}
+
+        for video_id in self.mongo.batch_job_ids(batch_id):
+            job = self.mongo.claim_batch_result(video_id, batch_id)
+            if job is None:
+                continue # Another worker is saving it
+            if not outputs.get(video_id):
+                # Analyzing the whole session here would hold up the collector; it goes into the next batch
+                self._requeue(job, RuntimeError(f"No output from batch {batch_id} ({batch.status})"))
+                continue
+            self._save(job, outputs[video_id])
+        return True
+
+    def _save(self, job, outputs):
+        video_id = job["video_id"]
+        try:
+            analysis_result = self.llm.finish_batch(self.load_chunks(job), outputs)
+            self.on_result(job, analysis_result)
+            self.mongo.remove_batch_job(video_id, job.get("batch_id"))
+        except RateLimitTimeout as e:
+            # Only the synchronous fallback waits for capacity; try again on the next poll
+            logger.warning(f"Saving batch result for {video_id} postponed: {e}")
+            self.mongo.retry_batch_result(video_id)
+        except Exception as e:
+            logger.error(f"Batch analysis of {video_id} failed: {e}", exc_info=True)
+            self._requeue(job, e)
+
+    def _requeue(self, job, error):
+        """Sends a job to the next batch, or fails it once it used up BATCH_MAX_ATTEMPTS"""
+        video_id = job["video_id"]
+        attempts = job.get("attempts", 0) + 1
+        if attempts >= settings.BATCH_MAX_ATTEMPTS:
+            logger.error(f"Giving up on batch analysis of {video_id} after {attempts} attempts: {error}")
+            self.mongo.fail_batch_job(video_id, str(error))
+            self.on_failure(job, error)
+            return
+        logger.warning(f"Batch analysis of {video_id} failed (attempt {attempts}/{settings.BATCH_MAX_ATTEMPTS}); queued for the next batch: {error}")
+        self.mongo.requeue_batch_job(video_id, str(error))
+
+    def _read_outputs(self, file_id):
+        """{video_id: {chunk index: output text}} from a batch output file"""
+        outputs = {}
+        for line in self.client.files.content(file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                logger.warning(f"Batch request {record.get('custom_id')} failed: {record.get('error') or response.get('status_code')}")
+                continue
+            video_id, _, index = record["custom_id"].rpartition(":")
+            outputs.setdefault(video_id, {})[int(index)] = self._output_text(response.get("body") or {})
+        return outputs
+
+    @staticmethod
+    def _output_text(body):
+        """The output_text of a Responses API response body (as JSON, not the SDK object)"""
+        return "".join(
+            part.get("text", "")
+            for item in body.get("output") or []
+            if item.get("type") == "message"
+            for part in item.get("content") or []
+            if part.get("type") == "output_text"
+        )
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import threading
+import uuid
+import zlib
+import redis
+from config import settings
+
+logger = logging.getLogger("analyzer_service")
+
+def canonical_turns(turns):
+    """[[speaker, text]] with whitespace collapsed; timestamps and metadata don't change an analysis"""
+    return [[turn["speaker"], " ".join(turn["text"].split())] for turn in turns]
+
+class AnalysisCache:
+    """
+    LLM results in Redis, zlib-compressed.
+
+    Keys are a SHA-256 over canonical JSON of the request content, the model and
+    the prompt (version + text digest), so reordered or extra metadata still hits
+    and a prompt or model change never returns stale results. Entries expire after
+    ANALYSIS_CACHE_TTL_SECONDS and live in their own Redis (CACHE_REDIS_HOST),
+    which runs with maxmemory + allkeys-lru: under memory pressure the least
+    recently used entries go first.
+
+    Hit/miss/byte counters are kept in one Redis hash shared by all workers.
+
+    get_or_compute adds single-flight across workers: on a miss, one worker
+    takes a lease on the key and computes while the others wait for its
+    result (see get_or_compute). Leases and their pub/sub channel live on the
+    coordination Redis (REDIS_HOST), which never evicts.
+    """
+    STATS_KEY = "analysis_cache:stats"
+
+    # Only the lease holder may extend or release it
+    RENEW_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('pexpire', KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+    RELEASE_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self):
+        self.client = redis.Redis(
+            host=settings.CACHE_REDIS_HOST,
+            port=settings.CACHE_REDIS_PORT,
+            decode_responses=False # values are compressed bytes
+        )
+        self.coordination = redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            decode_responses=False
+        )
+        self._renew = self.coordination.register_script(self.RENEW_SCRIPT)
+        self._release = self.coordination.register_script(self.RELEASE_SCRIPT)
+
+    def key(self, kind, content, prompt, prompt_version):
+        digest = hashlib.sha256(json.dumps(
+            {
+                "model": settings.LLM_MODEL,
+                "prompt": hashlib.sha256(prompt.encode()).hexdigest(),
+                "content": content
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False
+        ).encode()).hexdigest()
+        return f"analysis:v{prompt_version}:{kind}:{digest}"
+
+    def get(self, key, count_miss=True):
+        value = self.client.get(key)
+        if value is None:
+            if count_miss:
+                self.client.hincrby(self.STATS_KEY, "misses", 1)
+            return None
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hincrby(self.STATS_KEY, "hits", 1)
+        pipe.hincrby(self.STATS_KEY, "bytes_read", len(value))
+        pipe.execute()
+        return json.loads(zlib.decompress(value))
+
+    def set(self, key, data):
+        raw = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode()
+        value = zlib.compress(raw, settings.ANALYSIS_CACHE_COMPRESSION_LEVEL)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(key, value, ex=settings.ANALYSIS_CACHE_TTL_SECONDS)
+        pipe.hincrby(self.STATS_KEY, "writes", 1)
+        pipe.hincrby(self.STATS_KEY, "bytes_written", len(value))
+        pipe.hincrby(self.STATS_KEY, "bytes_uncompressed", len(raw))
+        pipe.execute()
+
+    def stats(self):
+        return {name.decode(): int(value) for name, value in self.client.hgetall(self.STATS_KEY).items()}
+
+    # --- Single-flight ---
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached value for key, computing it at most once across all workers.
+
+        The first worker to miss takes a lease (SET NX PX) on the key, renews it
+        while compute() runs, stores the result and announces it on a pub/sub
+        channel. Other workers subscribe and wait: they wake up on the announcement
+        (or every SINGLE_FLIGHT_POLL_SECONDS) and read the cache. If the holder
+        crashes its lease expires after SINGLE_FLIGHT_LEASE_MS and a waiter takes
+        over; if compute() raises, the lease is released so a waiter can try.
+        """
+        lease_key = f"{key}:lease"
+        channel = f"{key}:ready"
+        pubsub = None
+        try:
+            while True:
+                cached = self.get(key, count_miss=pubsub is None)
+                if cached is not None:
+                    logger.info("Cache Hit! Returning saved analysis from Redis.")
+                    return cached
+
+                token = uuid.uuid4().hex
+                if self.coordination.set(lease_key, token, nx=True, px=settings.SINGLE_FLIGHT_LEASE_MS):
+                    return self._compute_under_lease(key, lease_key, channel, token, compute)
+
+                # Someone else is computing it
+                if pubsub is None:
+                    self.client.hincrby(self.STATS_KEY, "single_flight_waits", 1)
+                    logger.info("Identical analysis already running on another worker; waiting for its result...")
+                    pubsub = self.coordination.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(channel)
+                    continue # re-check: the result may have landed before we subscribed
+                pubsub.get_message(timeout=settings.SINGLE_FLIGHT_POLL_SECONDS)
+        finally:
+            if pubsub is not None:
+                pubsub.close()
+
+    def _compute_under_lease(self, key, lease_key, channel, token, compute):
+        stop = threading.Event()
+        renew_every = settings.SINGLE_FLIGHT_LEASE_MS / 3000
+
+        def renew():
+            while not stop.wait(renew_every):
+                try:
+                    if not self._renew(keys=[lease_key], args=[token, settings.SINGLE_FLIGHT_LEASE_MS]):
+                        logger.warning(f"Lost the lease on {key}; another worker may compute it too")
+                        return
+                except redis.RedisError as e:
+                    logger.warning(f"Lease renewal failed: {e}")
+
+        renewer = threading.Thread(target=renew, name="lease-renewal", daemon=True)
+        renewer.start()
+        try:
+            result = compute()
+            self.set(key, result)
+            return result
+        finally:
+            stop.set()
+            renewer.join()
+            self._release(keys=[lease_key], args=[token])
+            # Wake waiters either way: they read the result, or take over after a failure
+            self.coordination.publish(channel, b"1")
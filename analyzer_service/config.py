@@ -7,18 +7,56 @@ class Settings(BaseSettings):
     # LLM Settings
     OPENAI_API_KEY: str
     LLM_MODEL: str = "gpt-5-nano-2025-08-07" 
+    PROMPT_TOKEN_BUDGET: int = 8000 # Max transcript tokens per request; longer sessions are split into chunks
+    CHUNK_OVERLAP_TURNS: int = 3 # Turns repeated from the previous chunk as context
+    ANALYSIS_CONCURRENCY: int = 8 # Concurrent OpenAI calls per process (shared by all jobs)
+    ANALYSIS_RETRIES: int = 3 # Attempts per LLM call (each chunk is retried on its own)
+    ANALYSIS_RETRY_BACKOFF: float = 2.0 # Seconds before the first retry; doubles each time
+    LLM_STREAMING: bool = True # Stream responses and store analysis items in MongoDB as they arrive
+    TAIL_REASK_MAX: int = 2 # Times a cut-off answer is continued (asking only for the missing turns) before a full retry
+    OPENAI_BASE_URL: str = "" # Empty = api.openai.com; point at fake_openai_batch.py for local runs
+
+    # Batch mode (jobs with urgency "batch" go through the OpenAI Batch API)
+    BATCH_MODE_ENABLED: bool = True # False = every job takes the interactive path
+    BATCH_MIN_JOBS: int = 50 # Submit a batch once this many jobs are pending...
+    BATCH_MAX_WAIT_SECONDS: int = 15 * 60 # ...or the oldest pending job has waited this long
+    BATCH_MAX_JOBS: int = 500 # Jobs per submitted batch
+    BATCH_POLL_SECONDS: float = 60.0 # How often pending jobs and submitted batches are checked
+    BATCH_COMPLETION_WINDOW: str = "24h"
+    BATCH_CLAIM_TIMEOUT_SECONDS: int = 600 # Jobs claimed by a worker that died before submitting go back to pending
+    BATCH_SAVE_TIMEOUT_SECONDS: int = 3600 # Results a worker died while saving are picked up again
+    BATCH_MAX_ATTEMPTS: int = 3 # Batches a job may go through without a result before it is marked failed
     
     # Infrastructure
-    REDIS_HOST: str = "redis"
+    REDIS_HOST: str = "redis" # Coordination (rate limit, single-flight leases): never evicts
     REDIS_PORT: int = 6379
+    CACHE_REDIS_HOST: str = "redis_llm_cache" # LLM result cache: evicts least recently used keys when full
+    CACHE_REDIS_PORT: int = 6379
+    ANALYSIS_CACHE_TTL_SECONDS: int = 30 * 24 * 3600 # Unread entries go even while the cache has room
+    ANALYSIS_CACHE_COMPRESSION_LEVEL: int = 6 # zlib level
+    SINGLE_FLIGHT_LEASE_MS: int = 30000 # Lease on an in-progress analysis; renewed while it runs, expires if the worker dies
+    SINGLE_FLIGHT_POLL_SECONDS: float = 2.0 # Waiters re-check the cache at least this often
+
+    # OpenAI rate limit (Redis token buckets shared with the query service)
+    OPENAI_RPM_LIMIT: int = 500 # Requests per minute for the API key
+    OPENAI_TPM_LIMIT: int = 200000 # Tokens per minute for the API key
+    OPENAI_OUTPUT_TOKENS_ESTIMATE: int = 4000 # Charged up front per call, corrected from the reported usage
+    RATE_LIMIT_INTERACTIVE_RESERVE: float = 0.2 # Share of each bucket batch analysis leaves for /advisor
+    RATE_LIMIT_MAX_WAIT_SECONDS: float = 300.0 # Longest a call queues for capacity before the job is requeued
     
     MONGO_URI: str = "mongodb://mongo:27017" # Default inside Docker
+    MONGO_BULK_WAIT_MS: int = 50 # Concurrent saves arriving within this window share one bulk write
+    MONGO_BULK_MAX_OPS: int = 100 # ...up to this many
     
     RABBITMQ_HOST: str = "rabbitmq"
     RABBITMQ_PORT: int = 5672
     RABBITMQ_USER: str
     RABBITMQ_PASS: str
 
+    # Worker runtime
+    WORKER_CONCURRENCY: int = 4 # Jobs processed at once (jobs mostly wait on OpenAI)
+    WORKER_PREFETCH: int = 0 # Unacked deliveries per worker; 0 = WORKER_CONCURRENCY
+
     MINIO_ENDPOINT: str = "minio:9000"
     MINIO_ROOT_USER: str
     MINIO_ROOT_PASSWORD: str
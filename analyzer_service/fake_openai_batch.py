@@ -0,0 +1,190 @@
+"""
+Minimal stand-in for the OpenAI Files and Batch endpoints the batch mode uses,
+for running it locally without an API key:
+
+    python fake_openai_batch.py --port 8090 --delay 30
+    OPENAI_BASE_URL=http://localhost:8090/v1 BATCH_MIN_JOBS=1 python main.py
+
+Batches complete `delay` seconds after submission (or expire without output,
+with --expire). Every request gets a synthetic analysis of the lines it was
+asked to analyze, in the shape of the requested output schema.
+"""
+import argparse
+import json
+import re
+import time
+import uuid
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+TURN = re.compile(r"^([A-Za-z0-9 ]{1,20}): (.+)$") # "SPEAKER: text"
+
+files = {} # file id -> (metadata, bytes)
+batches = {} # batch id -> (submitted at, batch)
+
+def _turns_to_analyze(content):
+    lines = content.split("\n")
+    if "[ANALYZE]" in lines:
+        lines = lines[lines.index("[ANALYZE]") + 1:]
+    return [match.groups() for match in map(TURN.match, lines) if match]
+
+def synthetic_output(body):
+    """Output text for one /v1/responses request body"""
+    kind = body.get("text", {}).get("format", {}).get("name", "session_analysis").replace("_analysis", "")
+    turns = _turns_to_analyze(body["input"][-1]["content"])
+    result = {
+        "participants": [{"speaker": speaker, "role": "Participant"} for speaker in sorted({s for s, _ in turns})],
+        "analysis": [
+            {"speaker": speaker, "text": text, "topic": "General", "emotion": "Neutral", "subtext": "None detected"}
+            for speaker, text in turns
+        ]
+    }
+    if kind == "chunk":
+        result["summary"] = f"{len(turns)} turns discussed."
+    else:
+        result["clinical_recommendations"] = "Continue the current treatment plan."
+    return json.dumps(result)
+
+def run_batch(batch):
+    _, data = files[batch["input_file_id"]]
+    lines = []
+    for line in data.decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        text = synthetic_output(request["body"])
+        lines.append(json.dumps({
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": request["custom_id"],
+            "response": {
+                "status_code": 200,
+                "request_id": uuid.uuid4().hex,
+                "body": {
+                    "id": f"resp_{uuid.uuid4().hex}",
+                    "object": "response",
+                    "status": "completed",
+                    "output": [{
+                        "type": "message",
+                        "role": "assistant",
+                        "content": [{"type": "output_text", "text": text, "annotations": []}]
+                    }],
+                    "usage": {"input_tokens": len(line) // 4, "output_tokens": len(text) // 4, "total_tokens": (len(line) + len(text)) // 4}
+                }
+            },
+            "error": None
+        }))
+    output_file = store_file("batch_output.jsonl", "batch_output", ("\n".join(lines) + "\n").encode("utf-8"))
+    batch.update({
+        "status": "completed",
+        "output_file_id": output_file["id"],
+        "completed_at": int(time.time()),
+        "request_counts": {"total": len(lines), "completed": len(lines), "failed": 0}
+    })
+
+def expire_batch(batch):
+    batch.update({"status": "expired", "expired_at": int(time.time())})
+
+def store_file(filename, purpose, data):
+    metadata = {
+        "id": f"file-{uuid.uuid4().hex}",
+        "object": "file",
+        "bytes": len(data),
+        "created_at": int(time.time()),
+        "filename": filename,
+        "purpose": purpose,
+        "status": "processed"
+    }
+    files[metadata["id"]] = (metadata, data)
+    return metadata
+
+class Handler(BaseHTTPRequestHandler):
+    delay = 30
+    expire = False
+
+    def _json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        if self.path == "/v1/files":
+            # multipart/form-data: the stdlib email parser handles it given the content type
+            message = BytesParser().parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + self._body()
+            )
+            fields = {part.get_param("name", header="content-disposition"): part for part in message.get_payload()}
+            upload = fields["file"]
+            purpose = fields["purpose"].get_payload(decode=True).decode()
+            return self._json(store_file(upload.get_filename(), purpose, upload.get_payload(decode=True)))
+
+        if self.path == "/v1/batches":
+            request = json.loads(self._body())
+            if request["input_file_id"] not in files:
+                return self._json({"error": {"message": "No such file"}}, status=404)
+            batch = {
+                "id": f"batch_{uuid.uuid4().hex}",
+                "object": "batch",
+                "endpoint": request["endpoint"],
+                "input_file_id": request["input_file_id"],
+                "completion_window": request["completion_window"],
+                "status": "in_progress",
+                "output_file_id": None,
+                "error_file_id": None,
+                "created_at": int(time.time()),
+                "metadata": request.get("metadata"),
+                "request_counts": {"total": 0, "completed": 0, "failed": 0}
+            }
+            batches[batch["id"]] = (time.monotonic(), batch)
+            return self._json(batch)
+
+        self._json({"error": {"message": "Not found"}}, status=404)
+
+    def do_GET(self):
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        if parts == ["v1", "batches"]:
+            # Newest first, all on one page
+            data = [batch for _, batch in sorted(batches.values(), key=lambda entry: entry[0], reverse=True)]
+            return self._json({
+                "object": "list",
+                "data": data,
+                "first_id": data[0]["id"] if data else None,
+                "last_id": data[-1]["id"] if data else None,
+                "has_more": False
+            })
+
+        if parts[:2] == ["v1", "batches"] and len(parts) == 3 and parts[2] in batches:
+            submitted, batch = batches[parts[2]]
+            if batch["status"] == "in_progress" and time.monotonic() - submitted >= self.delay:
+                if self.expire:
+                    expire_batch(batch)
+                else:
+                    run_batch(batch)
+            return self._json(batch)
+
+        if parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in files:
+            _, data = files[parts[2]]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        self._json({"error": {"message": "Not found"}}, status=404)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI Batch API for local runs")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--delay", type=float, default=30, help="Seconds until a batch completes")
+    parser.add_argument("--expire", action="store_true", help="Batches expire without output instead")
+    args = parser.parse_args()
+    Handler.delay = args.delay
+    Handler.expire = args.expire
+    ThreadingHTTPServer(("", args.port), Handler).serve_forever()
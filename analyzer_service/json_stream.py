@@ -0,0 +1,123 @@
+import json
+import logging
+
+logger = logging.getLogger("analyzer_service")
+
+class AnalysisStreamParser:
+    """
+    Incremental parser for the analysis JSON object as the model streams it.
+
+    feed(text) returns the elements of the top-level "analysis" array that were
+    completed by that text, so they can be stored before the response ends.
+    Other top-level values (participants, clinical_recommendations, summary) are
+    collected as soon as each is complete. Anything before the first "{" (e.g. a
+    ```json fence) is ignored, as is anything after the closing "}".
+
+    If the stream is cut off, result() still returns every value and analysis
+    item completed up to that point.
+    """
+    ITEMS_KEY = "analysis"
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.started = False
+        self.done = False
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.expect_key = False
+        self.key = None
+        self.value_start = None # start of the current top-level value
+        self.item_start = None # start of the current analysis element
+        self.values = {}
+        self.items = []
+
+    def feed(self, text):
+        self.buffer += text
+        new_items = []
+        buf = self.buffer
+        for i in range(self.pos, len(buf)):
+            if self.done:
+                break
+            c = buf[i]
+
+            if not self.started:
+                if c == "{":
+                    self.started = True
+                    self.depth = 1
+                    self.expect_key = True
+                continue
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        if self.expect_key:
+                            self.key = self._load(buf[self.string_start:i + 1])
+                            self.expect_key = False
+                        else:
+                            self._store_value(buf[self.value_start:i + 1])
+                continue
+
+            if c == '"':
+                self.in_string = True
+                self.string_start = i
+                if self.depth == 1 and not self.expect_key and self.value_start is None:
+                    self.value_start = i
+            elif c in "{[":
+                if self.depth == 1 and self.value_start is None:
+                    self.value_start = i
+                elif self.depth == 2 and self.key == self.ITEMS_KEY and c == "{":
+                    self.item_start = i
+                self.depth += 1
+            elif c in "}]":
+                if self.depth == 1 and self.value_start is not None:
+                    self._store_value(buf[self.value_start:i]) # number/literal closed by "}"
+                self.depth -= 1
+                if self.depth == 2 and self.item_start is not None:
+                    item = self._load(buf[self.item_start:i + 1])
+                    self.item_start = None
+                    if isinstance(item, dict):
+                        self.items.append(item)
+                        new_items.append(item)
+                elif self.depth == 1 and self.value_start is not None:
+                    self._store_value(buf[self.value_start:i + 1])
+                elif self.depth == 0:
+                    self.done = True
+            elif c == ",":
+                if self.depth == 1:
+                    if self.value_start is not None:
+                        self._store_value(buf[self.value_start:i])
+                    self.expect_key = True
+            elif c not in " \t\r\n:" and self.depth == 1 and not self.expect_key and self.value_start is None:
+                self.value_start = i # number/true/false/null
+        self.pos = len(buf)
+        return new_items
+
+    def _load(self, text):
+        try:
+            return json.loads(text, strict=False) # Tolerates raw control characters inside strings
+        except ValueError as e:
+            logger.warning(f"Skipping malformed value in the model output: {e}")
+            return None
+
+    def _store_value(self, text):
+        if self.key is not None and self.key != self.ITEMS_KEY:
+            value = self._load(text.strip())
+            if value is not None:
+                self.values[self.key] = value
+        self.value_start = None
+
+    def result(self):
+        """Everything parsed so far; "truncated" is set if the object never closed"""
+        result = dict(self.values)
+        result[self.ITEMS_KEY] = list(self.items)
+        if not self.done:
+            result["truncated"] = True
+        return result
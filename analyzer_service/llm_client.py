@@ -1,36 +1,23 @@
 import json
-import hashlib
-import redis
+import time
 import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
+from cache_utils import AnalysisCache, canonical_turns
+from json_stream import AnalysisStreamParser
+from prompt_builder import count_tokens, remaining_turns, render_chunk
+from common.rate_limiter import OpenAIRateLimiter, RateLimitTimeout
+import schemas
 from config import settings
 
 logger = logging.getLogger("analyzer_service")
 
-class LLMAnalyzer:
-    def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        self.cache = redis.Redis(
-            host=settings.REDIS_HOST, 
-            port=settings.REDIS_PORT, 
-            decode_responses=True
-        )
+# Bump when the prompts or the result format change (the prompt text is also part of cache keys)
+PROMPT_VERSION = 3
 
-    def analyze_transcript(self, transcript_data):
-        # 1. Create a unique Cache Key
-        transcript_text = json.dumps(transcript_data)
-        cache_key = f"analysis:{hashlib.md5(transcript_text.encode()).hexdigest()}"
-        
-        # 2. Check Cache
-        cached_result = self.cache.get(cache_key)
-        if cached_result:
-            logger.info("Cache Hit! Returning saved analysis from Redis.")
-            return json.loads(cached_result)
-
-        logger.info("Cache Miss. Calling OpenAI (GPT-5 Nano)...")
-        
-        # 3. System Prompt (Deep Psychological Focus)
-        system_prompt = """
+# System Prompt (Deep Psychological Focus)
+SYSTEM_PROMPT = """
         You are an expert clinical psychologist specializing in Psychodynamic and Emotionally Focused Therapy (EFT).
         Your task is to analyze the following therapy session transcript to uncover the subtext and latent emotions.
 
@@ -46,10 +33,10 @@ class LLMAnalyzer:
         - Output MUST be valid, parseable JSON.
         - Do NOT create images.
         - Do NOT use markdown code blocks (```json). Just the raw JSON object.
-        
+
         **Output JSON Structure:**
         {
-            "participants": {"Speaker A": "Role", "Speaker B": "Role"},
+            "participants": [{"speaker": "A", "role": "Role"}, {"speaker": "B", "role": "Role"}],
             "analysis": [
                 {"speaker": "A", "text": "...", "topic": "...", "emotion": "...", "subtext": "..."}
             ],
@@ -57,10 +44,348 @@ class LLMAnalyzer:
         }
         """
 
-        # 4. Call OpenAI (Using new Responses API syntax)
-        # We inject our prompts into the 'input' list
-        response = self.client.responses.create(
-            model="gpt-5-nano",
+TRANSCRIPT_INTRO = "Analyze this transcript (one turn per line, 'SPEAKER: text'):\n"
+
+# Sent with the lines an earlier answer didn't get to
+CONTINUATION_NOTE = (
+    "Your previous answer was cut off. Continue it: analyze only the lines under [ANALYZE] "
+    "(all lines if there is no [ANALYZE] marker) and fill in the other fields.\n"
+)
+FINISH_NOTE = 'The per-utterance analysis is already complete: return an empty "analysis" array and fill in the other fields.\n'
+
+# Map step: one part of a long session
+CHUNK_PROMPT = SYSTEM_PROMPT + """
+        **The transcript is one part of a longer session.**
+        - Lines under [CONTEXT] end the previous part and are only there for continuity. Do NOT include them in "analysis"; analyze only the lines under [ANALYZE].
+        - Instead of "clinical_recommendations", return "summary": a short clinical summary of this part (themes, emotional shifts, defenses, alliance).
+
+        **Output JSON Structure:**
+        {
+            "participants": [{"speaker": "A", "role": "Role"}, {"speaker": "B", "role": "Role"}],
+            "analysis": [
+                {"speaker": "A", "text": "...", "topic": "...", "emotion": "...", "subtext": "..."}
+            ],
+            "summary": "..."
+        }
+        """
+
+# Reduce step: recommendations for the whole session from the part summaries
+REDUCE_PROMPT = """
+        You are an expert clinical psychologist specializing in Psychodynamic and Emotionally Focused Therapy (EFT).
+        You are given the participants and consecutive clinical summaries of the parts of one therapy session.
+        Provide actionable interventions for the therapist for the session as a whole.
+
+        **Constraints:**
+        - Output MUST be valid, parseable JSON.
+        - Do NOT use markdown code blocks (```json). Just the raw JSON object.
+
+        **Output JSON Structure:**
+        {"clinical_recommendations": "..."}
+        """
+
+# Result for a transcript with no turns; no model call needed
+EMPTY_ANALYSIS = {"participants": {}, "analysis": [], "clinical_recommendations": ""}
+
+class TruncatedOutput(Exception):
+    """The model's output ended early; .partial holds everything parsed before that"""
+    def __init__(self, message, partial):
+        super().__init__(message)
+        self.partial = partial
+
+class ContextEcho:
+    """
+    Drops the items a model wrote for the context lines it was told not to analyze.
+    An echo can only come first, so the first len(context) items are dropped only
+    if their texts match the context in order; a short turn that really repeats
+    later on ("Yeah.") is kept. Items may be fed in pieces as they stream in.
+    """
+    def __init__(self, context):
+        self.context = list(context) # texts, in order
+        self.held = []
+        self.decided = not self.context
+
+    def feed(self, items):
+        if self.decided:
+            return list(items)
+        self.held.extend(items)
+        checked = self.held[:len(self.context)]
+        if any(item.get("text") != text for item, text in zip(checked, self.context)):
+            return self.flush() # Not an echo
+        if len(self.held) >= len(self.context):
+            self.decided = True
+            rest, self.held = self.held[len(self.context):], []
+            return rest
+        return [] # Could still be one
+
+    def flush(self):
+        """Items held back because the output ended while they still matched the context"""
+        self.decided = True
+        held, self.held = self.held, []
+        return held
+
+def drop_context_echo(items, context):
+    echo = ContextEcho(context)
+    return echo.feed(items) + echo.flush()
+
+def context_texts(turns):
+    return [turn["text"] for turn in turns]
+
+class ChunkProgress:
+    """Forwards one chunk's streamed analysis items to the job's progress store"""
+    def __init__(self, progress, chunk, context):
+        self.progress = progress
+        self.chunk = chunk
+        self.context = context_texts(context)
+        self.streamed = False
+
+    def start(self):
+        self.streamed = False
+        self.progress.start(self.chunk)
+
+    def add(self, items):
+        if items:
+            self.progress.add(self.chunk, items)
+
+class LLMAnalyzer:
+    def __init__(self):
+        self.client = OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL or None)
+        self.cache = AnalysisCache()
+        self.limiter = OpenAIRateLimiter(settings, logger)
+        # Shared by all worker threads, so it bounds concurrent OpenAI calls per process
+        self.pool = ThreadPoolExecutor(max_workers=settings.ANALYSIS_CONCURRENCY, thread_name_prefix="llm")
+
+    def analyze_transcript(self, chunks, progress=None):
+        """
+        chunks: prompt_builder chunks ("SPEAKER: text" per line).
+        A single chunk is analyzed in one call. Longer sessions are map-reduced:
+        every chunk is analyzed concurrently (each retried on its own), the
+        per-utterance analyses are concatenated in order and one more call turns
+        the chunk summaries into the session's clinical recommendations.
+        With LLM_STREAMING, analysis items are passed to progress (see
+        mongo_utils.AnalysisProgress) as the model produces them.
+        An empty transcript gets an empty analysis without calling the model.
+        """
+        if not chunks:
+            return EMPTY_ANALYSIS.copy()
+        calls = self._map_calls(chunks)
+        if len(chunks) == 1:
+            return self._complete_with_retries(
+                *calls[0],
+                ChunkProgress(progress, 0, []) if progress else None,
+                chunks[0]
+            )
+
+        # 1. Map
+        logger.info(f"Analyzing {len(chunks)} chunks (up to {settings.ANALYSIS_CONCURRENCY} at once)...")
+        parts = list(self.pool.map(
+            lambda index: self._complete_with_retries(
+                *calls[index],
+                ChunkProgress(progress, index, chunks[index]["context"]) if progress else None,
+                chunks[index]
+            ),
+            range(len(chunks))
+        ))
+
+        # 2. Reduce
+        return self._reduce(chunks, parts)
+
+    def _reduce(self, chunks, parts):
+        """Concatenates the chunk analyses and turns their summaries into recommendations"""
+        participants = self._merge_participants(part.get("participants") or {} for part in parts)
+        analysis = []
+        for chunk, part in zip(chunks, parts):
+            # Drop the context lines if the model analyzed them anyway
+            analysis.extend(drop_context_echo(part.get("analysis") or [], context_texts(chunk["context"])))
+
+        summaries = "\n\n".join(
+            f"Part {i + 1}: {part.get('summary', '')}" for i, part in enumerate(parts)
+        )
+        cache_key = self.cache.key(
+            "reduce",
+            {"participants": participants, "summaries": [part.get("summary", "") for part in parts]},
+            REDUCE_PROMPT,
+            PROMPT_VERSION
+        )
+        reduced = self._complete_with_retries(
+            "reduce",
+            REDUCE_PROMPT,
+            f"Participants: {json.dumps(participants)}\n\n{summaries}",
+            cache_key
+        )
+        result = {
+            "participants": participants,
+            "analysis": analysis,
+            "clinical_recommendations": reduced.get("clinical_recommendations", "")
+        }
+        if any(part.get("truncated") for part in parts):
+            result["truncated"] = True
+        return result
+
+    def _map_calls(self, chunks):
+        """(kind, system prompt, user content, cache key) of the call for each chunk"""
+        if len(chunks) == 1:
+            cache_key = self.cache.key("session", canonical_turns(chunks[0]["turns"]), SYSTEM_PROMPT, PROMPT_VERSION)
+            return [("session", SYSTEM_PROMPT, TRANSCRIPT_INTRO + chunks[0]["text"], cache_key)]
+
+        calls = []
+        for index, chunk in enumerate(chunks):
+            cache_key = self.cache.key(
+                "chunk",
+                {
+                    "part": index + 1,
+                    "parts": len(chunks),
+                    "context": canonical_turns(chunk["context"]),
+                    "turns": canonical_turns(chunk["turns"])
+                },
+                CHUNK_PROMPT,
+                PROMPT_VERSION
+            )
+            calls.append((
+                "chunk",
+                CHUNK_PROMPT,
+                f"Part {index + 1} of {len(chunks)}. " + TRANSCRIPT_INTRO + chunk["text"],
+                cache_key
+            ))
+        return calls
+
+    # --- Batch API (see batch_analyzer.py) ---
+
+    def batch_requests(self, chunks):
+        """
+        Request bodies for the OpenAI Batch API: [(chunk index, body)] for every
+        map call of the session that isn't cached yet. The reduce step of long
+        sessions is small and runs synchronously in finish_batch().
+        """
+        return [
+            (index, self._request_args(kind, system_prompt, user_content))
+            for index, (kind, system_prompt, user_content, cache_key) in enumerate(self._map_calls(chunks))
+            if self.cache.get(cache_key, count_miss=False) is None
+        ]
+
+    def finish_batch(self, chunks, outputs):
+        """
+        Completes a session from Batch API output texts ({chunk index: text}).
+        Valid outputs are cached; chunks whose output is missing, cut off or
+        invalid are analyzed synchronously (with the usual tail re-ask and retries).
+        """
+        if not chunks:
+            return EMPTY_ANALYSIS.copy()
+        parts = []
+        for index, (kind, system_prompt, user_content, cache_key) in enumerate(self._map_calls(chunks)):
+            part = self.cache.get(cache_key, count_miss=False)
+            if part is None and outputs.get(index) is not None:
+                part = self._parse_batch_output(kind, outputs[index])
+                if part is not None:
+                    self.cache.set(cache_key, part)
+            if part is None:
+                logger.info(f"No usable batch output for chunk {index + 1}/{len(chunks)}; analyzing it now")
+                part = self._complete_with_retries(kind, system_prompt, user_content, cache_key, chunk=chunks[index])
+            parts.append(part)
+
+        if len(chunks) == 1:
+            return parts[0]
+        return self._reduce(chunks, parts)
+
+    @staticmethod
+    def _parse_batch_output(kind, text):
+        parser = AnalysisStreamParser()
+        parser.feed(text)
+        result = parser.result()
+        if not parser.started or result.pop("truncated", False):
+            return None
+        try:
+            return schemas.validate(kind, result)
+        except schemas.InvalidOutput as e:
+            logger.warning(f"Invalid batch output: {e}")
+            return None
+
+    @staticmethod
+    def _merge_participants(per_chunk):
+        """Most frequent role per speaker across chunks"""
+        votes = {}
+        for participants in per_chunk:
+            for speaker, role in participants.items():
+                votes.setdefault(speaker, Counter())[role] += 1
+        return {speaker: counter.most_common(1)[0][0] for speaker, counter in votes.items()}
+
+    def _complete_with_retries(self, kind, system_prompt, user_content, cache_key, chunk_progress=None, chunk=None):
+        """
+        One LLM call of the given output kind (see schemas.SCHEMAS). Failed calls and
+        invalid output are retried with backoff; cut-off output is continued first (see
+        _generate). If the last attempt is still incomplete, whatever was parsed is
+        returned (marked "truncated") instead of failing the whole job.
+        """
+        for attempt in range(1, settings.ANALYSIS_RETRIES + 1):
+            try:
+                if chunk_progress:
+                    chunk_progress.start() # A retry replaces the partial items of the failed attempt
+                return self._complete(kind, system_prompt, user_content, cache_key, chunk_progress, chunk)
+            except RateLimitTimeout:
+                raise # Already waited as long as allowed; the job is requeued
+            except Exception as e:
+                if attempt == settings.ANALYSIS_RETRIES:
+                    if isinstance(e, TruncatedOutput):
+                        logger.warning(f"Keeping {len(e.partial.get('analysis') or [])} items parsed before the output was cut off")
+                        return schemas.validate(kind, e.partial, partial=True)
+                    raise
+                delay = settings.ANALYSIS_RETRY_BACKOFF * 2 ** (attempt - 1)
+                logger.warning(f"LLM call failed ({e}); attempt {attempt}/{settings.ANALYSIS_RETRIES}, retrying in {delay:.0f}s")
+                time.sleep(delay)
+
+    def _complete(self, kind, system_prompt, user_content, cache_key, chunk_progress=None, chunk=None):
+        # Cached, or computed once across all workers (concurrent identical calls wait for it)
+        result = self.cache.get_or_compute(
+            cache_key,
+            lambda: self._generate(kind, system_prompt, user_content, chunk_progress, chunk)
+        )
+        if chunk_progress and not chunk_progress.streamed:
+            # Cache hit, other worker's result or non-streaming
+            chunk_progress.add(drop_context_echo(result.get("analysis") or [], chunk_progress.context))
+        return result
+
+    def _generate(self, kind, system_prompt, user_content, chunk_progress=None, chunk=None):
+        """
+        Requests schema-constrained output and validates it. When a transcript answer
+        is cut off (or lacks a field), only the missing tail is asked for: the turns not
+        yet analyzed, with a few analyzed ones as context, up to TAIL_REASK_MAX times.
+        """
+        context = context_texts(chunk["context"]) if chunk is not None else []
+        result, complete = self._request(kind, system_prompt, user_content, chunk_progress, context)
+
+        rounds = 0
+        while chunk is not None and rounds < settings.TAIL_REASK_MAX and (not complete or schemas.missing_fields(kind, result)):
+            rounds += 1
+            tail_content, tail_context = self._tail_request(chunk, result)
+            logger.info(f"Output incomplete ({len(result.get('analysis') or [])} items); asking for the rest (round {rounds})")
+            more, complete = self._request(kind, system_prompt, tail_content, chunk_progress, tail_context)
+            result = self._merge_tail(result, more, tail_context)
+
+        if not complete:
+            raise TruncatedOutput("Model output ended before the JSON object was complete", result)
+        return schemas.validate(kind, result)
+
+    @staticmethod
+    def _tail_request(chunk, result):
+        """User message for the part of a chunk an incomplete answer didn't cover, and its context texts"""
+        remaining = remaining_turns(chunk["turns"], result.get("analysis") or [])
+        if not remaining:
+            return FINISH_NOTE + TRANSCRIPT_INTRO + chunk["text"], []
+        done = chunk["turns"][:len(chunk["turns"]) - len(remaining)]
+        context = (chunk["context"] + done)[-settings.CHUNK_OVERLAP_TURNS:] if settings.CHUNK_OVERLAP_TURNS else []
+        return CONTINUATION_NOTE + TRANSCRIPT_INTRO + render_chunk(context, remaining), context_texts(context)
+
+    @staticmethod
+    def _merge_tail(result, more, context):
+        merged = dict(result)
+        for field, value in more.items():
+            if field != "analysis" and not merged.get(field):
+                merged[field] = value
+        merged["analysis"] = (result.get("analysis") or []) + drop_context_echo(more.get("analysis") or [], context)
+        return merged
+
+    def _request_args(self, kind, system_prompt, user_content):
+        return dict(
+            model=settings.LLM_MODEL,
             input=[
                 {
                     "role": "system",
@@ -68,13 +393,11 @@ class LLMAnalyzer:
                 },
                 {
                     "role": "user",
-                    "content": f"Analyze this transcript: {transcript_text}"
+                    "content": user_content
                 }
             ],
             text={
-                "format": {
-                    "type": "text" 
-                },
+                "format": schemas.text_format(kind), # Structured output: the model must follow the schema
                 "verbosity": "medium"
             },
             reasoning={
@@ -88,25 +411,61 @@ class LLMAnalyzer:
             ]
         )
 
-        # 5. Extract Output
-       
+    def _acquire_capacity(self, system_prompt, user_content):
+        # Wait for a share of the OpenAI rate limit (shared with every worker and the query service)
+        return self.limiter.acquire(
+            count_tokens(system_prompt) + count_tokens(user_content) + settings.OPENAI_OUTPUT_TOKENS_ESTIMATE,
+            priority="batch"
+        )
+
+    def _request(self, kind, system_prompt, user_content, chunk_progress=None, context=()):
+        """
+        One model call. Returns (parsed fields, complete). The output goes through the
+        tolerant incremental parser, streamed (LLM_STREAMING) or not, so a cut-off answer
+        still yields everything completed before the cut. context: texts of the lines
+        the request marks as context, kept out of the streamed progress.
+        """
+        logger.info(f"Cache Miss. Calling OpenAI ({settings.LLM_MODEL}, {kind})...")
+
+        # 1. Wait for a share of the OpenAI rate limit
+        charged = self._acquire_capacity(system_prompt, user_content)
+
+        # 2. Call OpenAI (Using new Responses API syntax)
+        # We inject our prompts into the 'input' list
+        parser = AnalysisStreamParser()
+        echo = ContextEcho(context)
+        usage = None
         try:
-            # Try new format attribute if available, else standard
-            if hasattr(response, 'output_text'):
-                result = response.output_text
-            elif hasattr(response, 'choices'):
-                result = response.choices[0].message.content
+            if settings.LLM_STREAMING:
+                stream = self.client.responses.create(stream=True, **self._request_args(kind, system_prompt, user_content))
+                for event in stream:
+                    if event.type == "response.output_text.delta":
+                        items = parser.feed(event.delta)
+                        if items and chunk_progress:
+                            chunk_progress.streamed = True
+                            chunk_progress.add(echo.feed(items))
+                    elif event.type in ("response.completed", "response.incomplete", "response.failed"):
+                        usage = getattr(event.response, "usage", None)
+                        if event.type != "response.completed":
+                            logger.warning(f"Response ended with {event.type}")
+                        break
             else:
-                # Fallback for specific response types
-                result = str(response) 
-        except Exception:
-            # If structure is totally new, dump it to string to debug, but assume text property
-            result = response.text if hasattr(response, 'text') else ""
-
-        # Clean up result (remove markdown if model added it despite instructions)
-        cleaned_result = result.replace("```json", "").replace("```", "").strip()
-
-        # 6. Save to Cache
-        self.cache.setex(cache_key, 86400, cleaned_result)
-        
-        return json.loads(cleaned_result)
\ No newline at end of file
+                response = self.client.responses.create(**self._request_args(kind, system_prompt, user_content))
+                usage = getattr(response, "usage", None)
+                parser.feed(response.output_text)
+        except Exception as e:
+            if not parser.started:
+                raise
+            logger.warning(f"Response interrupted after {len(parser.items)} items: {e}")
+        finally:
+            self.limiter.settle(charged, getattr(usage, "total_tokens", None))
+
+        if chunk_progress and chunk_progress.streamed:
+            chunk_progress.add(echo.flush()) # Items that only looked like the start of an echo
+
+        # 3. Extract Output
+        if not parser.started:
+            raise schemas.InvalidOutput("No JSON object in the model output")
+        result = parser.result()
+        complete = not result.pop("truncated", False)
+        return result, complete
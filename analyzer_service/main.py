@@ -2,15 +2,66 @@ import json
 import logging
 import sys
 from minio_utils import MinioClient
-from rabbitmq_utils import RabbitMQClient
-from mongo_utils import MongoClientWrapper
+from common.rabbitmq import RabbitMQClient
+from mongo_utils import MongoClientWrapper, AnalysisProgress
 from llm_client import LLMAnalyzer
+from batch_analyzer import BatchAnalyzer
+from config import settings
+from common.rate_limiter import RateLimitTimeout
+from transcript_utils import compact_transcript
+from prompt_builder import build_transcript_prompt, log_prompt_metrics
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("analyzer_service")
 
+# Long-lived clients, shared by all worker threads
+minio = None
+rabbitmq = None
+mongo = None
+llm = None
+batch = None
+
+def load_chunks(video_id, transcript_filename):
+    # 1. Get Transcript
+    logger.info(f"Fetching transcript: {transcript_filename}...")
+    transcript = compact_transcript(minio.download_json(transcript_filename))
+
+    # 2. Build the prompt (speaker turns only, chunked to the token budget)
+    prompt = build_transcript_prompt(transcript['turns'])
+    log_prompt_metrics(video_id, prompt)
+    return prompt['chunks']
+
+def save_analysis(user_id, video_id, analysis_result):
+    # 4. Save to MinIO (File Storage)
+    analysis_filename = f"{video_id}-analysis.json"
+    logger.info(f"Saving file to MinIO: {analysis_filename}...")
+    minio.upload_json(analysis_result, analysis_filename)
+
+    # 5. Save to MongoDB (Query Storage)
+    logger.info(f"Saving record to MongoDB for User: {user_id}...")
+    mongo.save_analysis(user_id, video_id, analysis_result)
+    mongo.clear_progress(video_id)
+
+    # 6. Publish Completion
+    next_event = {
+        "user_id": user_id,
+        "video_id": video_id,
+        "analysis_file": analysis_filename,
+        "status": "analysis_completed"
+    }
+    rabbitmq.publish_event(next_event)
+    logger.info("Analysis complete. Event published.")
+
+def record_failure(video_id, error):
+    """Best effort: the message is dropped either way"""
+    try:
+        minio.mark_failed(video_id, error)
+    except Exception as e:
+        logger.error(f"Could not mark {video_id} as failed: {e}")
+
 def process_analysis(ch, method, properties, body):
+    video_id = None
     try:
         message = json.loads(body)
         logger.info(f"Received task: {message}")
@@ -19,45 +70,51 @@ def process_analysis(ch, method, properties, body):
         video_id = message.get('video_id')
         user_id = message.get('user_id', 'anonymous') 
         transcript_filename = message.get('transcript_filename')
-        
-        minio = MinioClient()
-        rabbitmq = RabbitMQClient()
-        mongo = MongoClientWrapper()
-        llm = LLMAnalyzer()
 
-        # 1. Get Transcript
-        logger.info(f"Fetching transcript: {transcript_filename}...")
-        transcript_data = minio.download_json(transcript_filename)
+        # Not urgent: analyzed with the next OpenAI batch (see batch_analyzer.py)
+        if message.get('urgency') == "batch" and settings.BATCH_MODE_ENABLED:
+            batch.enqueue(user_id, video_id, transcript_filename)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            return
 
-        # 2. Analyze
+        # 1-2. Transcript -> prompt chunks
+        chunks = load_chunks(video_id, transcript_filename)
+
+        # 3. Analyze (long sessions are map-reduced over the chunks)
         logger.info("Running Psychological Analysis...")
-        analysis_result = llm.analyze_transcript(transcript_data)
-
-        # 3. Save to MinIO (File Storage)
-        analysis_filename = f"{video_id}-analysis.json"
-        logger.info(f"Saving file to MinIO: {analysis_filename}...")
-        minio.upload_json(analysis_result, analysis_filename)
-
-        # 4. Save to MongoDB (Query Storage)
-        logger.info(f"Saving record to MongoDB for User: {user_id}...")
-        mongo.save_analysis(user_id, video_id, analysis_result)
-
-        # 5. Publish Completion
-        next_event = {
-            "user_id": user_id,
-            "video_id": video_id,
-            "analysis_file": analysis_filename,
-            "status": "analysis_completed"
-        }
-        rabbitmq.publish_event(next_event)
-        logger.info("Analysis complete. Event published.")
+        # Items are streamed into MongoDB as they arrive, so clients can read partial results
+        progress = AnalysisProgress(mongo, user_id, video_id)
+        analysis_result = llm.analyze_transcript(chunks, progress)
+
+        # 4-6. Save & announce
+        save_analysis(user_id, video_id, analysis_result)
 
         ch.basic_ack(delivery_tag=method.delivery_tag)
 
+    except RateLimitTimeout as e:
+        # Nothing wrong with the job; try again once the limit has room
+        logger.warning(f"Analysis postponed: {e}")
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+
     except Exception as e:
         logger.error(f"Analysis failed: {e}", exc_info=True)
+        if video_id:
+            record_failure(video_id, e)
         ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
 
 if __name__ == "__main__":
-    rabbitmq = RabbitMQClient()
+    minio = MinioClient()
+    rabbitmq = RabbitMQClient(settings, consume_queue='transcription_processing_queue', publish_queue='analysis_ready_queue', logger=logger)
+    mongo = MongoClientWrapper()
+    mongo.ensure_indexes()
+    llm = LLMAnalyzer()
+    batch = BatchAnalyzer(
+        llm,
+        mongo,
+        lambda job: load_chunks(job['video_id'], job['transcript_filename']),
+        lambda job, analysis_result: save_analysis(job['user_id'], job['video_id'], analysis_result),
+        lambda job, error: record_failure(job['video_id'], error)
+    )
+    rabbitmq.connect() # Before the collector can publish from its thread
+    batch.start()
     rabbitmq.consume(process_analysis)
\ No newline at end of file
@@ -24,7 +24,22 @@ class MinioClient:
 
     def download_json(self, object_name):
         response = self.client.get_object(self.bucket, object_name)
-        return json.load(response)
+        try:
+            return json.load(response)
+        finally:
+            response.close()
+            response.release_conn()
+
+    def mark_failed(self, video_id, error):
+        """Records that the pipeline gave up on this video, so re-uploading it runs the pipeline again"""
+        json_bytes = json.dumps({"video_id": video_id, "service": settings.SERVICE_NAME, "error": str(error)}).encode('utf-8')
+        self.client.put_object(
+            self.bucket, # Next to the video, where the upload service looks
+            f"{video_id}-failed.json",
+            io.BytesIO(json_bytes),
+            length=len(json_bytes),
+            content_type="application/json"
+        )
 
     def upload_json(self, data, object_name):
         # Convert dict to bytes
@@ -1,23 +1,313 @@
-from pymongo import MongoClient
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING, DESCENDING, DeleteOne, MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 from config import settings
 
+logger = logging.getLogger("analyzer_service")
+
+class BulkWriter:
+    """
+    Group commit for writes from concurrent worker threads: the first caller
+    waits up to MONGO_BULK_WAIT_MS for others (or until MONGO_BULK_MAX_OPS are
+    queued), then sends them all in one unordered bulk_write. Every caller
+    blocks until its own write is done and gets its own error, so a job is
+    only acked once its document is stored.
+    """
+    def __init__(self, collection):
+        self.collection = collection
+        self._cond = threading.Condition()
+        self._pending = []
+
+    def write(self, operation):
+        entry = {"operation": operation, "done": threading.Event(), "error": None}
+        with self._cond:
+            self._pending.append(entry)
+            leader = len(self._pending) == 1
+            if len(self._pending) >= settings.MONGO_BULK_MAX_OPS:
+                self._cond.notify()
+
+        if leader:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: len(self._pending) >= settings.MONGO_BULK_MAX_OPS,
+                    timeout=settings.MONGO_BULK_WAIT_MS / 1000
+                )
+                batch, self._pending = self._pending, []
+            self._flush(batch)
+
+        entry["done"].wait()
+        if entry["error"]:
+            raise entry["error"]
+
+    def _flush(self, batch):
+        try:
+            self.collection.bulk_write([entry["operation"] for entry in batch], ordered=False)
+        except BulkWriteError as e:
+            # Unordered: everything else was written; fail only the operations that weren't
+            for error in e.details.get("writeErrors", []):
+                batch[error["index"]]["error"] = RuntimeError(f"MongoDB write failed: {error.get('errmsg')}")
+        except Exception as e:
+            for entry in batch:
+                entry["error"] = e
+        finally:
+            if len(batch) > 1:
+                logger.info(f"Wrote {len(batch)} analyses in one bulk write")
+            for entry in batch:
+                entry["done"].set()
+
 class MongoClientWrapper:
     def __init__(self):
        
         self.client = MongoClient(settings.MONGO_URI, serverSelectionTimeoutMS=5000)
         self.db = self.client["therapy_db"]
         self.collection = self.db["session_analysis"]
+        self.progress = self.db["analysis_progress"] # Partial results while an analysis streams in
+        self.batch_jobs = self.db["batch_jobs"] # Jobs waiting for (or in) an OpenAI batch
+        self.writer = BulkWriter(self.collection)
+
+    def ensure_indexes(self):
+        """
+        Creates the indexes the analyzer and the query service rely on (at startup;
+        a no-op when they exist). The unique video_id index needs duplicates left by
+        the old insert-only saves removed first: the newest document per video wins.
+        """
+        if "video_id_1" not in self.collection.index_information():
+            self._remove_duplicate_analyses()
+            self._backfill_created_at()
+        self.collection.create_index([("video_id", ASCENDING)], unique=True)
+        self.collection.create_index([("user_id", ASCENDING), ("created_at", DESCENDING)])
+        self.progress.create_index([("video_id", ASCENDING), ("chunk", ASCENDING)], unique=True)
+        self.batch_jobs.create_index([("video_id", ASCENDING)], unique=True)
+        self.batch_jobs.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+        self.batch_jobs.create_index([("batch_id", ASCENDING)])
+
+    def _remove_duplicate_analyses(self):
+        duplicates = self.collection.aggregate([
+            {"$sort": {"_id": -1}},
+            {"$group": {"_id": "$video_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}}
+        ], allowDiskUse=True)
+        removals = [DeleteOne({"_id": old}) for group in duplicates for old in group["ids"][1:]]
+        if removals:
+            self.collection.bulk_write(removals, ordered=False)
+            logger.info(f"Removed {len(removals)} duplicate analysis documents")
+
+    def _backfill_created_at(self):
+        # ObjectIds carry their creation time
+        updates = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"created_at": doc["_id"].generation_time, "updated_at": doc["_id"].generation_time}})
+            for doc in self.collection.find({"created_at": {"$exists": False}}, {"_id": 1})
+        ]
+        if updates:
+            self.collection.bulk_write(updates, ordered=False)
+            logger.info(f"Added timestamps to {len(updates)} analysis documents")
 
     def save_analysis(self, user_id, video_id, analysis_data):
-        """Saves the analysis with metadata for querying later"""
-        document = {
-            "user_id": user_id,
-            "video_id": video_id,
-            "analysis": analysis_data,
-            
+        """
+        Saves the analysis with metadata for querying later. Idempotent: a redelivered
+        or reprocessed video replaces its document (created_at is kept). Concurrent
+        saves from the worker threads are grouped into one bulk write.
+        """
+        now = datetime.now(timezone.utc)
+        self.writer.write(UpdateOne(
+            {"video_id": video_id},
+            {
+                "$set": {"user_id": user_id, "analysis": analysis_data, "updated_at": now},
+                "$setOnInsert": {"created_at": now}
+            },
+            upsert=True
+        ))
+        logger.info(f"Saved analysis for {video_id} to MongoDB")
+
+    def start_progress_chunk(self, user_id, video_id, chunk):
+        """(Re)starts a chunk's partial results; a retried chunk replaces its earlier items"""
+        self.progress.update_one(
+            {"video_id": video_id, "chunk": chunk},
+            {"$set": {"user_id": user_id, "items": [], "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    def add_progress_items(self, video_id, chunk, items):
+        self.progress.update_one(
+            {"video_id": video_id, "chunk": chunk},
+            {"$push": {"items": {"$each": items}}, "$set": {"updated_at": datetime.now(timezone.utc)}}
+        )
+
+    def clear_progress(self, video_id):
+        self.progress.delete_many({"video_id": video_id})
+
+    # --- Batch jobs: pending -> claimed -> submitted -> saving -> (deleted | failed | pending again) ---
+
+    def add_batch_job(self, user_id, video_id, transcript_filename):
+        """Queues a job for the next batch; a redelivered or reprocessed job is queued again"""
+        now = datetime.now(timezone.utc)
+        self.batch_jobs.update_one(
+            {"video_id": video_id},
+            {
+                "$set": {
+                    "user_id": user_id,
+                    "transcript_filename": transcript_filename,
+                    "status": "pending",
+                    "batch_id": None,
+                    "attempts": 0,
+                    "created_at": now
+                },
+                "$unset": {"owner": "", "error": "", "submission": "", "submission_at": ""}
+            },
+            upsert=True
+        )
+
+    def pending_batch_jobs(self):
+        """(number of pending jobs, created_at of the oldest)"""
+        count = self.batch_jobs.count_documents({"status": "pending"})
+        oldest = self.batch_jobs.find_one({"status": "pending"}, sort=[("created_at", 1)])
+        return count, oldest["created_at"] if oldest else None
+
+    def claim_batch_jobs(self, owner, limit):
+        """Atomically takes up to limit pending jobs (oldest first) for one worker to submit"""
+        # Jobs claimed by a worker that died before submitting them are pending again
+        # (unless it got as far as batches.create: see stale_submissions)
+        stale = datetime.now(timezone.utc) - timedelta(seconds=settings.BATCH_CLAIM_TIMEOUT_SECONDS)
+        self.batch_jobs.update_many(
+            {"status": "claimed", "claimed_at": {"$lt": stale}, "submission": {"$exists": False}},
+            {"$set": {"status": "pending"}, "$unset": {"owner": ""}}
+        )
+
+        jobs = []
+        while len(jobs) < limit:
+            job = self.batch_jobs.find_one_and_update(
+                {"status": "pending"},
+                {"$set": {"status": "claimed", "owner": owner, "claimed_at": datetime.now(timezone.utc)}},
+                sort=[("created_at", 1)],
+                return_document=ReturnDocument.AFTER
+            )
+            if job is None:
+                break
+            jobs.append(job)
+        return jobs
+
+    def mark_batch_submitting(self, owner, video_ids, submission):
+        """
+        Records the submission id sent in the batch metadata before batches.create,
+        so a batch created by a worker that died before mark_batch_submitted can be
+        found again (see BatchAnalyzer.reconcile)
+        """
+        self.batch_jobs.update_many(
+            {"owner": owner, "video_id": {"$in": video_ids}, "status": "claimed"},
+            {"$set": {"submission": submission, "submission_at": datetime.now(timezone.utc)}}
+        )
+
+    def mark_batch_submitted(self, submission, batch_id):
+        self.batch_jobs.update_many(
+            {"submission": submission, "status": "claimed"},
+            {"$set": {"status": "submitted", "batch_id": batch_id}, "$unset": {"submission": "", "submission_at": ""}}
+        )
+
+    def release_batch_jobs(self, owner):
+        """Returns a worker's claimed jobs that never reached batches.create to pending"""
+        self.batch_jobs.update_many(
+            {"owner": owner, "status": "claimed", "submission": {"$exists": False}},
+            {"$set": {"status": "pending"}, "$unset": {"owner": ""}}
+        )
+
+    def release_submission(self, submission):
+        """Returns the jobs of a submission that never became a batch to pending"""
+        self.batch_jobs.update_many(
+            {"submission": submission, "status": "claimed"},
+            {"$set": {"status": "pending"}, "$unset": {"owner": "", "submission": "", "submission_at": ""}}
+        )
+
+    def stale_submissions(self):
+        """{submission id: when it was marked} for submissions older than BATCH_CLAIM_TIMEOUT_SECONDS still not recorded as a batch"""
+        stale = datetime.now(timezone.utc) - timedelta(seconds=settings.BATCH_CLAIM_TIMEOUT_SECONDS)
+        return {
+            group["_id"]: group["marked_at"]
+            for group in self.batch_jobs.aggregate([
+                {"$match": {"status": "claimed", "submission_at": {"$lt": stale}}},
+                {"$group": {"_id": "$submission", "marked_at": {"$min": "$submission_at"}}}
+            ])
         }
-        self.collection.insert_one(document)
-        print(f"Saved analysis for {video_id} to MongoDB")
+
+    def submitted_batch_ids(self):
+        return self.batch_jobs.distinct("batch_id", {"status": "submitted"})
+
+    def batch_job_ids(self, batch_id):
+        return [job["video_id"] for job in self.batch_jobs.find({"batch_id": batch_id, "status": "submitted"}, {"video_id": 1})]
+
+    def claim_batch_result(self, video_id, batch_id):
+        """Takes one finished job for saving; None if another worker already has it"""
+        return self.batch_jobs.find_one_and_update(
+            {"video_id": video_id, "batch_id": batch_id, "status": "submitted"},
+            {"$set": {"status": "saving", "saving_at": datetime.now(timezone.utc)}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def mark_batch_saving(self, owner, video_id):
+        """Moves a claimed job that needs no batch (everything cached) straight to saving"""
+        return self.batch_jobs.find_one_and_update(
+            {"video_id": video_id, "owner": owner, "status": "claimed"},
+            {"$set": {"status": "saving", "saving_at": datetime.now(timezone.utc)}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def retry_batch_result(self, video_id):
+        """Saving gave up for now: back to its batch's results, or to pending if it had no batch"""
+        self.batch_jobs.update_one(
+            {"video_id": video_id, "status": "saving", "batch_id": {"$ne": None}},
+            {"$set": {"status": "submitted"}, "$unset": {"saving_at": ""}}
+        )
+        self.batch_jobs.update_one(
+            {"video_id": video_id, "status": "saving", "batch_id": None},
+            {"$set": {"status": "pending"}, "$unset": {"owner": "", "saving_at": ""}}
+        )
+
+    def reclaim_stale_saves(self):
+        """Jobs whose saving worker died are retried (after BATCH_SAVE_TIMEOUT_SECONDS)"""
+        stale = datetime.now(timezone.utc) - timedelta(seconds=settings.BATCH_SAVE_TIMEOUT_SECONDS)
+        self.batch_jobs.update_many(
+            {"status": "saving", "saving_at": {"$lt": stale}, "batch_id": {"$ne": None}},
+            {"$set": {"status": "submitted"}, "$unset": {"saving_at": ""}}
+        )
+        self.batch_jobs.update_many(
+            {"status": "saving", "saving_at": {"$lt": stale}, "batch_id": None},
+            {"$set": {"status": "pending"}, "$unset": {"owner": "", "saving_at": ""}}
+        )
+
+    def requeue_batch_job(self, video_id, error):
+        """Sends a job back to pending for the next batch, counting the attempt"""
+        self.batch_jobs.update_one(
+            {"video_id": video_id},
+            {
+                "$set": {"status": "pending", "batch_id": None, "error": error},
+                "$inc": {"attempts": 1},
+                "$unset": {"owner": "", "submission": "", "submission_at": "", "saving_at": ""}
+            }
+        )
+
+    def fail_batch_job(self, video_id, error):
+        self.batch_jobs.update_one({"video_id": video_id}, {"$set": {"status": "failed", "error": error}})
+
+    def remove_batch_job(self, video_id, batch_id):
+        self.batch_jobs.delete_one({"video_id": video_id, "batch_id": batch_id})
 
     def close(self):
-        self.client.close()
\ No newline at end of file
+        self.client.close()
+
+
+class AnalysisProgress:
+    """Streams one job's analysis items into MongoDB as the model produces them"""
+    def __init__(self, mongo, user_id, video_id):
+        self.mongo = mongo
+        self.user_id = user_id
+        self.video_id = video_id
+
+    def start(self, chunk):
+        self.mongo.start_progress_chunk(self.user_id, self.video_id, chunk)
+
+    def add(self, chunk, items):
+        self.mongo.add_progress_items(self.video_id, chunk, items)
+
+    def clear(self):
+        self.mongo.clear_progress(self.video_id)
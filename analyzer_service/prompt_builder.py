@@ -0,0 +1,145 @@
+import json
+import logging
+import tiktoken
+from config import settings
+
+logger = logging.getLogger("analyzer_service")
+
+_encoding = None
+
+class ApproximateEncoding:
+    """Used when the tokenizer files can't be loaded: ~4 characters per token"""
+    def encode(self, text, **kwargs):
+        return range((len(text) + 3) // 4)
+
+def get_encoding():
+    """Tokenizer for LLM_MODEL (models tiktoken doesn't know yet use o200k_base)"""
+    global _encoding
+    if _encoding is None:
+        try:
+            try:
+                _encoding = tiktoken.encoding_for_model(settings.LLM_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning(f"Tokenizer unavailable ({e}); estimating token counts")
+            _encoding = ApproximateEncoding()
+    return _encoding
+
+def count_tokens(text):
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+def merge_turns(turns):
+    """Joins consecutive turns by the same speaker into one"""
+    merged = []
+    for turn in turns:
+        if merged and merged[-1]["speaker"] == turn["speaker"]:
+            merged[-1]["end"] = turn["end"]
+            merged[-1]["text"] += " " + turn["text"]
+        else:
+            merged.append(dict(turn))
+    return merged
+
+def format_turn(turn):
+    return f"{turn['speaker']}: {turn['text']}"
+
+def split_turns(turns, budget, overlap):
+    """
+    Groups turns into consecutive chunks of at most `budget` tokens (a single
+    longer turn gets a chunk of its own). Each chunk also carries the `overlap`
+    turns before it as read-only context.
+    Returns [(context_turns, turns)].
+    """
+    chunks, current, tokens = [], [], 0
+    for turn in turns:
+        turn_tokens = turn["tokens"]
+        if current and tokens + turn_tokens > budget:
+            chunks.append(current)
+            current, tokens = [], 0
+        current.append(turn)
+        tokens += turn_tokens
+    if current:
+        chunks.append(current)
+
+    result, consumed = [], 0
+    for chunk in chunks:
+        result.append((turns[max(consumed - overlap, 0):consumed], chunk))
+        consumed += len(chunk)
+    return result
+
+def render_chunk(context, turns):
+    lines = []
+    if context:
+        lines.append("[CONTEXT - end of the previous part, do not analyze]")
+        lines.extend(format_turn(turn) for turn in context)
+        lines.append("[ANALYZE]")
+    lines.extend(format_turn(turn) for turn in turns)
+    return "\n".join(lines)
+
+def _normalized(text):
+    return " ".join(text.split()).lower()
+
+def remaining_turns(turns, items):
+    """
+    The turns not yet covered by analysis items (in order), for asking the model
+    to continue a cut-off answer. Matches the last item's text against the turns,
+    falling back to one item per turn.
+
+    Items come one per turn, so the last one is looked for from turn
+    len(items) - 1 onwards, then (if the model split turns) back from there: a
+    short answer like "Yeah." must not match a repeat of it much later, which
+    would drop the turns in between.
+    """
+    if not items:
+        return turns
+    last = _normalized(items[-1].get("text", ""))
+    if last:
+        start = min(len(items), len(turns)) - 1
+        for i in [*range(start, len(turns)), *range(start - 1, -1, -1)]:
+            text = _normalized(turns[i]["text"])
+            if text == last or last in text or text.startswith(last[:40]) or last.startswith(text[:40]):
+                return turns[i + 1:]
+    return turns[min(len(items), len(turns)):]
+
+def build_transcript_prompt(turns, budget=None, overlap=None):
+    """
+    Renders speaker turns as one "SPEAKER: text" line each, split into chunks
+    of at most `budget` tokens (PROMPT_TOKEN_BUDGET) so each can be analyzed
+    on its own. Chunks after the first repeat the last `overlap` turns
+    (CHUNK_OVERLAP_TURNS) of the previous chunk as marked context.
+
+    Returns {"chunks": [{"text", "tokens", "turns", "context"}], "tokens",
+    "turns", "tokens_saved"}, where tokens_saved compares against sending
+    the turns as JSON.
+    """
+    budget = budget or settings.PROMPT_TOKEN_BUDGET
+    overlap = settings.CHUNK_OVERLAP_TURNS if overlap is None else overlap
+
+    merged = merge_turns(turns)
+    for turn in merged:
+        turn["tokens"] = count_tokens(format_turn(turn)) + 1 # newline
+
+    chunks = []
+    for context, chunk_turns in split_turns(merged, budget, overlap):
+        text = render_chunk(context, chunk_turns)
+        chunks.append({
+            "text": text,
+            "tokens": count_tokens(text),
+            "turns": [{key: turn[key] for key in ("speaker", "start", "end", "text")} for turn in chunk_turns],
+            "context": [{key: turn[key] for key in ("speaker", "start", "end", "text")} for turn in context]
+        })
+
+    prompt_tokens = sum(chunk["tokens"] for chunk in chunks)
+    return {
+        "chunks": chunks,
+        "tokens": prompt_tokens,
+        "turns": len(merged),
+        "tokens_saved": count_tokens(json.dumps(turns)) - prompt_tokens
+    }
+
+def log_prompt_metrics(video_id, prompt):
+    """key=value line, picked up as attributes by the log pipeline"""
+    logger.info(
+        f"prompt_metrics video_id={video_id} prompt_tokens={prompt['tokens']} "
+        f"tokens_saved={prompt['tokens_saved']} turns={prompt['turns']} chunks={len(prompt['chunks'])}"
+    )
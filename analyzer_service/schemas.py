@@ -0,0 +1,101 @@
+"""
+JSON schemas for the analyzer's structured outputs, and a fast validator.
+
+Strict structured output can't describe free-form objects, so "participants" is
+requested as [{"speaker", "role"}] and converted back to the documented
+{"Speaker A": "Role"} shape by validate().
+"""
+
+class InvalidOutput(Exception):
+    pass
+
+def _object(properties):
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False
+    }
+
+STRING = {"type": "string"}
+
+ITEM_FIELDS = ["speaker", "text", "topic", "emotion", "subtext"]
+ANALYSIS_ITEM = _object({field: STRING for field in ITEM_FIELDS})
+
+PARTICIPANTS = {
+    "type": "array",
+    "items": _object({"speaker": STRING, "role": STRING})
+}
+
+SCHEMAS = {
+    # Whole session in one call
+    "session": _object({
+        "participants": PARTICIPANTS,
+        "analysis": {"type": "array", "items": ANALYSIS_ITEM},
+        "clinical_recommendations": STRING
+    }),
+    # One part of a long session (map step)
+    "chunk": _object({
+        "participants": PARTICIPANTS,
+        "analysis": {"type": "array", "items": ANALYSIS_ITEM},
+        "summary": STRING
+    }),
+    # Recommendations from the part summaries (reduce step)
+    "reduce": _object({
+        "clinical_recommendations": STRING
+    }),
+}
+
+def text_format(kind):
+    """The Responses API `text.format` for an output kind"""
+    return {"type": "json_schema", "name": f"{kind}_analysis", "schema": SCHEMAS[kind], "strict": True}
+
+def missing_fields(kind, result):
+    """Top-level fields (other than the analysis array) the result doesn't have yet"""
+    return [field for field in SCHEMAS[kind]["required"] if field != "analysis" and field not in result]
+
+def _participants(value):
+    if isinstance(value, dict):
+        return {str(speaker): str(role) for speaker, role in value.items()}
+    participants = {}
+    for entry in value or []:
+        if isinstance(entry, dict) and entry.get("speaker"):
+            speaker = str(entry["speaker"])
+            if not speaker.startswith("Speaker"):
+                speaker = f"Speaker {speaker}"
+            participants[speaker] = str(entry.get("role", ""))
+    return participants
+
+def validate(kind, result, partial=False):
+    """
+    Checks a parsed result against its schema and returns it in the documented shape.
+    Analysis items missing speaker/text are dropped; other missing item fields become "".
+    Raises InvalidOutput if a required top-level field is missing or of the wrong type,
+    unless partial (what was salvaged from a cut-off output), where gaps become empty values.
+    """
+    missing = missing_fields(kind, result)
+    if missing and not partial:
+        raise InvalidOutput(f"Missing fields: {', '.join(missing)}")
+
+    validated = {}
+    for field, spec in SCHEMAS[kind]["properties"].items():
+        value = result.get(field)
+        if partial and value is None:
+            value = [] if spec.get("type") == "array" else ""
+        if field == "participants":
+            validated[field] = _participants(value)
+        elif field == "analysis":
+            if not isinstance(value, list):
+                raise InvalidOutput("analysis is not an array")
+            validated[field] = [
+                {name: str(item.get(name) or "") for name in ITEM_FIELDS}
+                for item in value
+                if isinstance(item, dict) and item.get("speaker") and item.get("text")
+            ]
+        elif spec == STRING:
+            if not isinstance(value, str):
+                raise InvalidOutput(f"{field} is not a string")
+            validated[field] = value
+    if result.get("truncated"):
+        validated["truncated"] = True
+    return validated
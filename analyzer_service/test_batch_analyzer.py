@@ -0,0 +1,165 @@
+"""
+BatchAnalyzer save paths against the real batch job methods of mongo_utils,
+over an in-memory stand-in for the batch_jobs collection. Run from this
+directory: python -m pytest
+"""
+import copy
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # common/
+for name, value in {"OPENAI_API_KEY": "test", "RABBITMQ_USER": "test", "RABBITMQ_PASS": "test",
+                    "MINIO_ROOT_USER": "test", "MINIO_ROOT_PASSWORD": "test"}.items():
+    os.environ.setdefault(name, value)
+
+from batch_analyzer import BatchAnalyzer
+from common.rate_limiter import RateLimitTimeout
+from config import settings
+from mongo_utils import MongoClientWrapper
+
+class FakeCollection:
+    """The subset of pymongo the batch job methods use"""
+    def __init__(self):
+        self.docs = []
+
+    @staticmethod
+    def _matches(doc, query):
+        for field, condition in query.items():
+            value = doc.get(field)
+            if isinstance(condition, dict):
+                for op, operand in condition.items():
+                    if op == "$lt" and not (value is not None and value < operand):
+                        return False
+                    if op == "$ne" and value == operand:
+                        return False
+                    if op == "$in" and value not in operand:
+                        return False
+                    if op == "$exists" and (field in doc) != operand:
+                        return False
+            elif value != condition:
+                return False
+        return True
+
+    @staticmethod
+    def _apply(doc, update):
+        doc.update(update.get("$set", {}))
+        for field in update.get("$unset", {}):
+            doc.pop(field, None)
+        for field, amount in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + amount
+
+    def find(self, query, projection=None):
+        return [copy.deepcopy(doc) for doc in self.docs if self._matches(doc, query)]
+
+    def find_one(self, query, sort=None):
+        found = self.find(query)
+        if sort:
+            found.sort(key=lambda doc: doc[sort[0][0]], reverse=sort[0][1] < 0)
+        return found[0] if found else None
+
+    def count_documents(self, query):
+        return len(self.find(query))
+
+    def distinct(self, field, query):
+        return list(dict.fromkeys(doc.get(field) for doc in self.find(query)))
+
+    def update_one(self, query, update, upsert=False):
+        for doc in self.docs:
+            if self._matches(doc, query):
+                self._apply(doc, update)
+                return
+        if upsert:
+            doc = dict(query)
+            self._apply(doc, update)
+            self.docs.append(doc)
+
+    def update_many(self, query, update):
+        for doc in self.docs:
+            if self._matches(doc, query):
+                self._apply(doc, update)
+
+    def find_one_and_update(self, query, update, sort=None, return_document=None):
+        candidates = [doc for doc in self.docs if self._matches(doc, query)]
+        if sort:
+            candidates.sort(key=lambda doc: doc[sort[0][0]], reverse=sort[0][1] < 0)
+        if not candidates:
+            return None
+        self._apply(candidates[0], update)
+        return copy.deepcopy(candidates[0])
+
+    def delete_one(self, query):
+        for doc in self.docs:
+            if self._matches(doc, query):
+                self.docs.remove(doc)
+                return
+
+    def aggregate(self, pipeline):
+        return [] # stale_submissions: no submission markers in these tests
+
+class FakeLLM:
+    def __init__(self):
+        self.client = None # batches.* is never reached in these tests
+        self.cached = False
+        self.rate_limited = False
+
+    def batch_requests(self, chunks):
+        return [] if self.cached else [(0, {})]
+
+    def finish_batch(self, chunks, outputs):
+        if self.rate_limited:
+            raise RateLimitTimeout("no capacity")
+        return {"analysis": [], "outputs": outputs}
+
+@pytest.fixture
+def batch():
+    mongo = MongoClientWrapper()
+    mongo.batch_jobs = FakeCollection()
+    saved = []
+    analyzer = BatchAnalyzer(FakeLLM(), mongo, lambda job: ["chunk"], lambda job, result: saved.append(job["video_id"]), lambda job, error: None)
+    analyzer.saved = saved
+    return analyzer
+
+def job(batch, video_id):
+    return batch.mongo.batch_jobs.find_one({"video_id": video_id})
+
+def test_all_cached_job_rate_limited_goes_back_to_pending(batch):
+    batch.llm.cached = batch.llm.rate_limited = True
+    batch.mongo.add_batch_job("u1", "v1", "v1.json")
+
+    assert batch.submit_pending() is None
+    assert job(batch, "v1")["status"] == "pending"
+    assert "owner" not in job(batch, "v1")
+
+    batch.llm.rate_limited = False
+    batch.submit_pending()
+    assert batch.saved == ["v1"]
+    assert job(batch, "v1") is None
+
+def test_stale_saving_job_is_picked_up_again(batch):
+    batch.mongo.add_batch_job("u1", "v1", "v1.json")
+    batch.mongo.batch_jobs.update_one({"video_id": "v1"}, {"$set": {"status": "submitted", "batch_id": "batch_1"}})
+    # The worker saving it died
+    assert batch.mongo.claim_batch_result("v1", "batch_1")["status"] == "saving"
+    batch.mongo.reclaim_stale_saves()
+    assert job(batch, "v1")["status"] == "saving" # still within BATCH_SAVE_TIMEOUT_SECONDS
+
+    batch.mongo.batch_jobs.update_one({"video_id": "v1"}, {"$set": {
+        "saving_at": datetime.now(timezone.utc) - timedelta(seconds=settings.BATCH_SAVE_TIMEOUT_SECONDS + 1)
+    }})
+    batch.mongo.reclaim_stale_saves()
+    assert job(batch, "v1")["status"] == "submitted"
+    assert batch.mongo.batch_job_ids("batch_1") == ["v1"]
+
+def test_stale_saving_job_without_batch_is_pending_again(batch):
+    batch.llm.cached = True
+    batch.mongo.add_batch_job("u1", "v1", "v1.json")
+    jobs = batch.mongo.claim_batch_jobs(batch.owner, 10)
+    assert batch.mongo.mark_batch_saving(batch.owner, jobs[0]["video_id"])["status"] == "saving"
+
+    batch.mongo.batch_jobs.update_one({"video_id": "v1"}, {"$set": {
+        "saving_at": datetime.now(timezone.utc) - timedelta(seconds=settings.BATCH_SAVE_TIMEOUT_SECONDS + 1)
+    }})
+    batch.mongo.reclaim_stale_saves()
+    assert job(batch, "v1")["status"] == "pending"
@@ -0,0 +1,181 @@
+"""
+AnalysisCache single-flight against an in-memory Redis stand-in, with one
+AnalysisCache per thread playing separate workers. Run from this directory:
+python -m pytest
+"""
+import os
+import queue
+import sys
+import threading
+import time
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # common/
+for name, value in {"OPENAI_API_KEY": "test", "RABBITMQ_USER": "test", "RABBITMQ_PASS": "test",
+                    "MINIO_ROOT_USER": "test", "MINIO_ROOT_PASSWORD": "test"}.items():
+    os.environ.setdefault(name, value)
+
+import cache_utils
+from cache_utils import AnalysisCache
+
+WORKERS = 8
+
+class FakeRedis:
+    """The commands AnalysisCache uses, thread-safe; leases never expire"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}
+        self.hashes = {}
+        self.channels = {} # channel -> subscriber queues
+
+    def get(self, key):
+        with self.lock:
+            return self.data.get(key)
+
+    def set(self, key, value, nx=False, px=None, ex=None):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value
+            return True
+
+    def hincrby(self, key, field, amount):
+        with self.lock:
+            fields = self.hashes.setdefault(key, {})
+            fields[field.encode()] = fields.get(field.encode(), 0) + amount
+            return fields[field.encode()]
+
+    def hgetall(self, key):
+        with self.lock:
+            return dict(self.hashes.get(key, {}))
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def register_script(self, script):
+        def renew(keys, args):
+            with self.lock:
+                return int(self.data.get(keys[0]) == args[0])
+        def release(keys, args):
+            with self.lock:
+                if self.data.get(keys[0]) == args[0]:
+                    del self.data[keys[0]]
+                    return 1
+                return 0
+        return renew if script == AnalysisCache.RENEW_SCRIPT else release
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+    def publish(self, channel, message):
+        with self.lock:
+            subscribers = list(self.channels.get(channel, ()))
+        for messages in subscribers:
+            messages.put({"type": "message", "channel": channel, "data": message})
+        return len(subscribers)
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+class FakePubSub:
+    def __init__(self, redis):
+        self.redis = redis
+        self.messages = queue.Queue()
+        self.subscribed = []
+
+    def subscribe(self, channel):
+        with self.redis.lock:
+            self.redis.channels.setdefault(channel, []).append(self.messages)
+        self.subscribed.append(channel)
+
+    def get_message(self, timeout=0.0):
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        with self.redis.lock:
+            for channel in self.subscribed:
+                self.redis.channels[channel].remove(self.messages)
+        self.subscribed = []
+
+@pytest.fixture
+def servers(monkeypatch):
+    """One fake per Redis host: the LLM cache and the coordination instance"""
+    by_host = {}
+    monkeypatch.setattr(cache_utils.redis, "Redis", lambda host, **kwargs: by_host.setdefault(host, FakeRedis()))
+    monkeypatch.setattr(cache_utils.settings, "SINGLE_FLIGHT_POLL_SECONDS", 0.05)
+    return by_host
+
+def run_workers(compute, count=WORKERS):
+    """get_or_compute on the same key from `count` threads; returns {index: result or exception}"""
+    results = {}
+    start = threading.Barrier(count)
+
+    def worker(index):
+        cache = AnalysisCache()
+        start.wait()
+        try:
+            results[index] = cache.get_or_compute("analysis:test", compute)
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=worker, args=(index,), daemon=True) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert not any(thread.is_alive() for thread in threads), "a worker is still waiting"
+    return results
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_concurrent_misses_compute_once(servers):
+    calls = []
+
+    def compute():
+        calls.append(threading.current_thread().name)
+        time.sleep(0.2) # long enough for every other worker to miss and wait
+        return {"analysis": [{"speaker": "A", "text": "hi"}], "run": len(calls)}
+
+    results = run_workers(compute)
+
+    assert len(calls) == 1
+    assert len(results) == WORKERS
+    assert all(result == {"analysis": [{"speaker": "A", "text": "hi"}], "run": 1} for result in results.values())
+    stats = AnalysisCache().stats()
+    assert stats["writes"] == 1
+    assert stats["single_flight_waits"] == WORKERS - 1
+    assert not [key for key in servers[cache_utils.settings.REDIS_HOST].data if key.endswith(":lease")]
+
+def test_waiter_takes_over_when_holder_fails(servers):
+    calls = []
+
+    def compute():
+        calls.append(threading.current_thread().name)
+        if len(calls) == 1:
+            # Fail only once everyone else is waiting on this lease
+            wait_for(lambda: AnalysisCache().stats().get("single_flight_waits") == WORKERS - 1)
+            raise RuntimeError("LLM call failed")
+        return {"summary": "recovered"}
+
+    results = run_workers(compute)
+
+    failures = [result for result in results.values() if isinstance(result, Exception)]
+    assert [str(e) for e in failures] == ["LLM call failed"]
+    assert len(calls) == 2 # one waiter took over; the rest read its result
+    assert sum(result == {"summary": "recovered"} for result in results.values()) == WORKERS - 1
+    assert not servers[cache_utils.settings.REDIS_HOST].channels["analysis:test:ready"]
@@ -0,0 +1,44 @@
+"""
+Continuation of cut-off answers (remaining_turns). Run from this directory:
+python -m pytest
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # common/
+for name, value in {"OPENAI_API_KEY": "test", "RABBITMQ_USER": "test", "RABBITMQ_PASS": "test",
+                    "MINIO_ROOT_USER": "test", "MINIO_ROOT_PASSWORD": "test"}.items():
+    os.environ.setdefault(name, value)
+
+from prompt_builder import remaining_turns
+
+def turns(*texts):
+    return [{"speaker": "A" if i % 2 == 0 else "B", "text": text} for i, text in enumerate(texts)]
+
+SESSION = turns(
+    "How are you?", "Yeah.",
+    "I wanted to talk about last week.", "Okay, go ahead.",
+    "My sister called me again.", "How did that feel?",
+    "Honestly? Yeah.", "Tell me more."
+)
+
+def test_repeated_short_answer_does_not_skip_turns():
+    items = [{"speaker": "A", "text": "How are you?"}, {"speaker": "B", "text": "Yeah."}]
+    assert remaining_turns(SESSION, items) == SESSION[2:]
+
+def test_last_item_matched_after_merged_turns():
+    # The model merged turns 2-3 into one item: the cut came after turn 4
+    items = [
+        {"speaker": "A", "text": "How are you?"},
+        {"speaker": "B", "text": "Yeah."},
+        {"speaker": "A", "text": "I wanted to talk about last week. Okay, go ahead."},
+        {"speaker": "A", "text": "My sister called me again."}
+    ]
+    assert remaining_turns(SESSION, items) == SESSION[5:]
+
+def test_unmatched_item_falls_back_to_one_item_per_turn():
+    items = [{"speaker": "A", "text": "Something else"}] * 3
+    assert remaining_turns(SESSION, items) == SESSION[3:]
+
+def test_nothing_analyzed_yet():
+    assert remaining_turns(SESSION, []) == SESSION
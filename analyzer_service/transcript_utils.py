@@ -0,0 +1,33 @@
+# Compact transcript versions this service can read (written by transcription_service)
+SUPPORTED_TRANSCRIPT_VERSIONS = {1}
+
+def compact_transcript(data):
+    """
+    Returns the transcript in the compact format:
+    {"version", "speakers", "turns": [{"speaker", "start", "end", "text"}], ...}.
+    Raw AssemblyAI responses stored before normalization existed are converted on the fly.
+    """
+    if "version" in data:
+        if data["version"] not in SUPPORTED_TRANSCRIPT_VERSIONS:
+            raise ValueError(f"Unsupported transcript version {data['version']}")
+        return data
+
+    turns = [
+        {
+            "speaker": utterance.get("speaker") or "A",
+            "start": round(utterance.get("start", 0) / 1000, 3),
+            "end": round(utterance.get("end", 0) / 1000, 3),
+            "text": utterance["text"].strip()
+        }
+        for utterance in data.get("utterances") or []
+        if utterance.get("text", "").strip()
+    ]
+    if not turns and data.get("text"):
+        turns = [{"speaker": "A", "start": 0, "end": data.get("audio_duration") or 0, "text": data["text"]}]
+    return {
+        "version": 1,
+        "transcript_id": data.get("id"),
+        "duration": data.get("audio_duration"),
+        "speakers": sorted({turn["speaker"] for turn in turns}),
+        "turns": turns
+    }
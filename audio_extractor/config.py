@@ -10,11 +10,32 @@ class Settings(BaseSettings):
     RABBITMQ_USER: str
     RABBITMQ_PASS: str
 
+    # Worker runtime
+    WORKER_CONCURRENCY: int = 2 # Jobs processed at once (extractions run in ffmpeg child processes)
+    WORKER_PREFETCH: int = 0 # Unacked deliveries per worker; 0 = WORKER_CONCURRENCY
+
     # MinIO
     MINIO_ENDPOINT: str = "minio:9000"
     MINIO_ROOT_USER: str
     MINIO_ROOT_PASSWORD: str
     MINIO_BUCKET_NAME: str = "therapy-videos"
+    MINIO_PART_SIZE: int = 8 * 1024 * 1024 # Multipart chunk size for streamed uploads (min 5 MiB)
+    PRESIGNED_URL_EXPIRY_SECONDS: int = 6 * 3600 # Must outlive the longest extraction
+
+    # Extraction
+    AUDIO_PROFILE: str = "source" # source | mp3 | speech_opus | speech_flac; upload events set it per pipeline (upload_service AUDIO_PROFILE_*)
+    SEGMENT_MIN_DURATION: float = 15 * 60 # Seconds; shorter recordings use a single ffmpeg pass
+    SEGMENT_WORKERS: int = os.cpu_count() or 1 # Parallel ffmpeg processes for long recordings
+    SEGMENT_WORK_DIR: str = "/tmp"
+
+    # Silence trimming (optional stage; messages may set "trim_silence")
+    VAD_ENABLED: bool = False
+    VAD_SAMPLE_RATE: int = 16000
+    VAD_FRAME_MS: int = 30
+    VAD_THRESHOLD_DB: float = 12.0 # Speech must be this far above the noise floor
+    VAD_MIN_SILENCE: float = 1.0 # Seconds; shorter pauses are left untouched
+    VAD_KEEP_SILENCE: float = 0.5 # Seconds of each longer silence that are kept
+    VAD_PADDING: float = 0.2 # Seconds of context kept around speech
 
     class Config:
         env_file = ".env"
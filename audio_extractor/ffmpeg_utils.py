@@ -0,0 +1,246 @@
+import json
+import logging
+import math
+import os
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("audio_extractor")
+
+# Source codecs we can demux as-is: codec -> (extension, ffmpeg muxer, content type)
+COPYABLE_CODECS = {
+    "aac": ("aac", "adts", "audio/aac"),
+    "mp3": ("mp3", "mp3", "audio/mpeg"),
+    "opus": ("ogg", "ogg", "audio/ogg"),
+    "vorbis": ("ogg", "ogg", "audio/ogg"),
+    "flac": ("flac", "flac", "audio/flac"),
+}
+
+# Output profiles: name -> (extension, ffmpeg muxer, content type, encoder args).
+# "source" keeps the original track when possible; the speech profiles are
+# mono 16 kHz, which is all speech recognition needs.
+AUDIO_PROFILES = {
+    "source": None,
+    "mp3": ("mp3", "mp3", "audio/mpeg", ["-c:a", "libmp3lame", "-q:a", "2"]),
+    "speech_opus": ("ogg", "ogg", "audio/ogg", ["-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", "24k", "-application", "voip", "-compression_level", "5"]),
+    "speech_flac": ("flac", "flac", "audio/flac", ["-ac", "1", "-ar", "16000", "-c:a", "flac", "-compression_level", "8"]),
+}
+
+# "source" falls back to this when the codec can't be copied
+TRANSCODE_TARGET = AUDIO_PROFILES["mp3"]
+
+class FFmpegError(Exception):
+    pass
+
+def probe(url):
+    """Returns codec, sample rate, channels and duration of the first audio stream"""
+    result = subprocess.run(
+        [
+            "ffprobe", "-v", "error",
+            "-select_streams", "a:0",
+            "-show_entries", "stream=codec_name,sample_rate,channels:format=duration",
+            "-of", "json",
+            url
+        ],
+        capture_output=True,
+        check=False
+    )
+    if result.returncode != 0:
+        raise FFmpegError(f"ffprobe failed: {result.stderr.decode(errors='replace').strip()}")
+
+    info = json.loads(result.stdout)
+    if not info.get("streams"):
+        raise FFmpegError("Video has no audio stream")
+
+    stream = info["streams"][0]
+    return {
+        "codec": stream.get("codec_name"),
+        "sample_rate": int(stream.get("sample_rate", 0)),
+        "channels": int(stream.get("channels", 0)),
+        "duration": float(info.get("format", {}).get("duration", 0) or 0),
+    }
+
+class AudioStream:
+    """
+    A running ffmpeg process writing the extracted audio to stdout.
+    Read from .stdout, then call .wait() to surface ffmpeg errors.
+    """
+    def __init__(self, args, extension, content_type, feed=None):
+        self.extension = extension
+        self.content_type = content_type
+        self._stderr = tempfile.TemporaryFile() # Avoids pipe deadlocks on chatty ffmpeg
+        self.process = subprocess.Popen(
+            ["ffmpeg", "-hide_banner", "-loglevel", "error"] + ([] if feed else ["-nostdin"]) + args,
+            stdin=subprocess.PIPE if feed else None,
+            stdout=subprocess.PIPE,
+            stderr=self._stderr
+        )
+        self.stdout = self.process.stdout
+
+        # feed(stdin) writes ffmpeg's input from a thread while the caller reads stdout
+        if feed:
+            self._feeder = threading.Thread(target=self._feed, args=(feed,), daemon=True)
+            self._feeder.start()
+
+    def _feed(self, feed):
+        try:
+            feed(self.process.stdin)
+        except BrokenPipeError:
+            pass # ffmpeg exited early; wait() reports why
+        finally:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def wait(self):
+        returncode = self.process.wait()
+        self._stderr.seek(0)
+        errors = self._stderr.read().decode(errors="replace").strip()
+        self._stderr.close()
+        if returncode != 0:
+            raise FFmpegError(f"ffmpeg exited with {returncode}: {errors}")
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        self._stderr.close()
+
+def output_format(codec, profile):
+    """
+    Returns (extension, muxer, content type, codec args) for a source codec and profile.
+    With the "source" profile the stream is copied when its codec fits an
+    audio-only container; otherwise (or for any other profile) it is transcoded.
+    """
+    if profile not in AUDIO_PROFILES:
+        raise ValueError(f"Unknown audio profile '{profile}'. Choose from: {', '.join(AUDIO_PROFILES)}")
+
+    if profile == "source" and codec in COPYABLE_CODECS:
+        extension, muxer, content_type = COPYABLE_CODECS[codec]
+        return extension, muxer, content_type, ["-c:a", "copy"]
+    return AUDIO_PROFILES[profile] or TRANSCODE_TARGET
+
+def is_copy(codec, profile):
+    return output_format(codec, profile)[3] == ["-c:a", "copy"]
+
+def extract_audio(url, codec, profile="source"):
+    """
+    Demuxes the audio track from the video at url (HTTP or local path),
+    copying or transcoding only the audio. The video is never decoded.
+    """
+    extension, muxer, content_type, codec_args = output_format(codec, profile)
+    action = "copying" if is_copy(codec, profile) else f"transcoding with profile '{profile}'"
+    logger.info(f"Source audio codec '{codec}': {action} to .{extension}")
+
+    input_args = ["-i", url, "-map", "0:a:0", "-vn", "-sn", "-dn"]
+    return AudioStream(input_args + codec_args + ["-f", muxer, "pipe:1"], extension, content_type)
+
+# --- Parallel segmented extraction ---
+# Long recordings are cut into time ranges that are decoded in parallel into
+# lossless FLAC pieces, then joined with the concat demuxer. FLAC frames carry
+# no encoder delay, so the join is sample-exact; lossy profiles are encoded
+# once over the joined stream, so they get no boundary artefacts either.
+
+def _arg(codec_args, flag, default):
+    return int(codec_args[codec_args.index(flag) + 1]) if flag in codec_args else default
+
+def plan_segments(duration, input_rate, output_rate, workers):
+    """
+    Splits the recording into (start_sample, sample_count) ranges in input samples.
+    Boundaries sit on a grid where input and output sample counts are both whole
+    numbers, so resampling each piece neither drops nor duplicates a sample.
+    The last range has sample_count None (read to the end).
+    """
+    step = input_rate // math.gcd(input_rate, output_rate)
+    total = int(duration * input_rate)
+    per_segment = max(step, math.ceil(total / workers / step) * step)
+    count = math.ceil(total / per_segment)
+    return [
+        (i * per_segment, per_segment if i < count - 1 else None)
+        for i in range(count)
+    ]
+
+def _extract_segment(url, start_sample, sample_count, input_rate, output_rate, channels, path):
+    trim = f"atrim=end_sample={sample_count}," if sample_count else ""
+    layout = "mono" if channels == 1 else "stereo"
+    # Input seek is sample-accurate for audio (decoded frames are trimmed to the timestamp).
+    # The first piece must not seek at all, or the codec's priming samples are handled differently.
+    seek = ["-ss", f"{start_sample / input_rate:.9f}"] if start_sample else []
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin", "-y"] + seek + [
+            "-i", url, "-map", "0:a:0", "-vn", "-sn", "-dn",
+            "-af", f"{trim}aresample={output_rate},aformat=sample_fmts=s16:channel_layouts={layout}",
+            "-c:a", "flac", "-compression_level", "0",
+            path
+        ],
+        capture_output=True,
+        check=False
+    )
+    if result.returncode != 0:
+        raise FFmpegError(f"Segment at sample {start_sample} failed: {result.stderr.decode(errors='replace').strip()}")
+    return path
+
+def extract_audio_segmented(url, source, profile, workers, work_dir):
+    """
+    Like extract_audio, but decodes time ranges on `workers` ffmpeg processes
+    at once. Pieces are written to work_dir, which the caller cleans up after
+    the returned stream has been consumed.
+    """
+    extension, muxer, content_type, codec_args = output_format(source["codec"], profile)
+    if is_copy(source["codec"], profile):
+        raise ValueError("Stream copies are already I/O bound; use extract_audio")
+
+    output_rate = _arg(codec_args, "-ar", source["sample_rate"])
+    channels = _arg(codec_args, "-ac", min(source["channels"], 2))
+    segments = plan_segments(source["duration"], source["sample_rate"], output_rate, workers)
+    logger.info(f"Extracting {source['duration']:.0f}s of audio as {len(segments)} parallel segments...")
+
+    paths = [os.path.join(work_dir, f"segment_{i:04d}.flac") for i in range(len(segments))]
+    # Each worker thread only supervises an ffmpeg process; the decoding runs in those processes
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(
+            lambda job: _extract_segment(url, job[0][0], job[0][1], source["sample_rate"], output_rate, channels, job[1]),
+            zip(segments, paths)
+        ))
+
+    concat_list = os.path.join(work_dir, "segments.txt")
+    with open(concat_list, "w") as f:
+        f.writelines(f"file '{path}'\n" for path in paths)
+
+    join_args = ["-c:a", "copy"] if extension == "flac" else codec_args
+    logger.info(f"Joining segments into .{extension}")
+    return AudioStream(
+        ["-f", "concat", "-safe", "0", "-i", concat_list] + join_args + ["-f", muxer, "pipe:1"],
+        extension,
+        content_type
+    )
+
+# --- Raw PCM (used by the silence trimming stage) ---
+
+def decode_pcm(url, path, sample_rate):
+    """Decodes the audio track to mono signed 16-bit PCM at path"""
+    result = subprocess.run(
+        [
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+            "-i", url, "-map", "0:a:0", "-vn", "-sn", "-dn",
+            "-ac", "1", "-ar", str(sample_rate), "-f", "s16le",
+            path
+        ],
+        capture_output=True,
+        check=False
+    )
+    if result.returncode != 0:
+        raise FFmpegError(f"PCM decode failed: {result.stderr.decode(errors='replace').strip()}")
+
+def encode_pcm(feed, sample_rate, profile):
+    """Encodes mono s16le PCM written by feed(stdin) with the given output profile"""
+    extension, muxer, content_type, codec_args = output_format("pcm_s16le", profile)
+    return AudioStream(
+        ["-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0"] + codec_args + ["-f", muxer, "pipe:1"],
+        extension,
+        content_type,
+        feed=feed
+    )
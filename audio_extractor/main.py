@@ -1,70 +1,105 @@
-import os
 import json
 import sys
+import tempfile
 import logging
-from moviepy import VideoFileClip
 from minio_utils import MinioClient
-from rabbitmq_utils import RabbitMQClient
+from common.rabbitmq import RabbitMQClient
+from ffmpeg_utils import probe, extract_audio, extract_audio_segmented, is_copy
+from vad_utils import trim_silence
+from config import settings
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("audio_extractor")
 
+# Long-lived clients, shared by all worker threads
+minio = None
+rabbitmq = None
+
+def upload_audio(minio, audio, video_id):
+    """Streams ffmpeg's output into MinIO; removes the partial object on failure"""
+    audio_filename = f"{video_id}.{audio.extension}"
+    try:
+        minio.upload_stream(audio.stdout, audio_filename, audio.content_type)
+        audio.wait()
+    except Exception:
+        audio.kill()
+        minio.remove(audio_filename)
+        raise
+    return audio_filename
+
+def record_failure(video_id, error):
+    """Best effort: the message is dropped either way"""
+    try:
+        minio.mark_failed(video_id, error)
+    except Exception as e:
+        logger.error(f"Could not mark {video_id} as failed: {e}")
+
 def process_video(ch, method, properties, body):
+    video_id = None
     try:
         # 1. Parse Message
         message = json.loads(body)
         logger.info(f"Received message: {message}")
-        
+
         video_id = message['video_id']
         video_filename = message['filename']
         # FIX: Capture user_id, default to 'anonymous' if missing (backward compatibility)
         user_id = message.get('user_id', 'anonymous')
-        
-        # Define local paths
-        local_video_path = f"/tmp/{video_filename}"
-        local_audio_path = f"/tmp/{video_id}.mp3"
-        
-        minio = MinioClient()
-        rabbitmq = RabbitMQClient()
+        # Pipelines can pick their own output profile per job
+        audio_profile = message.get('audio_profile', settings.AUDIO_PROFILE)
+        vad_enabled = message.get('trim_silence', settings.VAD_ENABLED)
 
-        # 2. Download Video
-        logger.info(f"Downloading {video_filename}...")
-        minio.download_file(video_filename, local_video_path)
+        # 2. Read the video in place (ffmpeg fetches byte ranges over HTTP, no local copy)
+        video_url = minio.presigned_url(video_filename)
+        source = probe(video_url)
 
-        # 3. Extract Audio
+        # 3. Extract Audio & stream it straight back to MinIO
         logger.info("Extracting audio...")
-        video = VideoFileClip(local_video_path)
-        video.audio.write_audiofile(local_audio_path, logger=None)
-        video.close() 
-
-        # 4. Upload Audio
-        logger.info("Uploading MP3...")
-        mp3_filename = f"{video_id}.mp3"
-        minio.upload_file(local_audio_path, mp3_filename, "audio/mpeg")
+        offsets_filename = None
+        segmented = (
+            source["duration"] >= settings.SEGMENT_MIN_DURATION
+            and settings.SEGMENT_WORKERS > 1
+            and not is_copy(source["codec"], audio_profile)
+        )
+        if vad_enabled:
+            # Cut long silences; the offset map lets transcript times be mapped back to the video
+            with tempfile.TemporaryDirectory(dir=settings.SEGMENT_WORK_DIR) as work_dir:
+                audio, offset_map = trim_silence(video_url, audio_profile, work_dir)
+                audio_filename = upload_audio(minio, audio, video_id)
+            offsets_filename = f"{video_id}-offsets.json"
+            minio.upload_json(offset_map, offsets_filename)
+        elif segmented:
+            with tempfile.TemporaryDirectory(dir=settings.SEGMENT_WORK_DIR) as work_dir:
+                audio = extract_audio_segmented(video_url, source, audio_profile, settings.SEGMENT_WORKERS, work_dir)
+                audio_filename = upload_audio(minio, audio, video_id)
+        else:
+            audio = extract_audio(video_url, source["codec"], audio_profile)
+            audio_filename = upload_audio(minio, audio, video_id)
 
-        # 5. Publish Next Event
+        # 4. Publish Next Event
         next_event = {
             "user_id": user_id, # FIX: Pass it forward
             "video_id": video_id,
-            "audio_filename": mp3_filename,
+            "audio_filename": audio_filename,
+            "urgency": message.get('urgency', 'interactive'), # Picks the analyzer's interactive or batch path
             "status": "audio_extracted"
         }
+        if offsets_filename:
+            next_event["offsets_filename"] = offsets_filename
         rabbitmq.publish_event(next_event)
         logger.info("Event published to audio_processing_queue")
 
-        # 6. Cleanup & Acknowledge
-        if os.path.exists(local_video_path):
-            os.remove(local_video_path)
-        if os.path.exists(local_audio_path):
-            os.remove(local_audio_path)
-            
+        # 5. Acknowledge
         ch.basic_ack(delivery_tag=method.delivery_tag)
 
     except Exception as e:
         logger.error(f"Failed to process video: {e}", exc_info=True)
+        if video_id:
+            record_failure(video_id, e)
         ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
 
 if __name__ == "__main__":
-    rabbitmq = RabbitMQClient()
-    rabbitmq.consume(process_video)
\ No newline at end of file
+    minio = MinioClient()
+    rabbitmq = RabbitMQClient(settings, consume_queue='video_processing_queue', publish_queue='audio_processing_queue', logger=logger)
+    rabbitmq.consume(process_video)
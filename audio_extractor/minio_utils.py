@@ -1,5 +1,8 @@
 from minio import Minio
 from config import settings
+from datetime import timedelta
+import io
+import json
 import os
 
 class MinioClient:
@@ -12,15 +15,39 @@ class MinioClient:
         )
         self.bucket = settings.MINIO_BUCKET_NAME
 
-    def download_file(self, object_name, file_path):
-        """Downloads file from MinIO to local path"""
-        self.client.fget_object(self.bucket, object_name, file_path)
+    def presigned_url(self, object_name):
+        """Time-limited GET URL so ffmpeg can read (and seek) the object over HTTP"""
+        return self.client.presigned_get_object(
+            self.bucket,
+            object_name,
+            expires=timedelta(seconds=settings.PRESIGNED_URL_EXPIRY_SECONDS)
+        )
 
-    def upload_file(self, file_path, object_name, content_type):
-        """Uploads local file to MinIO"""
-        self.client.fput_object(
+    def upload_stream(self, stream, object_name, content_type):
+        """Uploads a stream of unknown length as a multipart upload, one part in memory at a time"""
+        self.client.put_object(
             self.bucket,
             object_name,
-            file_path,
+            stream,
+            length=-1,
+            part_size=settings.MINIO_PART_SIZE,
+            num_parallel_uploads=1,
             content_type=content_type
-        )
\ No newline at end of file
+        )
+
+    def remove(self, object_name):
+        self.client.remove_object(self.bucket, object_name)
+
+    def upload_json(self, data, object_name):
+        json_bytes = json.dumps(data).encode('utf-8')
+        self.client.put_object(
+            self.bucket,
+            object_name,
+            io.BytesIO(json_bytes),
+            length=len(json_bytes),
+            content_type="application/json"
+        )
+
+    def mark_failed(self, video_id, error):
+        """Records that the pipeline gave up on this video, so re-uploading it runs the pipeline again"""
+        self.upload_json({"video_id": video_id, "service": settings.SERVICE_NAME, "error": str(error)}, f"{video_id}-failed.json")
@@ -0,0 +1,142 @@
+import logging
+import os
+import numpy as np
+from config import settings
+from ffmpeg_utils import decode_pcm, encode_pcm
+
+logger = logging.getLogger("audio_extractor")
+
+def _runs(mask):
+    """Start index, end index and value of each run of equal values in a boolean array"""
+    if len(mask) == 0:
+        empty = np.array([], dtype=np.intp)
+        return empty, empty, mask
+    change = np.flatnonzero(np.diff(mask.astype(np.int8))) + 1
+    starts = np.concatenate(([0], change))
+    ends = np.concatenate((change, [len(mask)]))
+    return starts, ends, mask[starts]
+
+def frame_energy_db(pcm, frame_length):
+    """RMS level (dBFS) of consecutive frames, computed block by block so memory stays flat"""
+    frame_count = len(pcm) // frame_length
+    energies = np.empty(frame_count, dtype=np.float32)
+    block = 10000 # frames per pass
+    for start in range(0, frame_count, block):
+        end = min(start + block, frame_count)
+        frames = np.asarray(pcm[start * frame_length:end * frame_length], dtype=np.float32)
+        frames = frames.reshape(end - start, frame_length) / 32768.0
+        energies[start:end] = np.sqrt(np.mean(np.square(frames), axis=1))
+    return 20 * np.log10(np.maximum(energies, 1e-10))
+
+def speech_mask(energy_db, frame_seconds):
+    """
+    Marks frames as speech when they are VAD_THRESHOLD_DB above the noise floor
+    (the 10th percentile level). Pauses shorter than VAD_MIN_SILENCE are kept as
+    speech, and every speech run is padded by VAD_PADDING on both sides.
+    Audio shorter than one frame has no frames and gets an empty mask.
+    """
+    if len(energy_db) == 0:
+        return np.zeros(0, dtype=bool)
+    noise_floor = np.percentile(energy_db, 10)
+    mask = energy_db > noise_floor + settings.VAD_THRESHOLD_DB
+
+    # Fill natural pauses between words/sentences
+    min_gap = int(settings.VAD_MIN_SILENCE / frame_seconds)
+    starts, ends, values = _runs(mask)
+    for start, end, value in zip(starts, ends, values):
+        if not value and end - start < min_gap and start > 0 and end < len(mask):
+            mask[start:end] = True
+
+    # Pad speech so word onsets/tails are not clipped
+    pad = int(settings.VAD_PADDING / frame_seconds)
+    if pad:
+        mask = np.convolve(mask.astype(np.int8), np.ones(2 * pad + 1, dtype=np.int8), mode="same") > 0
+    return mask
+
+def keep_ranges(mask, frame_length, total_samples, frame_seconds):
+    """
+    Sample ranges to keep: all speech, plus VAD_KEEP_SILENCE of every silence
+    (half at each edge) so the trimmed audio still has natural pauses.
+    """
+    keep = int(settings.VAD_KEEP_SILENCE / frame_seconds)
+    ranges = []
+    starts, ends, values = _runs(mask)
+    for start, end, value in zip(starts, ends, values):
+        if value or end - start <= keep:
+            ranges.append((start, end))
+        else:
+            head = keep // 2
+            ranges.append((start, start + head))
+            ranges.append((end - (keep - head), end))
+
+    # Merge touching ranges and convert frames to samples
+    samples = []
+    for start, end in ranges:
+        if start == end:
+            continue
+        start, end = int(start) * frame_length, int(end) * frame_length
+        if samples and samples[-1][1] == start:
+            samples[-1] = (samples[-1][0], end)
+        else:
+            samples.append((start, end))
+
+    # The partial frame at the very end belongs to the last range if it reaches it
+    if samples and samples[-1][1] == len(mask) * frame_length:
+        samples[-1] = (samples[-1][0], total_samples)
+    return samples
+
+def build_offset_map(ranges, sample_rate, total_samples):
+    """Where each kept span of the trimmed audio came from in the original (seconds)"""
+    segments = []
+    trimmed = 0
+    for start, end in ranges:
+        segments.append({
+            "trimmed_start": round(trimmed / sample_rate, 3),
+            "original_start": round(start / sample_rate, 3),
+            "duration": round((end - start) / sample_rate, 3)
+        })
+        trimmed += end - start
+    return {
+        "version": 1,
+        "original_duration": round(total_samples / sample_rate, 3),
+        "trimmed_duration": round(trimmed / sample_rate, 3),
+        "segments": segments
+    }
+
+def trim_silence(url, profile, work_dir):
+    """
+    Decodes the audio to mono PCM on disk, finds non-speech spans and returns
+    (encoder stream over the kept spans, offset map).
+    The PCM is memory-mapped, so memory use does not grow with the recording.
+    """
+    sample_rate = settings.VAD_SAMPLE_RATE
+    pcm_path = os.path.join(work_dir, "audio.pcm")
+    decode_pcm(url, pcm_path, sample_rate)
+    if os.path.getsize(pcm_path) == 0:
+        raise ValueError("Decoded audio is empty")
+    pcm = np.memmap(pcm_path, dtype=np.int16, mode="r")
+
+    frame_length = int(sample_rate * settings.VAD_FRAME_MS / 1000)
+    frame_seconds = frame_length / sample_rate
+    energy_db = frame_energy_db(pcm, frame_length)
+    mask = speech_mask(energy_db, frame_seconds)
+
+    if len(mask) == 0 or not mask.any():
+        logger.info("No speech detected; keeping the full recording")
+        ranges = [(0, len(pcm))]
+    else:
+        ranges = keep_ranges(mask, frame_length, len(pcm), frame_seconds)
+
+    offset_map = build_offset_map(ranges, sample_rate, len(pcm))
+    logger.info(
+        f"Silence trimming: {offset_map['original_duration']}s -> {offset_map['trimmed_duration']}s "
+        f"({len(ranges)} spans)"
+    )
+
+    def feed(stdin):
+        chunk = sample_rate * 30 # write 30s at a time
+        for start, end in ranges:
+            for offset in range(start, end, chunk):
+                stdin.write(pcm[offset:min(offset + chunk, end)].tobytes())
+
+    return encode_pcm(feed, sample_rate, profile), offset_map
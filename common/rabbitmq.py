@@ -0,0 +1,192 @@
+"""
+Blocking (pika) RabbitMQ runtime shared by the pipeline workers: one service
+consumes one queue and publishes to the next.
+"""
+import pika
+import json
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class ThreadSafeChannel:
+    """
+    Stand-in for the pika channel handed to message handlers.
+    Handlers run on worker threads, but pika connections are not thread safe,
+    so acks/nacks are scheduled onto the connection thread.
+    """
+    def __init__(self, client):
+        self.client = client
+
+    def basic_ack(self, delivery_tag):
+        self.client._call_on_connection_thread(
+            lambda: self.client.channel.basic_ack(delivery_tag=delivery_tag)
+        )
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        self.client._call_on_connection_thread(
+            lambda: self.client.channel.basic_nack(delivery_tag=delivery_tag, requeue=requeue)
+        )
+
+class RabbitMQClient:
+    """
+    settings: the service's config (RABBITMQ_* connection fields, WORKER_CONCURRENCY,
+    WORKER_PREFETCH). consume_queue is the stage's input, publish_queue the
+    default destination of publish_event.
+    """
+    BLOCKED_CONNECTION_TIMEOUT = 300 # Seconds a publish may wait while the broker applies backpressure
+    # Longest a worker thread waits for the connection thread to run its ack/publish; longer than
+    # a blocked publish, so only a dead or wedged connection thread trips it
+    CALL_TIMEOUT_SECONDS = BLOCKED_CONNECTION_TIMEOUT + 60
+
+    def __init__(self, settings, consume_queue, publish_queue, logger):
+        self.settings = settings
+        self.consume_queue = consume_queue
+        self.publish_queue = publish_queue
+        self.logger = logger
+        self.connection = None
+        self.channel = None
+        self.executor = None
+        self.in_flight = {} # future -> delivery tag
+        self._lock = threading.Lock()
+        self._connection_thread = None
+
+    def _connect(self):
+        settings = self.settings
+        credentials = pika.PlainCredentials(settings.RABBITMQ_USER, settings.RABBITMQ_PASS)
+        parameters = pika.ConnectionParameters(
+            host=settings.RABBITMQ_HOST,
+            port=settings.RABBITMQ_PORT,
+            credentials=credentials,
+            heartbeat=600,
+            blocked_connection_timeout=self.BLOCKED_CONNECTION_TIMEOUT
+        )
+        self.connection = pika.BlockingConnection(parameters)
+        self.channel = self.connection.channel()
+        self._connection_thread = threading.get_ident()
+
+        # Declare the input and output queues so they exist before we listen
+        self.channel.queue_declare(queue=self.consume_queue, durable=True)
+        self.channel.queue_declare(queue=self.publish_queue, durable=True)
+
+        print("Connected to RabbitMQ")
+
+    def publish_event(self, message: dict, queue_name=None):
+        """
+        Publishes message to the next stage.
+        Safe to call from handler threads: the publish runs on the connection thread.
+        """
+        # Ensure connection is active before publishing (only its owner may reconnect)
+        if self._connection_thread in (None, threading.get_ident()):
+            self._ensure_connection()
+        self._call_on_connection_thread(lambda: self.channel.basic_publish(
+            exchange='',
+            routing_key=queue_name or self.publish_queue,
+            body=json.dumps(message),
+            properties=pika.BasicProperties(delivery_mode=2)
+        ))
+
+    def _call_on_connection_thread(self, fn):
+        """
+        Runs fn on the thread that owns the connection and waits for it, for at most
+        CALL_TIMEOUT_SECONDS: if that thread died, the caller gets an error (and its
+        job fails like any other) instead of hanging, so the process can exit and be
+        restarted with a fresh connection.
+        """
+        if threading.get_ident() == self._connection_thread:
+            return fn()
+
+        done = threading.Event()
+        outcome = {}
+        def task():
+            try:
+                outcome["result"] = fn()
+            except Exception as e:
+                outcome["error"] = e
+            finally:
+                done.set()
+
+        self.connection.add_callback_threadsafe(task)
+        if not done.wait(self.CALL_TIMEOUT_SECONDS):
+            raise pika.exceptions.AMQPConnectionError(
+                f"RabbitMQ connection thread did not respond within {self.CALL_TIMEOUT_SECONDS}s"
+            )
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome.get("result")
+
+    def consume(self, callback_function):
+        """
+        Main worker loop.
+        Deliveries are handed to a pool of WORKER_CONCURRENCY threads, so up to
+        that many jobs run at once while this thread keeps servicing the
+        connection (heartbeats, acks, publishes). callback_function keeps the
+        pika signature (ch, method, properties, body); ch is thread safe.
+        SIGTERM stops new deliveries and drains the jobs already running.
+        """
+        settings = self.settings
+        self._ensure_connection()
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.WORKER_CONCURRENCY,
+            thread_name_prefix="worker"
+        )
+        safe_channel = ThreadSafeChannel(self)
+
+        def on_message(ch, method, properties, body):
+            future = self.executor.submit(callback_function, safe_channel, method, properties, body)
+            with self._lock:
+                self.in_flight[future] = method.delivery_tag
+            future.add_done_callback(self._forget)
+
+        # Setup Consumer
+        self.channel.basic_qos(prefetch_count=settings.WORKER_PREFETCH or settings.WORKER_CONCURRENCY)
+        self.channel.basic_consume(
+            queue=self.consume_queue,
+            on_message_callback=on_message
+        )
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        print(f"Waiting for messages ({settings.WORKER_CONCURRENCY} concurrent)...")
+        self.channel.start_consuming()
+        self._drain()
+
+    def _forget(self, future):
+        with self._lock:
+            self.in_flight.pop(future, None)
+
+    def _request_stop(self, signum, frame):
+        self.logger.info("Shutdown requested; finishing in-flight jobs...")
+        # Signal handlers interrupt arbitrary code, so let the I/O loop do the stopping
+        self.connection.add_callback_threadsafe(self.channel.stop_consuming)
+
+    def _drain(self):
+        # Jobs that never started go back to the queue for another worker
+        with self._lock:
+            queued = list(self.in_flight.items())
+        for future, delivery_tag in queued:
+            if future.cancel():
+                self.channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+
+        # Keep servicing the connection so running jobs can still ack and publish
+        while True:
+            with self._lock:
+                running = [f for f in self.in_flight if not f.done()]
+            if not running:
+                break
+            self.connection.process_data_events(time_limit=1)
+
+        self.executor.shutdown(wait=True)
+        self.close()
+        self.logger.info("Worker stopped.")
+
+    def connect(self):
+        """Connects on the calling thread, which then owns the connection"""
+        self._ensure_connection()
+
+    def _ensure_connection(self):
+        if self.connection is None or self.connection.is_closed:
+            self._connect()
+
+    def close(self):
+        if self.connection and not self.connection.is_closed:
+            self.connection.close()
\ No newline at end of file
@@ -0,0 +1,199 @@
+"""
+OpenAI rate limit shared by every service that calls OpenAI with the same API
+key: a blocking limiter for the pika workers and an asyncio one for the
+FastAPI services, over the same Redis keys and Lua scripts.
+"""
+import asyncio
+import random
+import time
+import redis
+import redis.asyncio as aioredis
+
+class RateLimitTimeout(Exception):
+    """The limiter could not grant capacity within RATE_LIMIT_MAX_WAIT_SECONDS"""
+    pass
+
+class _RateLimiterBase:
+    """
+    Requests-per-minute and tokens-per-minute token buckets in Redis, shared by
+    every service and replica that calls OpenAI with the same API key.
+
+    Both buckets are checked and charged in one Lua script, so concurrent
+    callers never overdraw them. Priority classes: "interactive" callers may
+    drain the buckets completely, "batch" callers must leave
+    RATE_LIMIT_INTERACTIVE_RESERVE of each bucket untouched, so user-facing
+    requests still get through while batch work saturates the limit.
+
+    Callers that can't be served wait (sleeping until the script says capacity
+    will be back) for at most max_wait seconds, then get RateLimitTimeout.
+
+    settings: the service's config (REDIS_HOST/PORT, OPENAI_RPM_LIMIT,
+    OPENAI_TPM_LIMIT, RATE_LIMIT_INTERACTIVE_RESERVE, RATE_LIMIT_MAX_WAIT_SECONDS).
+    """
+    RPM_KEY = "openai_limit:rpm"
+    TPM_KEY = "openai_limit:tpm"
+    PRIORITY_RESERVE = {"interactive": 0.0, "batch": None} # None = RATE_LIMIT_INTERACTIVE_RESERVE
+    BUCKET_TTL_MS = 120000 # An idle bucket is full again after a minute; drop it after two
+
+    # KEYS: rpm, tpm. ARGV: rpm capacity, tpm capacity, tokens, reserve fraction, bucket ttl.
+    # Returns 0 when granted, else the milliseconds until it could be.
+    ACQUIRE_SCRIPT = """
+    local now_parts = redis.call('TIME')
+    local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+    local reserve = tonumber(ARGV[4])
+    local costs = {1, tonumber(ARGV[3])}
+    local capacities = {tonumber(ARGV[1]), tonumber(ARGV[2])}
+    local levels = {}
+    local wait = 0
+    for i = 1, 2 do
+        local bucket = redis.call('HMGET', KEYS[i], 'level', 'ts')
+        local capacity = capacities[i]
+        local rate = capacity / 60000 -- refill per ms
+        local level = tonumber(bucket[1]) or capacity
+        local ts = tonumber(bucket[2]) or now
+        level = math.min(capacity, level + math.max(0, now - ts) * rate)
+        levels[i] = level
+        local needed = costs[i] + capacity * reserve
+        if level < needed then
+            wait = math.max(wait, math.ceil((needed - level) / rate))
+        end
+    end
+    if wait > 0 then
+        for i = 1, 2 do
+            redis.call('HSET', KEYS[i], 'level', levels[i], 'ts', now)
+            redis.call('PEXPIRE', KEYS[i], ARGV[5])
+        end
+        return wait
+    end
+    for i = 1, 2 do
+        redis.call('HSET', KEYS[i], 'level', levels[i] - costs[i], 'ts', now)
+        redis.call('PEXPIRE', KEYS[i], ARGV[5])
+    end
+    return 0
+    """
+
+    # Corrects the token bucket once the real usage is known. KEYS: tpm. ARGV: capacity, delta, bucket ttl.
+    # A bucket that expired since acquire() was full, so it is recreated from capacity: an
+    # overrun is still charged instead of being lost.
+    SETTLE_SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local level = tonumber(redis.call('HGET', KEYS[1], 'level'))
+    if not level then
+        local now_parts = redis.call('TIME')
+        local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+        redis.call('HSET', KEYS[1], 'level', math.min(capacity, capacity - tonumber(ARGV[2])), 'ts', now)
+        redis.call('PEXPIRE', KEYS[1], ARGV[3])
+        return 0
+    end
+    redis.call('HSET', KEYS[1], 'level', math.min(capacity, level - tonumber(ARGV[2])))
+    return 1
+    """
+
+    def __init__(self, settings, logger, client):
+        self.settings = settings
+        self.logger = logger
+        self.client = client
+        self._acquire = self.client.register_script(self.ACQUIRE_SCRIPT)
+        self._settle = self.client.register_script(self.SETTLE_SCRIPT)
+
+    def _request(self, tokens, priority, max_wait):
+        """(tokens to charge, reserve fraction, max wait) for one acquire() call"""
+        if priority not in self.PRIORITY_RESERVE:
+            raise ValueError(f"Unknown priority '{priority}'")
+        reserve = self.PRIORITY_RESERVE[priority]
+        if reserve is None:
+            reserve = self.settings.RATE_LIMIT_INTERACTIVE_RESERVE
+        max_wait = self.settings.RATE_LIMIT_MAX_WAIT_SECONDS if max_wait is None else max_wait
+
+        # A request larger than what the bucket may hold for this priority could never be granted
+        tokens = min(int(tokens), int(self.settings.OPENAI_TPM_LIMIT * (1 - reserve)))
+        return tokens, reserve, max_wait
+
+    def _acquire_args(self, tokens, reserve):
+        return {
+            "keys": [self.RPM_KEY, self.TPM_KEY],
+            "args": [self.settings.OPENAI_RPM_LIMIT, self.settings.OPENAI_TPM_LIMIT, tokens, reserve, self.BUCKET_TTL_MS]
+        }
+
+    def _settle_args(self, charged, used):
+        return {"keys": [self.TPM_KEY], "args": [self.settings.OPENAI_TPM_LIMIT, used - charged, self.BUCKET_TTL_MS]}
+
+    def _sleep_time(self, wait_ms, deadline, tokens, priority, max_wait, waited):
+        """Seconds to wait before trying again; raises RateLimitTimeout past the deadline"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise RateLimitTimeout(f"No OpenAI capacity for {tokens} tokens within {max_wait}s ({priority})")
+        if not waited:
+            self.logger.info(f"OpenAI rate limit reached; queueing {priority} call ({tokens} tokens)")
+        # Jitter spreads out waiters that were told the same time
+        return min(remaining, wait_ms / 1000 * random.uniform(1.0, 1.2))
+
+class OpenAIRateLimiter(_RateLimiterBase):
+    """Blocking version, for the pika workers: waiting callers sleep on their thread."""
+    def __init__(self, settings, logger):
+        super().__init__(settings, logger, redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            decode_responses=True
+        ))
+
+    def acquire(self, tokens, priority="batch", max_wait=None):
+        """
+        Blocks until one request and `tokens` tokens are granted. Returns the
+        number of tokens charged (pass it to settle() once usage is known).
+        """
+        tokens, reserve, max_wait = self._request(tokens, priority, max_wait)
+        deadline = time.monotonic() + max_wait
+        waited = False
+        while True:
+            wait_ms = self._acquire(**self._acquire_args(tokens, reserve))
+            if not wait_ms:
+                return tokens
+            time.sleep(self._sleep_time(wait_ms, deadline, tokens, priority, max_wait, waited))
+            waited = True
+
+    def settle(self, charged, used):
+        """Refunds (or charges) the difference between the estimate and the real token usage"""
+        if used is None or used == charged:
+            return
+        try:
+            self._settle(**self._settle_args(charged, used))
+        except redis.RedisError as e:
+            self.logger.warning(f"Could not settle rate limit usage: {e}")
+
+class AsyncOpenAIRateLimiter(_RateLimiterBase):
+    """asyncio version: waiting callers sleep on the event loop, not on a thread."""
+    def __init__(self, settings, logger, max_connections=None):
+        super().__init__(settings, logger, aioredis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            decode_responses=True,
+            max_connections=max_connections
+        ))
+
+    async def acquire(self, tokens, priority="batch", max_wait=None):
+        """
+        Waits until one request and `tokens` tokens are granted. Returns the
+        number of tokens charged (pass it to settle() once usage is known).
+        """
+        tokens, reserve, max_wait = self._request(tokens, priority, max_wait)
+        deadline = time.monotonic() + max_wait
+        waited = False
+        while True:
+            wait_ms = await self._acquire(**self._acquire_args(tokens, reserve))
+            if not wait_ms:
+                return tokens
+            await asyncio.sleep(self._sleep_time(wait_ms, deadline, tokens, priority, max_wait, waited))
+            waited = True
+
+    async def settle(self, charged, used):
+        """Refunds (or charges) the difference between the estimate and the real token usage"""
+        if used is None or used == charged:
+            return
+        try:
+            await self._settle(**self._settle_args(charged, used))
+        except redis.RedisError as e:
+            self.logger.warning(f"Could not settle rate limit usage: {e}")
+
+    async def close(self):
+        await self.client.aclose()
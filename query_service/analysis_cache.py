@@ -0,0 +1,198 @@
+import asyncio
+import hashlib
+import logging
+import zlib
+from collections import OrderedDict
+import redis
+import redis.asyncio as aioredis
+from config import settings
+
+logger = logging.getLogger("query_service")
+
+class LRUBytes:
+    """In-process LRU of (etag, body) bounded by the total body size"""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, etag, body):
+        if len(body) > self.max_bytes:
+            return
+        self.pop(key)
+        self.entries[key] = (etag, body)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+class Generations:
+    """
+    Per-video local invalidation counts, for the videos most recently invalidated
+    (at most max_size). Values come from one counter, and a video that was dropped
+    reads as the highest value dropped so far: a load that started before its
+    video was forgotten still sees the generation change.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.counter = 0
+        self.floor = 0
+        self.entries = OrderedDict()
+
+    def get(self, video_id):
+        return self.entries.get(video_id, self.floor)
+
+    def bump(self, video_id):
+        self.counter += 1
+        self.entries.pop(video_id, None)
+        self.entries[video_id] = self.counter
+        while len(self.entries) > self.max_size:
+            _, dropped = self.entries.popitem(last=False)
+            self.floor = max(self.floor, dropped)
+
+class AnalysisResponseCache:
+    """
+    Read-through cache of /analyses/{video_id} response bodies: the serialized
+    JSON bytes and their strong ETag, so repeat views (and 304 revalidations)
+    never touch MinIO or re-serialize.
+
+    1. In-process LRU, bounded to ANALYSIS_RESPONSE_CACHE_MAX_BYTES.
+    2. The cache Redis (CACHE_REDIS_HOST; zlib-compressed, ANALYSIS_RESPONSE_TTL_SECONDS),
+       shared by all replicas.
+    3. load(video_id) -> body bytes (MinIO) on a miss; concurrent misses share one load.
+
+    Analyses only change when a video is reprocessed, which ends with an
+    analysis_ready_queue event: invalidate() bumps the video's generation, drops
+    the Redis entry and tells every replica over pub/sub to drop its LRU entry.
+    Generations live on the coordination Redis (REDIS_HOST), which never evicts;
+    each cached body records the generation it was loaded under and only counts
+    as a hit while that is still current, so a load that raced with the
+    invalidation can store the old body but never serve it.
+    """
+    CHANNEL = "analysis_response:invalidate"
+
+    def __init__(self, load):
+        self.load = load
+        self.local = LRUBytes(settings.ANALYSIS_RESPONSE_CACHE_MAX_BYTES)
+        self.generations = Generations(settings.ANALYSIS_RESPONSE_GENERATIONS_MAX)
+        self.loading = {} # video_id -> future of the load in progress
+        self.client = aioredis.Redis(
+            host=settings.CACHE_REDIS_HOST,
+            port=settings.CACHE_REDIS_PORT,
+            decode_responses=False, # bodies are compressed bytes
+            max_connections=settings.REDIS_MAX_CONNECTIONS
+        )
+        self.coordination = aioredis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            decode_responses=False,
+            max_connections=settings.REDIS_MAX_CONNECTIONS
+        )
+        self._listener = None
+
+    @staticmethod
+    def etag(body):
+        return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+    def _key(self, video_id):
+        return f"analysis_response:{video_id}"
+
+    def _generation_key(self, video_id):
+        return f"analysis_response:{video_id}:gen"
+
+    async def get(self, video_id):
+        """(etag, body) for a stored analysis; raises whatever load() raises when there is none"""
+        entry = self.local.get(video_id)
+        if entry is not None:
+            return entry
+
+        # Misses for the same video share one Redis/MinIO round trip
+        if video_id in self.loading:
+            return await asyncio.shield(self.loading[video_id])
+        future = asyncio.get_running_loop().create_future()
+        self.loading[video_id] = future
+        try:
+            entry = await self._fill(video_id)
+            future.set_result(entry)
+            return entry
+        except Exception as e:
+            future.set_exception(e)
+            future.exception() # retrieved: waiters (if any) re-raise it themselves
+            raise
+        finally:
+            del self.loading[video_id]
+
+    async def _fill(self, video_id):
+        local_generation = self.generations.get(video_id)
+
+        try:
+            generation = await self.coordination.get(self._generation_key(video_id)) or b"0"
+            cached = await self.client.hmget(self._key(video_id), "etag", "body", "generation")
+            if cached[0] is not None and cached[2] == generation:
+                entry = (cached[0].decode(), zlib.decompress(cached[1]))
+            else:
+                body = await self.load(video_id)
+                entry = (self.etag(body), body)
+                pipe = self.client.pipeline(transaction=True)
+                pipe.hset(self._key(video_id), mapping={"etag": entry[0], "body": zlib.compress(body), "generation": generation})
+                pipe.expire(self._key(video_id), settings.ANALYSIS_RESPONSE_TTL_SECONDS)
+                await pipe.execute()
+        except redis.RedisError as e:
+            # Without Redis, serve straight from MinIO (and don't keep it: invalidations can't reach us)
+            logger.warning(f"Response cache unavailable ({e}); loading {video_id} directly")
+            body = await self.load(video_id)
+            return self.etag(body), body
+
+        if self.generations.get(video_id) == local_generation:
+            self.local.put(video_id, *entry)
+        return entry
+
+    async def invalidate(self, video_id):
+        """Drops a video's cached response everywhere (Redis and every replica's LRU)"""
+        pipe = self.coordination.pipeline(transaction=True)
+        pipe.incr(self._generation_key(video_id))
+        # Outlives every body stored under an older generation, so a reset to 0 can't revive one
+        pipe.expire(self._generation_key(video_id), 2 * settings.ANALYSIS_RESPONSE_TTL_SECONDS)
+        pipe.publish(self.CHANNEL, video_id)
+        await pipe.execute()
+        await self.client.delete(self._key(video_id))
+        self._drop_local(video_id)
+
+    def _drop_local(self, video_id):
+        self.generations.bump(video_id)
+        self.local.pop(video_id)
+
+    async def start(self):
+        self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            try:
+                pubsub = self.coordination.pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(self.CHANNEL)
+                async for message in pubsub.listen():
+                    self._drop_local(message["data"].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Entries may be stale while we're disconnected; start over clean
+                logger.error(f"Cache invalidation channel failed: {e}")
+                self.local = LRUBytes(settings.ANALYSIS_RESPONSE_CACHE_MAX_BYTES)
+                await asyncio.sleep(5)
+
+    async def close(self):
+        if self._listener:
+            self._listener.cancel()
+        await self.client.aclose()
+        await self.coordination.aclose()
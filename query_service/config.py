@@ -7,7 +7,36 @@ class Settings(BaseSettings):
     # LLM & DB
     OPENAI_API_KEY: str
     MONGO_URI: str = "mongodb://mongo:27017"
+    MONGO_MAX_POOL_SIZE: int = 50 # Connections per worker process
+    ADVISOR_HISTORY_SESSIONS: int = 20 # Most recent sessions read as Advisor context
     LLM_MODEL: str = "gpt-5-nano-2025-08-07"
+    OPENAI_BASE_URL: str = "" # Empty = api.openai.com; load_test.py can serve a slow stand-in
+    OPENAI_TIMEOUT_SECONDS: float = 120.0
+    ADVISOR_CONCURRENCY: int = 32 # OpenAI calls in flight per worker process
+
+    # Redis
+    REDIS_HOST: str = "redis" # Coordination (OpenAI rate limit, response cache generations): never evicts
+    REDIS_PORT: int = 6379
+    CACHE_REDIS_HOST: str = "redis_llm_cache" # /analyses response cache: evicts least recently used keys when full
+    CACHE_REDIS_PORT: int = 6379
+    REDIS_MAX_CONNECTIONS: int = 50
+    ANALYSIS_RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024 # In-process LRU of /analyses response bodies
+    ANALYSIS_RESPONSE_TTL_SECONDS: int = 7 * 24 * 3600 # Redis copy; unread entries go even while the cache has room
+    ANALYSIS_RESPONSE_GENERATIONS_MAX: int = 100000 # Videos whose local invalidations are tracked individually
+
+    # RabbitMQ (analysis_ready_queue events invalidate the response cache)
+    RABBITMQ_HOST: str = "rabbitmq"
+    RABBITMQ_PORT: int = 5672
+    RABBITMQ_USER: str
+    RABBITMQ_PASS: str
+    RABBITMQ_PREFETCH: int = 20
+
+    # OpenAI rate limit (Redis token buckets shared with the analyzer)
+    OPENAI_RPM_LIMIT: int = 500 # Requests per minute for the API key
+    OPENAI_TPM_LIMIT: int = 200000 # Tokens per minute for the API key
+    OPENAI_OUTPUT_TOKENS_ESTIMATE: int = 1500 # Charged up front per call, corrected from the reported usage
+    RATE_LIMIT_INTERACTIVE_RESERVE: float = 0.2 # Share of each bucket batch analysis leaves for /advisor
+    RATE_LIMIT_MAX_WAIT_SECONDS: float = 20.0 # Longest an /advisor call queues before answering 429
     
     # MinIO
     MINIO_ENDPOINT: str = "minio:9000"
@@ -15,6 +44,8 @@ class Settings(BaseSettings):
     MINIO_ROOT_PASSWORD: str
     MINIO_BUCKET_NAME: str = "therapy-videos"
     MINIO_ANALYSIS_BUCKET: str = "therapy-analysis"
+    MINIO_MAX_WORKERS: int = 16 # Threads (and pooled connections) for blocking MinIO calls
+    MINIO_READ_TIMEOUT_SECONDS: float = 30.0
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,52 @@
+import json
+import re
+
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+_DECODER = json.JSONDecoder(strict=False) # raw control characters inside strings are fine
+
+def repair_json(text):
+    """
+    Parses model output that is almost JSON: markdown fences and text around the
+    object are dropped, trailing commas removed, raw control characters accepted,
+    and a cut-off answer closed (open string, arrays and objects). Raises
+    ValueError if nothing usable is left.
+    """
+    start = text.find("{")
+    if start < 0:
+        raise ValueError("No JSON object in the model output")
+    # Valid output is taken as is: the repairs below could change string contents
+    try:
+        return _DECODER.raw_decode(text, start)[0]
+    except ValueError:
+        pass
+    text = _TRAILING_COMMA.sub(r"\1", text[start:])
+    try:
+        return json.loads(text, strict=False)
+    except ValueError:
+        pass
+
+    # Close whatever was still open when the output ended
+    stack, in_string, escape, end = [], False, False, len(text)
+    for i, c in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c in "{[":
+            stack.append("}" if c == "{" else "]")
+        elif c in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                end = i + 1
+                break
+    text = text[:end]
+    if in_string:
+        text += '"'
+    text = _TRAILING_COMMA.sub(r"\1", text.rstrip().rstrip(",") + "".join(reversed(stack)))
+    return json.loads(text, strict=False)
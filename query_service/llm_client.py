@@ -1,12 +1,43 @@
-import json
-from openai import OpenAI
+import asyncio
+import logging
+from openai import AsyncOpenAI
+from json_repair import repair_json
+from common.rate_limiter import AsyncOpenAIRateLimiter
 from config import settings
 
+logger = logging.getLogger("query_service")
+
+CATEGORIES = ["Happy", "Sad", "Worried", "Excited"]
+ADVICE_COUNT = 5
+
+# Structured output: the model must return exactly this shape
+ADVICE_FORMAT = {
+    "type": "json_schema",
+    "name": "advice",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "detected_category": {"type": "string", "enum": CATEGORIES},
+            "advices": {"type": "array", "items": {"type": "string"}}
+        },
+        "required": ["detected_category", "advices"],
+        "additionalProperties": False
+    },
+    "strict": True
+}
+
 class SuperAdvisor:
     def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL or None,
+            timeout=settings.OPENAI_TIMEOUT_SECONDS
+        )
+        self.limiter = AsyncOpenAIRateLimiter(settings, logger, max_connections=settings.REDIS_MAX_CONNECTIONS)
+        # Bounds the OpenAI calls (and connections) one worker has open at once
+        self.slots = asyncio.Semaphore(settings.ADVISOR_CONCURRENCY)
 
-    def get_advice(self, user_query, user_history):
+    async def get_advice(self, user_query, user_history):
         # 1. Summarize History for Context
         # We flatten the history to extract just emotions and topics
         emotions_summary = []
@@ -36,25 +67,53 @@ class SuperAdvisor:
         }}
         """
 
-        response = self.client.responses.create(
-            model=settings.LLM_MODEL,
-            input=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_query}
-            ],
-            text={ "format": { "type": "text" }, "verbosity": "medium" },
-            reasoning={ "effort": "medium" }
+        result = await self._ask(system_prompt, user_query)
+        category = result.get("detected_category")
+        if category not in CATEGORIES:
+            raise ValueError(f"Unexpected category in advice: {category!r}")
+        advices = [advice for advice in result.get("advices") or [] if isinstance(advice, str) and advice.strip()]
+
+        # 2. Re-ask only for what's missing instead of paying for the whole answer again
+        if len(advices) < ADVICE_COUNT:
+            missing = ADVICE_COUNT - len(advices)
+            logger.info(f"Advice came back with {len(advices)} of {ADVICE_COUNT} items; asking for {missing} more")
+            given = "\n".join(f"- {advice}" for advice in advices)
+            more = await self._ask(
+                system_prompt,
+                f"{user_query}\n\nYou already gave these advices:\n{given}\n\n"
+                f"Keep detected_category \"{category}\" and return only {missing} new, different advices."
+            )
+            advices += [advice for advice in more.get("advices") or [] if isinstance(advice, str) and advice.strip()]
+
+        return {"detected_category": category, "advices": advices[:ADVICE_COUNT]}
+
+    async def _ask(self, system_prompt, user_content):
+        # Interactive calls may use the share of the rate limit batch analysis leaves free
+        # (~4 characters per token is close enough for the up-front charge)
+        charged = await self.limiter.acquire(
+            (len(system_prompt) + len(user_content)) // 4 + settings.OPENAI_OUTPUT_TOKENS_ESTIMATE,
+            priority="interactive"
         )
 
+        response = None
         try:
-            if hasattr(response, 'output_text'):
-                result = response.output_text
-            elif hasattr(response, 'choices'):
-                result = response.choices[0].message.content
-            else:
-                result = str(response)
-        except:
-            result = "{}"
-
-        cleaned = result.replace("```json", "").replace("```", "").strip()
-        return json.loads(cleaned)
\ No newline at end of file
+            async with self.slots:
+                response = await self.client.responses.create(
+                    model=settings.LLM_MODEL,
+                    input=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_content}
+                    ],
+                    text={ "format": ADVICE_FORMAT, "verbosity": "medium" },
+                    reasoning={ "effort": "medium" }
+                )
+        finally:
+            usage = getattr(response, "usage", None)
+            await self.limiter.settle(charged, getattr(usage, "total_tokens", None))
+
+        # Structured output is valid JSON unless the answer was cut off; repair covers that
+        return repair_json(response.output_text)
+
+    async def close(self):
+        await self.client.close()
+        await self.limiter.close()
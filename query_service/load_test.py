@@ -0,0 +1,141 @@
+"""
+Latency of /my-videos while /advisor calls are in flight.
+
+    python load_test.py fake-openai --port 8092 --delay 8     # slow OpenAI stand-in
+    OPENAI_BASE_URL=http://localhost:8092/v1 uvicorn main:app --port 8001
+    python load_test.py run --url http://localhost:8001 --user-id 22 --advisor-concurrency 20
+
+Measures /my-videos at a steady rate twice: alone (baseline), then with
+--advisor-concurrency /advisor calls kept in flight, and prints p50/p95/p99
+for both. On a non-blocking service the two should be close; a blocking
+call on the event loop shows up as a p99 near the advisor latency.
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ADVICE = {
+    "detected_category": "Worried",
+    "advices": [
+        "Name the worry and write it down.",
+        "Schedule a short daily worry window.",
+        "Practice slow breathing for five minutes.",
+        "Challenge the most catastrophic prediction.",
+        "Reach out to someone you trust."
+    ]
+}
+
+# --- Slow OpenAI stand-in ---
+
+class FakeOpenAI(BaseHTTPRequestHandler):
+    delay = 8.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.delay) # Each request has its own thread
+        body = json.dumps({
+            "id": f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "status": "completed",
+            "model": "fake",
+            "output": [{
+                "type": "message",
+                "id": f"msg_{uuid.uuid4().hex}",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": json.dumps(ADVICE), "annotations": []}]
+            }],
+            "usage": {"input_tokens": 400, "output_tokens": 100, "total_tokens": 500}
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+# --- Load ---
+
+def timed_get(url):
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=60) as response:
+        response.read()
+    return (time.perf_counter() - start) * 1000
+
+def advisor_call(url, user_id):
+    request = urllib.request.Request(
+        f"{url}/advisor",
+        data=json.dumps({"user_id": user_id, "query": "I can't stop worrying about work."}).encode(),
+        headers={"Content-Type": "application/json"}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            response.read()
+    except Exception as e:
+        print(f"advisor call failed: {e}")
+
+def measure(url, user_id, rate, duration):
+    """/my-videos latencies (ms) at `rate` requests per second for `duration` seconds"""
+    target = f"{url}/my-videos?user_id={user_id}"
+    with ThreadPoolExecutor(max_workers=max(4, int(rate * 2))) as pool:
+        futures = []
+        start = time.monotonic()
+        for n in range(int(rate * duration)):
+            # Fixed schedule: a stalled server can't slow down the request rate
+            time.sleep(max(0.0, start + n / rate - time.monotonic()))
+            futures.append(pool.submit(timed_get, target))
+        return [future.result() for future in futures]
+
+def report(name, latencies):
+    cuts = statistics.quantiles(latencies, n=100)
+    print(f"{name:<16} n={len(latencies):<5} p50={cuts[49]:8.1f}ms  p95={cuts[94]:8.1f}ms  p99={cuts[98]:8.1f}ms  max={max(latencies):8.1f}ms")
+
+def run(args):
+    timed_get(f"{args.url}/my-videos?user_id={args.user_id}") # warm up
+    baseline = measure(args.url, args.user_id, args.rate, args.duration)
+
+    stop = threading.Event()
+    def keep_advisor_busy():
+        while not stop.is_set():
+            advisor_call(args.url, args.user_id)
+    advisors = [threading.Thread(target=keep_advisor_busy, daemon=True) for _ in range(args.advisor_concurrency)]
+    for thread in advisors:
+        thread.start()
+    time.sleep(1) # let the advisor calls get in flight
+    loaded = measure(args.url, args.user_id, args.rate, args.duration)
+    stop.set()
+
+    report("baseline", baseline)
+    report(f"+{args.advisor_concurrency} advisor", loaded)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query service latency under /advisor load")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    fake = commands.add_parser("fake-openai", help="Serve a slow /v1/responses stand-in")
+    fake.add_argument("--port", type=int, default=8092)
+    fake.add_argument("--delay", type=float, default=8.0, help="Seconds per advisor response")
+
+    load = commands.add_parser("run", help="Measure /my-videos latency with and without advisor load")
+    load.add_argument("--url", default="http://localhost:8001")
+    load.add_argument("--user-id", required=True)
+    load.add_argument("--rate", type=float, default=20, help="/my-videos requests per second")
+    load.add_argument("--duration", type=float, default=30, help="Seconds per measurement")
+    load.add_argument("--advisor-concurrency", type=int, default=20)
+
+    args = parser.parse_args()
+    if args.command == "fake-openai":
+        FakeOpenAI.delay = args.delay
+        print(f"Fake OpenAI on :{args.port} ({args.delay}s per response)")
+        ThreadingHTTPServer(("", args.port), FakeOpenAI).serve_forever()
+    else:
+        run(args)
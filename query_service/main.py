@@ -1,9 +1,12 @@
 import logging
-from fastapi import FastAPI, HTTPException, Body, Query
+from fastapi import FastAPI, HTTPException, Body, Query, Header, Response
 from contextlib import asynccontextmanager
 from minio_utils import MinioClient
 from mongo_utils import MongoClientWrapper
 from llm_client import SuperAdvisor
+from analysis_cache import AnalysisResponseCache
+from rabbitmq_utils import AnalysisEventsConsumer
+from common.rate_limiter import RateLimitTimeout
 from minio.error import S3Error
 
 logging.basicConfig(level=logging.INFO)
@@ -12,20 +15,34 @@ logger = logging.getLogger("query_service")
 minio_client = None
 mongo_client = None
 advisor = None
+analysis_cache = None
+analysis_events = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global minio_client, mongo_client, advisor
+    global minio_client, mongo_client, advisor, analysis_cache, analysis_events
     # Initialize connections (Let It Crash if infra is down)
     minio_client = MinioClient()
     mongo_client = MongoClientWrapper()
     advisor = SuperAdvisor()
-    logger.info("Connected to MinIO, MongoDB, and OpenAI.")
+    analysis_cache = AnalysisResponseCache(lambda video_id: minio_client.get_analysis_body(f"{video_id}-analysis.json"))
+    await analysis_cache.start()
+    analysis_events = AnalysisEventsConsumer(analysis_cache.invalidate)
+    await analysis_events.connect()
+    logger.info("Connected to MinIO, MongoDB, Redis, RabbitMQ and OpenAI.")
     yield
+    await analysis_events.close()
+    await analysis_cache.close()
     mongo_client.close()
+    minio_client.close()
+    await advisor.close()
 
 app = FastAPI(lifespan=lifespan)
 
+# Every endpoint runs on the event loop, so nothing in them may block:
+# MongoDB (motor), OpenAI and Redis are asyncio clients, MinIO calls go to
+# MinioClient's own thread pool.
+
 # --- Interactive Feature 1: Find My Videos ---
 @app.get("/my-videos")
 async def list_user_videos(user_id: str = Query(..., description="Enter your User ID to see your history")):
@@ -34,7 +51,7 @@ async def list_user_videos(user_id: str = Query(..., description="Enter your Use
     Usage: /my-videos?user_id=22
     """
     try:
-        videos = mongo_client.get_user_videos(user_id)
+        videos = await mongo_client.get_user_videos(user_id)
         if not videos:
             return {"message": "No videos found for this user.", "videos": [], "user_id": user_id}
         return {"user_id": user_id, "count": len(videos), "videos": videos}
@@ -43,18 +60,34 @@ async def list_user_videos(user_id: str = Query(..., description="Enter your Use
         raise HTTPException(status_code=500, detail="Database unavailable")
 
 # --- Interactive Feature 2: View Analysis ---
+def etag_matches(if_none_match, etag):
+    """If-None-Match uses weak comparison: W/"x" matches "x"; "*" matches anything"""
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
 @app.get("/analyses/{video_id}")
-async def get_analysis_by_id(video_id: str):
+async def get_analysis_by_id(video_id: str, if_none_match: str = Header(None)):
     """
     Returns the full psychological report for a specific video ID.
     User copies an ID from /my-videos and pastes it here.
+    While the analysis is still running, returns the utterances analyzed so far ("partial": true).
+
+    Finished reports are served from the response cache with a strong ETag;
+    send it back in If-None-Match to get 304 Not Modified.
     """
     filename = f"{video_id}-analysis.json"
     try:
-        data = minio_client.get_analysis(filename)
-        return data
+        etag, body = await analysis_cache.get(video_id)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"} # no-cache: revalidate, don't re-download
+        if if_none_match and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
     except S3Error:
-        raise HTTPException(status_code=404, detail="Analysis not found")
+        # Not finished yet? Serve what has been streamed so far
+        items = await mongo_client.get_analysis_progress(video_id)
+        if items is None:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+        return {"video_id": video_id, "status": "in_progress", "partial": True, "analysis": items}
     except Exception as e:
         logger.error(f"Failed to retrieve {filename}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -72,13 +105,17 @@ async def get_super_advice(user_id: str = Body(..., embed=True), query: str = Bo
         logger.info(f"Advisor requested for User: {user_id}")
         
         # 1. Fetch Context (History)
-        history = mongo_client.get_user_history(user_id)
+        history = await mongo_client.get_user_history(user_id)
         
         # 2. Get Live Advice
-        advice = advisor.get_advice(query, history)
+        # (may queue for rate limit capacity; other requests keep being served meanwhile)
+        advice = await advisor.get_advice(query, history)
         
         # 3. Return to User
         return advice
+    except RateLimitTimeout as e:
+        logger.warning(f"Advisor rate limited: {e}")
+        raise HTTPException(status_code=429, detail="Advisor is busy, please retry shortly", headers={"Retry-After": "10"})
     except Exception as e:
         logger.error(f"Advisor failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Advisor unavailable")
\ No newline at end of file
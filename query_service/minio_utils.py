@@ -1,27 +1,62 @@
+import asyncio
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
+import urllib3
 from minio import Minio
 from config import settings
-import json
 
 class MinioClient:
+    """
+    MinIO has no asyncio client, so its blocking calls run on a dedicated pool
+    of MINIO_MAX_WORKERS threads (with an HTTP connection pool of the same size).
+    A slow MinIO then queues on its own pool instead of stalling the event loop
+    or the threadpool other requests use.
+    """
     def __init__(self):
         self.client = Minio(
             settings.MINIO_ENDPOINT,
             access_key=settings.MINIO_ROOT_USER,
             secret_key=settings.MINIO_ROOT_PASSWORD,
-            secure=False
+            secure=False,
+            http_client=urllib3.PoolManager(
+                maxsize=settings.MINIO_MAX_WORKERS,
+                timeout=urllib3.Timeout(connect=5, read=settings.MINIO_READ_TIMEOUT_SECONDS),
+                retries=urllib3.Retry(total=3, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504])
+            )
         )
         self.analysis_bucket = settings.MINIO_ANALYSIS_BUCKET
+        self.executor = ThreadPoolExecutor(max_workers=settings.MINIO_MAX_WORKERS, thread_name_prefix="minio")
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(fn, *args))
+
+    async def list_analyses(self):
+        return await self._run(self._list_analyses)
 
-    def list_analyses(self):
+    def _list_analyses(self):
         if not self.client.bucket_exists(self.analysis_bucket):
             return []
         objects = self.client.list_objects(self.analysis_bucket)
         return [obj.object_name for obj in objects]
 
-    def get_analysis(self, object_name):
+    async def get_analysis(self, object_name):
+        return await self._run(self._get_analysis, object_name)
+
+    def _get_analysis(self, object_name):
+        response = self.client.get_object(self.analysis_bucket, object_name)
         try:
-            response = self.client.get_object(self.analysis_bucket, object_name)
             return json.load(response)
         finally:
-            if 'response' in locals():
-                response.close()
\ No newline at end of file
+            response.close()
+            response.release_conn()
+
+    async def get_analysis_body(self, object_name):
+        """The analysis as compact JSON bytes, ready to send"""
+        return await self._run(self._get_analysis_body, object_name)
+
+    def _get_analysis_body(self, object_name):
+        return json.dumps(self._get_analysis(object_name), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def close(self):
+        self.executor.shutdown(wait=False)
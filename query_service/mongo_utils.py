@@ -1,26 +1,61 @@
-from pymongo import MongoClient
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DESCENDING
 from config import settings
 
+def _created_at(doc):
+    """Sort key; pymongo returns naive UTC datetimes"""
+    created = doc.get("created_at") or datetime.min
+    return created.replace(tzinfo=None)
+
 class MongoClientWrapper:
+    """Non-blocking (motor) access for the API; create it inside the running event loop"""
     def __init__(self):
-        self.client = MongoClient(settings.MONGO_URI, serverSelectionTimeoutMS=5000)
+        self.client = AsyncIOMotorClient(
+            settings.MONGO_URI,
+            serverSelectionTimeoutMS=5000,
+            maxPoolSize=settings.MONGO_MAX_POOL_SIZE
+        )
         self.db = self.client["therapy_db"]
         self.collection = self.db["session_analysis"]
+        self.progress = self.db["analysis_progress"] # Written by the analyzer while it streams
+        self.links = self.db["video_links"] # Duplicate uploads, written by the upload service
+
+    # Both lookups walk the (user_id, created_at) index created by the analyzer
 
-    def get_user_history(self, user_id):
-        """Fetches all past analyses for this user to build context for the Advisor"""
-        cursor = self.collection.find({"user_id": user_id}, {"analysis": 1, "_id": 0})
+    async def get_user_history(self, user_id):
+        """The user's most recent analyses (ADVISOR_HISTORY_SESSIONS, oldest first) as context for the Advisor"""
+        cursor = (
+            self.collection.find({"user_id": user_id}, {"analysis": 1, "_id": 0})
+            .sort("created_at", DESCENDING)
+            .limit(settings.ADVISOR_HISTORY_SESSIONS)
+        )
         history = []
-        for doc in cursor:
+        async for doc in cursor:
             if "analysis" in doc:
                 history.append(doc["analysis"])
+        history.reverse()
         return history
 
-    def get_user_videos(self, user_id):
-        """Fetches list of video IDs associated with a specific user"""
-        cursor = self.collection.find({"user_id": user_id}, {"video_id": 1, "_id": 0})
-        videos = [doc["video_id"] for doc in cursor if "video_id" in doc]
+    async def get_user_videos(self, user_id):
+        """
+        Fetches list of video IDs associated with a specific user, newest first:
+        their own analyses plus videos they uploaded again after someone else
+        """
+        projection = {"video_id": 1, "created_at": 1, "_id": 0}
+        docs = await self.collection.find({"user_id": user_id}, projection).sort("created_at", DESCENDING).to_list(None)
+        linked = await self.links.find({"user_id": user_id}, projection).to_list(None)
+        if linked:
+            docs = sorted(docs + linked, key=_created_at, reverse=True)
+        videos = list(dict.fromkeys(doc["video_id"] for doc in docs if "video_id" in doc))
         return videos
 
+    async def get_analysis_progress(self, video_id):
+        """Analysis items streamed so far for an analysis still running, in transcript order (None if none)"""
+        chunks = await self.progress.find({"video_id": video_id}, {"_id": 0, "items": 1}).sort("chunk", 1).to_list(None)
+        if not chunks:
+            return None
+        return [item for chunk in chunks for item in chunk.get("items", [])]
+
     def close(self):
-        self.client.close()
\ No newline at end of file
+        self.client.close()
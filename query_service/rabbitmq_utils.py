@@ -0,0 +1,41 @@
+import json
+import logging
+import aio_pika
+from config import settings
+
+logger = logging.getLogger("query_service")
+
+class AnalysisEventsConsumer:
+    """
+    Consumes analysis_ready_queue (published by the analyzer when an analysis is
+    stored) and hands each event's video_id to on_ready. Robust connection:
+    reconnects and resumes consuming on its own.
+    """
+    def __init__(self, on_ready):
+        self.on_ready = on_ready
+        self.connection = None
+
+    async def connect(self):
+        self.connection = await aio_pika.connect_robust(
+            host=settings.RABBITMQ_HOST,
+            port=settings.RABBITMQ_PORT,
+            login=settings.RABBITMQ_USER,
+            password=settings.RABBITMQ_PASS,
+            heartbeat=600
+        )
+        channel = await self.connection.channel()
+        await channel.set_qos(prefetch_count=settings.RABBITMQ_PREFETCH)
+        queue = await channel.declare_queue('analysis_ready_queue', durable=True)
+        await queue.consume(self._on_message)
+        logger.info("Consuming analysis_ready_queue")
+
+    async def _on_message(self, message):
+        # Requeued if on_ready fails, so no invalidation is lost
+        async with message.process(requeue=True):
+            event = json.loads(message.body)
+            if event.get("video_id"):
+                await self.on_ready(event["video_id"])
+
+    async def close(self):
+        if self.connection:
+            await self.connection.close()
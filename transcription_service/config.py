@@ -6,6 +6,20 @@ class Settings(BaseSettings):
     
     # AssemblyAI API Key (Reads from .env)
     ASSEMBLYAI_API_KEY: str
+    ASSEMBLYAI_BASE_URL: str = "https://api.assemblyai.com" # Point at fake_assemblyai.py for local runs
+
+    # Transcript tracker (polls every outstanding transcript from one asyncio loop)
+    TRACKER_POLL_MIN_INTERVAL: float = 3.0 # Seconds before the first poll
+    TRACKER_POLL_MAX_INTERVAL: float = 60.0
+    TRACKER_POLL_BACKOFF: float = 1.5 # Interval multiplier while a transcript is still processing
+    TRACKER_MAX_CONNECTIONS: int = 20 # Concurrent HTTP requests to AssemblyAI
+    TRACKER_JOBS_PREFIX: str = "transcription_jobs/" # Outstanding jobs, persisted so restarts resume them
+    TRACKER_LEASE_SECONDS: float = 60.0 # A replica's claim on a job; renewed every third of it while tracking
+    TRACKER_RESUME_INTERVAL: float = 120.0 # Seconds between sweeps for jobs whose replica died
+
+    # How AssemblyAI gets the audio: "presigned" (it fetches a MinIO URL), "upload"
+    # (streamed through this worker) or "auto" (presigned, falling back to upload)
+    AUDIO_SOURCE_MODE: str = "auto"
 
     # RabbitMQ
     RABBITMQ_HOST: str = "rabbitmq"
@@ -13,11 +27,24 @@ class Settings(BaseSettings):
     RABBITMQ_USER: str
     RABBITMQ_PASS: str
 
+    # Redis (job leases, so each persisted job is resumed by one replica)
+    REDIS_HOST: str = "redis"
+    REDIS_PORT: int = 6379
+
+    # Worker runtime
+    WORKER_CONCURRENCY: int = 8 # Jobs processed at once (submitting only; polling runs in the tracker)
+    WORKER_PREFETCH: int = 0 # Unacked deliveries per worker; 0 = WORKER_CONCURRENCY
+
     # MinIO
     MINIO_ENDPOINT: str = "minio:9000"
     MINIO_ROOT_USER: str
     MINIO_ROOT_PASSWORD: str
     MINIO_BUCKET_NAME: str = "therapy-videos"
+    MINIO_PUBLIC_ENDPOINT: str = "" # Host AssemblyAI can reach MinIO on; empty = presigned mode unavailable
+    MINIO_PUBLIC_SECURE: bool = True
+    MINIO_REGION: str = "us-east-1"
+    PRESIGNED_URL_EXPIRY_SECONDS: int = 24 * 3600 # Must outlive AssemblyAI's queueing time
+    UPLOAD_CHUNK_SIZE: int = 5 * 1024 * 1024 # Pass-through upload read size
 
     class Config:
         env_file = ".env"
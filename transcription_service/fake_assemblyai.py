@@ -0,0 +1,91 @@
+"""
+Minimal stand-in for the AssemblyAI endpoints the transcription service uses,
+for running the pipeline locally without an API key:
+
+    python fake_assemblyai.py --port 8089 --delay 20
+    ASSEMBLYAI_BASE_URL=http://localhost:8089 python main.py
+
+Transcripts complete `delay` seconds after submission with a short synthetic
+two-speaker conversation. With --fail-presigned, transcripts of audio that
+was not sent to /v2/upload end in an error, as when AssemblyAI cannot reach
+the presigned MinIO URL.
+"""
+import argparse
+import time
+import uuid
+from aiohttp import web
+
+CDN = "https://cdn.fake-assemblyai.local/"
+
+SCRIPT = [
+    ("A", "How have you been since our last session?"),
+    ("B", "Better, mostly. I tried the breathing exercise before work."),
+    ("A", "That's good to hear. What did you notice when you used it?"),
+    ("B", "I was less tense in the morning, but it was harder in the evenings."),
+]
+
+def synthetic_transcript(transcript_id, audio_url):
+    utterances, words = [], []
+    clock = 0
+    for speaker, text in SCRIPT:
+        start = clock
+        utterance_words = []
+        for word in text.split():
+            utterance_words.append({"text": word, "start": clock, "end": clock + 300, "confidence": 0.95, "speaker": speaker})
+            clock += 350
+        utterances.append({"speaker": speaker, "text": text, "start": start, "end": clock, "confidence": 0.95, "words": utterance_words})
+        words.extend(utterance_words)
+        clock += 800
+    return {
+        "id": transcript_id,
+        "status": "completed",
+        "audio_url": audio_url,
+        "text": " ".join(text for _, text in SCRIPT),
+        "utterances": utterances,
+        "words": words,
+        "audio_duration": clock / 1000
+    }
+
+async def upload(request):
+    async for _ in request.content.iter_chunked(1 << 20):
+        pass
+    return web.json_response({"upload_url": f"{CDN}{uuid.uuid4().hex}"})
+
+async def submit(request):
+    body = await request.json()
+    transcript_id = uuid.uuid4().hex
+    request.app["transcripts"][transcript_id] = (time.monotonic(), body["audio_url"])
+    return web.json_response({"id": transcript_id, "status": "queued"})
+
+async def status(request):
+    transcript_id = request.match_info["transcript_id"]
+    if transcript_id not in request.app["transcripts"]:
+        return web.json_response({"error": "Transcript not found"}, status=404)
+    submitted, audio_url = request.app["transcripts"][transcript_id]
+    if time.monotonic() - submitted < request.app["delay"]:
+        return web.json_response({"id": transcript_id, "status": "processing"})
+    if request.app["fail_presigned"] and not audio_url.startswith(CDN):
+        return web.json_response({
+            "id": transcript_id,
+            "status": "error",
+            "error": f"Download error, unable to download {audio_url}"
+        })
+    return web.json_response(synthetic_transcript(transcript_id, audio_url))
+
+def create_app(delay, fail_presigned=False):
+    app = web.Application(client_max_size=0)
+    app["transcripts"] = {}
+    app["delay"] = delay
+    app["fail_presigned"] = fail_presigned
+    app.router.add_post("/v2/upload", upload)
+    app.router.add_post("/v2/transcript", submit)
+    app.router.add_get("/v2/transcript/{transcript_id}", status)
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake AssemblyAI API for local runs")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--delay", type=float, default=20, help="Seconds until a transcript completes")
+    parser.add_argument("--fail-presigned", action="store_true", help="Fail transcripts of audio not sent to /v2/upload")
+    args = parser.parse_args()
+    web.run_app(create_app(args.delay, args.fail_presigned), port=args.port)
@@ -0,0 +1,66 @@
+import uuid
+import redis
+from config import settings
+
+class JobLeases:
+    """
+    Which replica follows which transcript.
+
+    The replica tracking a job holds a lease on it (SET NX with a TTL of
+    TRACKER_LEASE_SECONDS) and renews it while the job runs. Resuming a
+    persisted job starts by claiming its lease, so every job has one tracker:
+    at startup replicas only take the jobs nobody holds, and the periodic
+    resume sweep picks up the jobs of a replica that died once its leases expire.
+    """
+    # Extends the leases this replica still holds; returns the keys it lost
+    RENEW_SCRIPT = """
+    local lost = {}
+    for _, key in ipairs(KEYS) do
+        if redis.call('get', key) == ARGV[1] then
+            redis.call('pexpire', key, ARGV[2])
+        else
+            table.insert(lost, key)
+        end
+    end
+    return lost
+    """
+    # Only the lease holder may release it
+    RELEASE_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self):
+        self.client = redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            decode_responses=True
+        )
+        self.owner = uuid.uuid4().hex
+        self._renew = self.client.register_script(self.RENEW_SCRIPT)
+        self._release = self.client.register_script(self.RELEASE_SCRIPT)
+
+    def _key(self, transcript_id):
+        return f"transcription_lease:{transcript_id}"
+
+    def claim(self, transcript_id):
+        """True if this replica now holds the job (False: another replica is tracking it)"""
+        ttl_ms = int(settings.TRACKER_LEASE_SECONDS * 1000)
+        return bool(self.client.set(self._key(transcript_id), self.owner, nx=True, px=ttl_ms))
+
+    def renew(self, transcript_ids):
+        """Extends the leases on these jobs; returns the ids whose lease was lost"""
+        if not transcript_ids:
+            return []
+        ttl_ms = int(settings.TRACKER_LEASE_SECONDS * 1000)
+        lost = self._renew(keys=[self._key(transcript_id) for transcript_id in transcript_ids], args=[self.owner, ttl_ms])
+        prefix = self._key("")
+        return [key[len(prefix):] for key in lost]
+
+    def release(self, transcript_id):
+        self._release(keys=[self._key(transcript_id)], args=[self.owner])
+
+    def close(self):
+        self.client.close()
@@ -1,31 +1,36 @@
-import os
 import json
 import sys
+import threading
 import time
 import requests
 import logging
 from minio_utils import MinioClient
-from rabbitmq_utils import RabbitMQClient
+from common.rabbitmq import RabbitMQClient
+from transcript_tracker import TranscriptTracker
+from job_leases import JobLeases
+from transcript_utils import normalize_transcript
 from config import settings
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("transcription_service")
 
+# Long-lived clients, shared by all worker threads
+minio = None
+rabbitmq = None
+tracker = None
+leases = None
+http = requests.Session() # Pooled connections to AssemblyAI
+
 # AssemblyAI Constants
-UPLOAD_URL = 'https://api.assemblyai.com/v2/upload'
-TRANSCRIPT_URL = 'https://api.assemblyai.com/v2/transcript'
+UPLOAD_URL = f'{settings.ASSEMBLYAI_BASE_URL}/v2/upload'
+TRANSCRIPT_URL = f'{settings.ASSEMBLYAI_BASE_URL}/v2/transcript'
 HEADERS = {"authorization": settings.ASSEMBLYAI_API_KEY}
 
-def upload_file_to_api(file_path):
-    logger.info("Uploading audio to AssemblyAI...")
-    def read_file(path):
-        with open(path, 'rb') as f:
-            while True:
-                data = f.read(5242880) 
-                if not data: break
-                yield data
-
-    response = requests.post(UPLOAD_URL, headers=HEADERS, data=read_file(file_path))
+def upload_object_to_api(audio_filename):
+    """Pipes the audio from MinIO straight into AssemblyAI's upload endpoint (no temp file)"""
+    logger.info(f"Streaming {audio_filename} to AssemblyAI...")
+    chunks = minio.stream_object(audio_filename, settings.UPLOAD_CHUNK_SIZE)
+    response = http.post(UPLOAD_URL, headers=HEADERS, data=chunks)
     response.raise_for_status()
     return response.json()['upload_url']
 
@@ -35,79 +40,177 @@ def start_transcription(audio_url):
         "audio_url": audio_url,
         "speaker_labels": True
     }
-    response = requests.post(TRANSCRIPT_URL, json=json_payload, headers=HEADERS)
+    response = http.post(TRANSCRIPT_URL, json=json_payload, headers=HEADERS)
     response.raise_for_status()
     return response.json()['id']
 
-def wait_for_completion(transcript_id):
-    polling_endpoint = f"{TRANSCRIPT_URL}/{transcript_id}"
-    
-    while True:
-        response = requests.get(polling_endpoint, headers=HEADERS)
-        response.raise_for_status()
-        status = response.json()['status']
-        
-        if status == 'completed':
-            return response.json()
-        elif status == 'error':
-            raise Exception(f"Transcription failed: {response.json()['error']}")
-            
-        logger.info(f"Transcription status: {status}...")
-        time.sleep(3)
+def submit_audio(audio_filename, mode):
+    """
+    Starts a transcript and returns (transcript_id, audio source).
+    "presigned" lets AssemblyAI fetch the audio from MinIO itself, so no audio
+    bytes pass through this worker; "upload" streams them through. "auto"
+    tries presigned first and falls back to upload.
+    """
+    if mode not in ("auto", "presigned", "upload"):
+        raise ValueError(f"Unknown AUDIO_SOURCE_MODE '{mode}'")
+
+    if mode != "upload":
+        audio_url = minio.presigned_url(audio_filename)
+        if audio_url:
+            try:
+                return start_transcription(audio_url), "presigned"
+            except requests.HTTPError as e:
+                if mode == "presigned": raise
+                logger.warning(f"Presigned submission rejected ({e}); uploading instead")
+        elif mode == "presigned":
+            raise ValueError("AUDIO_SOURCE_MODE=presigned requires MINIO_PUBLIC_ENDPOINT")
+
+    return start_transcription(upload_object_to_api(audio_filename)), "upload"
+
+def job_object(transcript_id):
+    return f"{settings.TRACKER_JOBS_PREFIX}{transcript_id}.json"
+
+def track_job(transcript_id, source, user_id, video_id, audio_filename, offsets_filename, urgency="interactive"):
+    """Records the job (so a restart can resume it) and hands it to the tracker"""
+    leases.claim(transcript_id) # New transcript: nobody else can hold it
+    job = {
+        "transcript_id": transcript_id,
+        "audio_source": source,
+        "user_id": user_id,
+        "video_id": video_id,
+        "audio_filename": audio_filename,
+        "offsets_filename": offsets_filename,
+        "urgency": urgency
+    }
+    minio.upload_json(job, job_object(transcript_id))
+    tracker.track(job)
+    logger.info(f"Transcript {transcript_id} submitted for {video_id} via {source} ({tracker.outstanding()} in flight)")
+
+# --- Stage 1: Submit (RabbitMQ handler) ---
+
+def record_failure(video_id, error):
+    """Best effort: the message is dropped either way"""
+    try:
+        minio.mark_failed(video_id, error)
+    except Exception as e:
+        logger.error(f"Could not mark {video_id} as failed: {e}")
 
 def process_audio(ch, method, properties, body):
+    video_id = None
     try:
         message = json.loads(body)
         logger.info(f"Received message: {message}")
-        
+
         video_id = message['video_id']
         audio_filename = message['audio_filename']
         user_id = message.get('user_id', 'anonymous')
-        
-        local_audio_path = f"/tmp/{audio_filename}"
-        local_json_path = f"/tmp/{video_id}.json"
-        
-        minio = MinioClient()
-        rabbitmq = RabbitMQClient()
-
-        # 1. Download
-        logger.info(f"Downloading {audio_filename}...")
-        minio.download_file(audio_filename, local_audio_path)
-
-        # 2. Transcribe
-        upload_url = upload_file_to_api(local_audio_path)
-        transcript_id = start_transcription(upload_url)
-        result_json = wait_for_completion(transcript_id)
-
-        # 3. Save Result
-        with open(local_json_path, 'w') as f:
-            json.dump(result_json, f)
-
-        # 4. Upload JSON
-        logger.info("Uploading JSON transcript...")
-        json_filename = f"{video_id}.json"
-        minio.upload_file(local_json_path, json_filename, "application/json")
-
-        # 5. Publish Event
-        next_event = {
-            "user_id": user_id, # FIX: Pass it forward
-            "video_id": video_id,
-            "transcript_filename": json_filename,
-            "status": "transcribed"
-        }
-        rabbitmq.publish_event(next_event)
-        logger.info("Event published to transcription_processing_queue")
-
-        # 6. Cleanup
-        if os.path.exists(local_audio_path): os.remove(local_audio_path)
-        if os.path.exists(local_json_path): os.remove(local_json_path)
+
+        # 1. Submit (AssemblyAI reads the audio from MinIO, or we stream it through)
+        transcript_id, source = submit_audio(audio_filename, settings.AUDIO_SOURCE_MODE)
+
+        # 2. Track
+        track_job(
+            transcript_id, source, user_id, video_id, audio_filename,
+            message.get('offsets_filename'), message.get('urgency', 'interactive')
+        )
 
         ch.basic_ack(delivery_tag=method.delivery_tag)
 
     except Exception as e:
         logger.error(f"Failed to process audio: {e}", exc_info=True)
+        if video_id:
+            record_failure(video_id, e)
         ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
 
+# --- Stage 2: Track (TranscriptTracker) -> Stage 3: Publish on completion ---
+
+def on_transcript_completed(job, result_json):
+    video_id = job['video_id']
+
+    # 1. Normalize: compact speaker turns in original video time + word-timing sidecar
+    offset_map = minio.download_json(job['offsets_filename']) if job.get('offsets_filename') else None
+    transcript, words = normalize_transcript(result_json, offset_map)
+
+    logger.info(f"Uploading transcript for {video_id} ({len(transcript['turns'])} turns)...")
+    json_filename = f"{video_id}.json"
+    words_filename = f"{video_id}.words.json.gz"
+    minio.upload_json_gz(words, words_filename)
+    transcript["words_filename"] = words_filename
+    minio.upload_json(transcript, json_filename)
+
+    # 2. Publish Event
+    next_event = {
+        "user_id": job['user_id'], # FIX: Pass it forward
+        "video_id": video_id,
+        "transcript_filename": json_filename,
+        "urgency": job.get('urgency', 'interactive'),
+        "status": "transcribed"
+    }
+    if job.get('offsets_filename'):
+        next_event["offsets_filename"] = job['offsets_filename'] # Turn times are already mapped back
+    rabbitmq.publish_event(next_event)
+    logger.info("Event published to transcription_processing_queue")
+
+    # 3. Job done
+    minio.remove(job_object(job['transcript_id']))
+    leases.release(job['transcript_id'])
+
+def on_transcript_failed(job, error):
+    logger.error(f"Transcription of {job['video_id']} failed: {error}")
+    if job.get('audio_source') == "presigned" and settings.AUDIO_SOURCE_MODE == "auto":
+        # Most likely AssemblyAI could not fetch the URL; retry with the audio streamed through
+        logger.info(f"Resubmitting {job['video_id']} via upload")
+        transcript_id, source = submit_audio(job['audio_filename'], "upload")
+        track_job(
+            transcript_id, source, job['user_id'], job['video_id'], job['audio_filename'],
+            job.get('offsets_filename'), job.get('urgency', 'interactive')
+        )
+    else:
+        record_failure(job['video_id'], error)
+    minio.remove(job_object(job['transcript_id']))
+    leases.release(job['transcript_id'])
+
+# --- Resume: persisted jobs nobody is tracking ---
+
+def resume_jobs():
+    """
+    Tracks every persisted job whose lease this replica can claim: at startup
+    the jobs left by the last run, later those of replicas that died.
+    """
+    resumed = 0
+    for job in minio.list_json(settings.TRACKER_JOBS_PREFIX):
+        if leases.claim(job['transcript_id']):
+            tracker.track(job)
+            resumed += 1
+    if resumed:
+        logger.info(f"Resumed {resumed} transcription jobs")
+
+def maintain_leases():
+    """Renews the leases of the jobs being tracked and periodically sweeps for orphaned ones"""
+    last_sweep = time.monotonic()
+    while True:
+        time.sleep(settings.TRACKER_LEASE_SECONDS / 3)
+        try:
+            for transcript_id in leases.renew(tracker.transcript_ids()):
+                logger.warning(f"Lost the lease on {transcript_id}; another replica is tracking it")
+                tracker.untrack(transcript_id)
+            if time.monotonic() - last_sweep >= settings.TRACKER_RESUME_INTERVAL:
+                last_sweep = time.monotonic()
+                resume_jobs()
+        except Exception as e:
+            logger.error(f"Lease maintenance failed: {e}", exc_info=True)
+
 if __name__ == "__main__":
-    rabbitmq = RabbitMQClient()
-    rabbitmq.consume(process_audio)
\ No newline at end of file
+    minio = MinioClient()
+    rabbitmq = RabbitMQClient(settings, consume_queue='audio_processing_queue', publish_queue='transcription_processing_queue', logger=logger)
+    rabbitmq.connect() # Before the tracker can publish from its threads
+    leases = JobLeases()
+    tracker = TranscriptTracker(on_transcript_completed, on_transcript_failed)
+    tracker.start()
+
+    # Resume transcripts that were still running when the worker last stopped
+    # (and that no other replica has claimed)
+    resume_jobs()
+    threading.Thread(target=maintain_leases, name="lease-maintenance", daemon=True).start()
+
+    rabbitmq.consume(process_audio)
@@ -1,5 +1,9 @@
 from minio import Minio
 from config import settings
+from datetime import timedelta
+import gzip
+import io
+import json
 import os
 
 class MinioClient:
@@ -12,15 +16,76 @@ class MinioClient:
         )
         self.bucket = settings.MINIO_BUCKET_NAME
 
-    def download_file(self, object_name, file_path):
-        """Downloads file from MinIO to local path"""
-        self.client.fget_object(self.bucket, object_name, file_path)
+        # Presigned URLs are signed for the host AssemblyAI will fetch from.
+        # A fixed region keeps signing local (no lookup round-trip).
+        self.public_client = None
+        if settings.MINIO_PUBLIC_ENDPOINT:
+            self.public_client = Minio(
+                settings.MINIO_PUBLIC_ENDPOINT,
+                access_key=settings.MINIO_ROOT_USER,
+                secret_key=settings.MINIO_ROOT_PASSWORD,
+                secure=settings.MINIO_PUBLIC_SECURE,
+                region=settings.MINIO_REGION
+            )
 
-    def upload_file(self, file_path, object_name, content_type):
-        """Uploads local file to MinIO"""
-        self.client.fput_object(
+    def presigned_url(self, object_name):
+        """Time-limited public GET URL, or None if no public endpoint is configured"""
+        if not self.public_client:
+            return None
+        return self.public_client.presigned_get_object(
             self.bucket,
             object_name,
-            file_path,
-            content_type=content_type
-        )
\ No newline at end of file
+            expires=timedelta(seconds=settings.PRESIGNED_URL_EXPIRY_SECONDS)
+        )
+
+    def stream_object(self, object_name, chunk_size):
+        """Yields the object's bytes chunk by chunk, holding one chunk in memory"""
+        response = self.client.get_object(self.bucket, object_name)
+        try:
+            yield from response.stream(chunk_size)
+        finally:
+            response.close()
+            response.release_conn()
+
+    def upload_json(self, data, object_name):
+        json_bytes = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        self.client.put_object(
+            self.bucket,
+            object_name,
+            io.BytesIO(json_bytes),
+            length=len(json_bytes),
+            content_type="application/json"
+        )
+
+    def mark_failed(self, video_id, error):
+        """Records that the pipeline gave up on this video, so re-uploading it runs the pipeline again"""
+        self.upload_json({"video_id": video_id, "service": settings.SERVICE_NAME, "error": str(error)}, f"{video_id}-failed.json")
+
+    def upload_json_gz(self, data, object_name):
+        """Uploads gzip-compressed JSON (for sidecars that are rarely read)"""
+        gz_bytes = gzip.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+        self.client.put_object(
+            self.bucket,
+            object_name,
+            io.BytesIO(gz_bytes),
+            length=len(gz_bytes),
+            content_type="application/gzip"
+        )
+
+    def download_json(self, object_name):
+        response = self.client.get_object(self.bucket, object_name)
+        try:
+            return json.load(response)
+        finally:
+            response.close()
+            response.release_conn()
+
+    def list_json(self, prefix):
+        """Loads every JSON object under prefix"""
+        return [
+            self.download_json(obj.object_name)
+            for obj in self.client.list_objects(self.bucket, prefix=prefix)
+        ]
+
+    def remove(self, object_name):
+        self.client.remove_object(self.bucket, object_name)
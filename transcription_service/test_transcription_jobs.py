@@ -0,0 +1,180 @@
+"""
+Transcription jobs against fake_assemblyai.py, with in-memory MinIO, RabbitMQ
+and Redis stand-ins. Run from this directory: python -m pytest
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import types
+import pytest
+import requests
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # common/
+for name, value in {"ASSEMBLYAI_API_KEY": "test", "RABBITMQ_USER": "test", "RABBITMQ_PASS": "test",
+                    "MINIO_ROOT_USER": "test", "MINIO_ROOT_PASSWORD": "test"}.items():
+    os.environ.setdefault(name, value)
+
+import fake_assemblyai
+import job_leases
+import main
+from transcript_tracker import TranscriptTracker
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def register_script(self, script):
+        def renew(keys, args):
+            return [key for key in keys if self.data.get(key) != args[0]]
+        def release(keys, args):
+            if self.data.get(keys[0]) == args[0]:
+                del self.data[keys[0]]
+        return renew if script == job_leases.JobLeases.RENEW_SCRIPT else release
+
+    def close(self):
+        pass
+
+class FakeMinio:
+    def __init__(self):
+        self.objects = {}
+
+    def presigned_url(self, object_name):
+        return f"http://minio.internal/{object_name}"
+
+    def stream_object(self, object_name, chunk_size):
+        yield b"audio"
+
+    def upload_json(self, data, object_name):
+        self.objects[object_name] = data
+
+    upload_json_gz = upload_json
+
+    def download_json(self, object_name):
+        return self.objects[object_name]
+
+    def list_json(self, prefix):
+        return [data for name, data in list(self.objects.items()) if name.startswith(prefix)]
+
+    def remove(self, object_name):
+        self.objects.pop(object_name, None)
+
+    def mark_failed(self, video_id, error):
+        self.objects[f"{video_id}-failed.json"] = {"error": str(error)}
+
+class FakeRabbitMQ:
+    def __init__(self):
+        self.published = []
+
+    def publish_event(self, message, queue_name=None):
+        self.published.append(message)
+
+class FakeChannel:
+    def __init__(self):
+        self.acks, self.nacks = [], []
+
+    def basic_ack(self, delivery_tag):
+        self.acks.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        self.nacks.append(delivery_tag)
+
+def start_fake_assemblyai(fail_presigned):
+    """Serves fake_assemblyai on a free port from a background loop; returns (base url, app)"""
+    app = fake_assemblyai.create_app(delay=0, fail_presigned=fail_presigned)
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return f"http://127.0.0.1:{port}", app
+
+@pytest.fixture
+def service(monkeypatch):
+    """Wires main's clients to the fakes; call it with fail_presigned to start the API"""
+    def start(fail_presigned=False):
+        base_url, app = start_fake_assemblyai(fail_presigned)
+        monkeypatch.setattr(main.settings, "ASSEMBLYAI_BASE_URL", base_url)
+        monkeypatch.setattr(main.settings, "AUDIO_SOURCE_MODE", "auto")
+        monkeypatch.setattr(main.settings, "TRACKER_POLL_MIN_INTERVAL", 0.05)
+        monkeypatch.setattr(main.settings, "TRACKER_POLL_MAX_INTERVAL", 0.1)
+        monkeypatch.setattr(main, "UPLOAD_URL", f"{base_url}/v2/upload")
+        monkeypatch.setattr(main, "TRANSCRIPT_URL", f"{base_url}/v2/transcript")
+        monkeypatch.setattr(job_leases.redis, "Redis", lambda **kwargs: FakeRedis())
+
+        monkeypatch.setattr(main, "minio", FakeMinio())
+        monkeypatch.setattr(main, "rabbitmq", FakeRabbitMQ())
+        monkeypatch.setattr(main, "leases", job_leases.JobLeases())
+        tracker = TranscriptTracker(main.on_transcript_completed, main.on_transcript_failed)
+        tracker.start()
+        monkeypatch.setattr(main, "tracker", tracker)
+        return types.SimpleNamespace(base_url=base_url, app=app)
+    return start
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+def job_record(transcript_id, video_id):
+    return {
+        "transcript_id": transcript_id, "audio_source": "upload", "user_id": "u1", "video_id": video_id,
+        "audio_filename": f"{video_id}.m4a", "offsets_filename": None, "urgency": "interactive"
+    }
+
+def test_resume_tracks_only_unclaimed_jobs(service):
+    api = service()
+    transcript_id = requests.post(f"{api.base_url}/v2/transcript", json={"audio_url": "https://cdn.fake-assemblyai.local/x"}).json()["id"]
+    main.minio.upload_json(job_record(transcript_id, "v1"), main.job_object(transcript_id))
+    # Another replica is still tracking this one
+    main.minio.upload_json(job_record("held", "v2"), main.job_object("held"))
+    main.leases.client.set(main.leases._key("held"), "other-replica")
+
+    main.resume_jobs()
+    assert "held" not in main.tracker.transcript_ids()
+
+    wait_for(lambda: main.rabbitmq.published)
+    assert [event["video_id"] for event in main.rabbitmq.published] == ["v1"]
+    assert main.minio.objects["v1.json"]["turns"]
+    wait_for(lambda: main.job_object(transcript_id) not in main.minio.objects)
+    wait_for(lambda: main.leases._key(transcript_id) not in main.leases.client.data) # released
+    assert main.job_object("held") in main.minio.objects
+    assert main.leases.client.data[main.leases._key("held")] == "other-replica"
+
+def test_renew_reports_leases_taken_over():
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(job_leases.redis, "Redis", lambda **kwargs: FakeRedis())
+        leases = job_leases.JobLeases()
+        assert leases.claim("a") and leases.claim("b")
+        assert not leases.claim("a")
+        leases.client.data[leases._key("b")] = "other-replica"
+        assert leases.renew(["a", "b"]) == ["b"]
+
+def test_failed_presigned_transcript_is_resubmitted_via_upload(service):
+    api = service(fail_presigned=True)
+    channel = FakeChannel()
+    body = json.dumps({"video_id": "v1", "audio_filename": "v1.m4a", "user_id": "u1"})
+
+    main.process_audio(channel, types.SimpleNamespace(delivery_tag=1), None, body)
+    assert channel.acks == [1]
+
+    wait_for(lambda: main.rabbitmq.published)
+    assert main.rabbitmq.published[0]["transcript_filename"] == "v1.json"
+    submitted = [audio_url for _, audio_url in api.app["transcripts"].values()]
+    assert submitted[0].startswith("http://minio.internal/") # presigned, failed
+    assert submitted[1].startswith(fake_assemblyai.CDN) # streamed through
+    assert "v1-failed.json" not in main.minio.objects
+    wait_for(lambda: not main.minio.list_json(main.settings.TRACKER_JOBS_PREFIX))
+    assert not main.leases.client.data
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import threading
+import aiohttp
+from config import settings
+
+logger = logging.getLogger("transcription_service")
+
+class TransientError(Exception):
+    pass
+
+class TranscriptTracker:
+    """
+    Follows every outstanding AssemblyAI transcript from one asyncio loop
+    running on a background thread, over a single pooled HTTP session.
+
+    Each transcript is polled with its own adaptive interval: it starts at
+    TRACKER_POLL_MIN_INTERVAL and grows by TRACKER_POLL_BACKOFF while the
+    transcript is still processing, up to TRACKER_POLL_MAX_INTERVAL.
+    on_complete(job, transcript) / on_error(job, error) run on a thread pool
+    so they may block (MinIO, RabbitMQ). If on_complete raises, the job is
+    retried on the next poll.
+    """
+    def __init__(self, on_complete, on_error):
+        self.on_complete = on_complete
+        self.on_error = on_error
+        self.loop = asyncio.new_event_loop()
+        self.session = None
+        self.tasks = {} # transcript_id -> polling task
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="transcript-tracker", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._started.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._open_session())
+        self._started.set()
+        self.loop.run_forever()
+
+    async def _open_session(self):
+        self.session = aiohttp.ClientSession(
+            headers={"authorization": settings.ASSEMBLYAI_API_KEY},
+            connector=aiohttp.TCPConnector(limit=settings.TRACKER_MAX_CONNECTIONS),
+            timeout=aiohttp.ClientTimeout(total=30)
+        )
+
+    def track(self, job: dict):
+        """Starts following job["transcript_id"]. Safe to call from any thread."""
+        asyncio.run_coroutine_threadsafe(self._track(job), self.loop).result()
+
+    def outstanding(self):
+        return len(self.tasks)
+
+    def transcript_ids(self):
+        """Transcripts being followed right now. Safe to call from any thread."""
+        return asyncio.run_coroutine_threadsafe(self._transcript_ids(), self.loop).result()
+
+    def untrack(self, transcript_id):
+        """Stops following a transcript (another replica took it over). Safe to call from any thread."""
+        asyncio.run_coroutine_threadsafe(self._untrack(transcript_id), self.loop).result()
+
+    async def _transcript_ids(self):
+        return list(self.tasks)
+
+    async def _untrack(self, transcript_id):
+        task = self.tasks.pop(transcript_id, None)
+        if task:
+            task.cancel()
+
+    async def _track(self, job):
+        transcript_id = job["transcript_id"]
+        if transcript_id not in self.tasks:
+            self.tasks[transcript_id] = self.loop.create_task(self._follow(job))
+
+    async def _fetch(self, transcript_id):
+        url = f"{settings.ASSEMBLYAI_BASE_URL}/v2/transcript/{transcript_id}"
+        try:
+            async with self.session.get(url) as response:
+                if response.status == 429 or response.status >= 500:
+                    raise TransientError(f"HTTP {response.status}")
+                response.raise_for_status()
+                return await response.json()
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            raise TransientError(str(e) or type(e).__name__)
+
+    async def _follow(self, job):
+        transcript_id = job["transcript_id"]
+        delay = settings.TRACKER_POLL_MIN_INTERVAL
+        try:
+            while True:
+                await asyncio.sleep(delay)
+                delay = min(delay * settings.TRACKER_POLL_BACKOFF, settings.TRACKER_POLL_MAX_INTERVAL)
+
+                try:
+                    result = await self._fetch(transcript_id)
+                except TransientError as e:
+                    logger.warning(f"Polling {transcript_id} failed ({e}); retrying in {delay:.0f}s")
+                    continue
+                except aiohttp.ClientResponseError as e:
+                    # Unknown transcript, bad key... polling again won't help
+                    await self._hand_off(self.on_error, job, Exception(f"Polling failed: HTTP {e.status} {e.message}"))
+                    return
+
+                status = result["status"]
+                if status == "completed":
+                    if await self._hand_off(self.on_complete, job, result):
+                        return
+                    delay = settings.TRACKER_POLL_MAX_INTERVAL
+                elif status == "error":
+                    await self._hand_off(self.on_error, job, Exception(f"Transcription failed: {result.get('error')}"))
+                    return
+        except Exception as e:
+            # Unexpected API response; the job record stays and is resumed on restart
+            logger.error(f"Stopped tracking {transcript_id}: {e}", exc_info=True)
+        finally:
+            self.tasks.pop(transcript_id, None)
+
+    async def _hand_off(self, callback, *args):
+        try:
+            await self.loop.run_in_executor(None, callback, *args)
+            return True
+        except Exception as e:
+            logger.error(f"Handling transcript {args[0]['transcript_id']} failed: {e}", exc_info=True)
+            return False
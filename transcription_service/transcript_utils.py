@@ -0,0 +1,73 @@
+import bisect
+
+# Bump when the compact transcript layout changes; readers check it
+TRANSCRIPT_FORMAT_VERSION = 1
+
+# Column order of each row in the word-timing sidecar
+WORD_FIELDS = ["start", "end", "speaker", "confidence", "text"]
+
+def time_mapper(offset_map):
+    """
+    Returns a function mapping a time in the (silence-trimmed) audio, in ms,
+    to seconds in the original video. Without an offset map it only converts units.
+    """
+    segments = (offset_map or {}).get("segments") or []
+    if not segments:
+        return lambda ms: round(ms / 1000, 3)
+
+    starts = [segment["trimmed_start"] for segment in segments]
+    def to_original(ms):
+        seconds = ms / 1000
+        segment = segments[max(bisect.bisect_right(starts, seconds) - 1, 0)]
+        return round(segment["original_start"] + (seconds - segment["trimmed_start"]), 3)
+    return to_original
+
+def normalize_transcript(raw, offset_map=None):
+    """
+    Splits an AssemblyAI transcript into:
+    - a compact transcript: speaker turns with start/end times (seconds, in
+      original video time), which is all the analysis stages read
+    - a word-timing sidecar: one row per word (see WORD_FIELDS), loaded only on demand
+    """
+    to_original = time_mapper(offset_map)
+
+    utterances = raw.get("utterances") or []
+    if not utterances and raw.get("text"):
+        # Diarization produced nothing; keep the text as a single turn
+        words = raw.get("words") or []
+        utterances = [{
+            "speaker": "A",
+            "text": raw["text"],
+            "start": words[0]["start"] if words else 0,
+            "end": words[-1]["end"] if words else int((raw.get("audio_duration") or 0) * 1000)
+        }]
+
+    turns = [
+        {
+            "speaker": utterance.get("speaker") or "A",
+            "start": to_original(utterance["start"]),
+            "end": to_original(utterance["end"]),
+            "text": utterance["text"].strip()
+        }
+        for utterance in utterances
+        if utterance.get("text", "").strip()
+    ]
+
+    duration = (offset_map or {}).get("original_duration") or raw.get("audio_duration")
+    transcript = {
+        "version": TRANSCRIPT_FORMAT_VERSION,
+        "transcript_id": raw.get("id"),
+        "duration": duration,
+        "speakers": sorted({turn["speaker"] for turn in turns}),
+        "turns": turns
+    }
+
+    words = {
+        "version": TRANSCRIPT_FORMAT_VERSION,
+        "fields": WORD_FIELDS,
+        "words": [
+            [to_original(word["start"]), to_original(word["end"]), word.get("speaker"), word.get("confidence"), word["text"]]
+            for word in raw.get("words") or []
+        ]
+    }
+    return transcript, words
@@ -0,0 +1,237 @@
+"""
+Bulk ingestion of historical sessions.
+
+Usage (inside the upload_service container):
+    python bulk_import.py --user-id clinic42 /import/sessions/          # directory
+    python bulk_import.py --user-id clinic42 /import/sessions.zip       # zip / tar / tar.gz archive
+    python bulk_import.py /import/manifest.csv                          # manifest (path,user_id[,original_name])
+
+Each video is streamed into MinIO with bounded parallelism, deduplicated by
+content hash, and the video_processing_queue events are published in
+confirmed batches. A per-file JSON report is written to stdout (or --report).
+Imported sessions are analyzed in batch mode (OpenAI Batch API) unless
+--urgency interactive is given.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import mimetypes
+import os
+import sys
+import tarfile
+import uuid
+import zipfile
+from minio_utils import MinioClient
+from rabbitmq_utils import RabbitMQClient
+from redis_utils import VideoHashIndex
+from mongo_utils import VideoLinks
+from dedup import claim_content, failure_marker
+from config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("bulk_import")
+
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".mkv", ".avi", ".webm", ".m4v", ".mpeg", ".mpg"}
+
+class ImportItem:
+    def __init__(self, source, original_name, user_id, opener, sequential=False):
+        self.source = source
+        self.original_name = original_name
+        self.user_id = user_id
+        self.opener = opener # Returns a readable binary stream for this item
+        self.sequential = sequential # Must be read before the next item is collected (tar stream)
+
+def _is_video(name):
+    return os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS
+
+def _open_file(path):
+    return lambda: open(path, "rb")
+
+def _open_zip_member(archive_path, member):
+    def opener():
+        # Every worker gets its own handle, so members can be read in parallel
+        archive = zipfile.ZipFile(archive_path)
+        stream = archive.open(member)
+        stream.close_archive = archive.close
+        return stream
+    return opener
+
+def collect_items(path, user_id):
+    """Expands a directory, archive or manifest into the videos to import"""
+    if os.path.isdir(path):
+        for root, _, files in os.walk(path):
+            for name in sorted(files):
+                if _is_video(name):
+                    full_path = os.path.join(root, name)
+                    yield ImportItem(full_path, name, user_id, _open_file(full_path))
+
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.namelist():
+                if _is_video(member):
+                    yield ImportItem(f"{path}:{member}", os.path.basename(member), user_id,
+                                     _open_zip_member(path, member))
+
+    elif tarfile.is_tarfile(path):
+        # One sequential pass: opening a member of a compressed tar on its own
+        # decompresses everything before it, so each member is read as it comes by
+        with tarfile.open(path, "r|*") as archive:
+            for member in archive:
+                if member.isfile() and _is_video(member.name):
+                    stream = archive.extractfile(member)
+                    yield ImportItem(f"{path}:{member.name}", os.path.basename(member.name), user_id,
+                                     lambda stream=stream: stream, sequential=True)
+
+    elif path.endswith(".csv"):
+        base_dir = os.path.dirname(path)
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                yield _manifest_item(row, base_dir, user_id)
+
+    elif path.endswith(".json") or path.endswith(".jsonl"):
+        base_dir = os.path.dirname(path)
+        with open(path) as f:
+            rows = json.load(f) if path.endswith(".json") else [json.loads(line) for line in f if line.strip()]
+        for row in rows:
+            yield _manifest_item(row, base_dir, user_id)
+
+    else:
+        raise ValueError(f"Unsupported source: {path}")
+
+def _manifest_item(row, base_dir, default_user_id):
+    file_path = os.path.join(base_dir, row["path"])
+    user_id = row.get("user_id") or default_user_id
+    if not user_id:
+        raise ValueError(f"No user_id for {row['path']} (add a column or pass --user-id)")
+    original_name = row.get("original_name") or os.path.basename(file_path)
+    return ImportItem(file_path, original_name, user_id, _open_file(file_path))
+
+def upload_item(item, minio, hash_index, links, urgency):
+    """Streams one video into MinIO. Returns (report_row, event or None)"""
+    video_id = str(uuid.uuid4())
+    file_ext = item.original_name.split(".")[-1]
+    new_filename = f"{video_id}.{file_ext}"
+    content_type = mimetypes.guess_type(item.original_name)[0] or "video/mp4"
+
+    stream = item.opener()
+    try:
+        sha256 = minio.upload_stream(stream, new_filename, content_type)
+    finally:
+        stream.close()
+        if hasattr(stream, "close_archive"):
+            stream.close_archive()
+
+    existing_id = claim_content(sha256, video_id, item.user_id, minio, hash_index, links)
+    if existing_id:
+        minio.remove(new_filename)
+        return {"source": item.source, "status": "duplicate", "video_id": existing_id}, None
+
+    event = {
+        "user_id": item.user_id,
+        "video_id": video_id,
+        "filename": new_filename,
+        "original_name": item.original_name,
+        "urgency": urgency,
+        "audio_profile": settings.audio_profile(urgency),
+        "status": "uploaded"
+    }
+    return {"source": item.source, "status": "queued", "video_id": video_id}, event
+
+async def run_import(items, concurrency, batch_size, urgency):
+    minio = MinioClient()
+    hash_index = VideoHashIndex()
+    links = VideoLinks()
+    rabbitmq = RabbitMQClient()
+    await rabbitmq.connect()
+
+    semaphore = asyncio.Semaphore(concurrency)
+    report = []
+    pending_events = []
+    pending_rows = []
+
+    async def flush():
+        batch, rows = pending_events[:], pending_rows[:]
+        pending_events.clear()
+        pending_rows.clear()
+        errors = await rabbitmq.publish_batch(batch)
+        for row, error in zip(rows, errors):
+            if error is None:
+                continue # Confirmed
+            row["status"] = "failed"
+            row["error"] = f"Uploaded but not queued: {error}"
+            # Importing the file again then re-runs the pipeline instead of deduplicating
+            await asyncio.to_thread(minio.put_json, {"video_id": row["video_id"], "error": str(error)}, failure_marker(row["video_id"]))
+
+    async def import_one(item):
+        async with semaphore:
+            try:
+                row, event = await asyncio.to_thread(upload_item, item, minio, hash_index, links, urgency)
+            except Exception as e:
+                logger.error(f"Failed to import {item.source}: {e}")
+                row, event = {"source": item.source, "status": "failed", "error": str(e)}, None
+
+        report.append(row)
+        logger.info(f"[{len(report)}] {row['status']}: {item.source}")
+        if event:
+            pending_events.append(event)
+            pending_rows.append(row)
+            if len(pending_events) >= batch_size:
+                await flush()
+
+    try:
+        tasks = []
+        items = iter(items)
+        while True:
+            # Collecting may read through an archive; keep it off the event loop
+            item = await asyncio.to_thread(next, items, None)
+            if item is None:
+                break
+            if item.sequential:
+                await import_one(item) # its stream is only valid until the next item
+            else:
+                tasks.append(asyncio.create_task(import_one(item)))
+        await asyncio.gather(*tasks)
+        if pending_events:
+            await flush()
+    finally:
+        await rabbitmq.close()
+        hash_index.close()
+        links.close()
+
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-import session videos")
+    parser.add_argument("source", help="Directory, zip/tar archive, or .csv/.json/.jsonl manifest")
+    parser.add_argument("--user-id", help="Owner of the videos (manifests may set it per row)")
+    parser.add_argument("--concurrency", type=int, default=settings.BULK_IMPORT_CONCURRENCY)
+    parser.add_argument("--batch-size", type=int, default=settings.RABBITMQ_CONFIRM_BATCH_SIZE)
+    parser.add_argument("--urgency", choices=["batch", "interactive"], default="batch",
+                        help="batch (default) sends the analyses through the OpenAI Batch API")
+    parser.add_argument("--report", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    # Manifests may name the owner per row; everything else needs --user-id
+    if args.user_id is None and not args.source.endswith((".csv", ".json", ".jsonl")):
+        parser.error("--user-id is required for directories and archives")
+
+    # Items are collected while importing: tar members are streamed in one pass
+    logger.info(f"Importing videos from {args.source}...")
+    items = collect_items(args.source, args.user_id)
+    report = asyncio.run(run_import(items, args.concurrency, args.batch_size, args.urgency))
+
+    output = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    failed = sum(1 for row in report if row["status"] == "failed")
+    logger.info(f"Done: {len(report) - failed} imported, {failed} failed")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
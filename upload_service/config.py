@@ -10,12 +10,45 @@ class Settings(BaseSettings):
     RABBITMQ_PORT: int = 5672
     RABBITMQ_USER: str
     RABBITMQ_PASS: str
+    RABBITMQ_CONNECTION_POOL_SIZE: int = 2
+    RABBITMQ_CHANNEL_POOL_SIZE: int = 4
+    RABBITMQ_MAX_IN_FLIGHT: int = 1000 # Queued-but-unconfirmed messages before publishers wait
+    RABBITMQ_CONFIRM_BATCH_SIZE: int = 100
+    RABBITMQ_PUBLISH_RETRIES: int = 5
+    RABBITMQ_CLOSE_TIMEOUT_SECONDS: float = 30.0 # Longest shutdown waits for queued messages
 
     # MinIO Settings
     MINIO_ENDPOINT: str = "minio_storage:9000" # Matches docker service name
     MINIO_ROOT_USER: str
     MINIO_ROOT_PASSWORD: str
     MINIO_BUCKET_NAME: str = "therapy-videos"
+    MINIO_PART_SIZE: int = 16 * 1024 * 1024 # Multipart chunk size for streamed uploads (min 5 MiB)
+
+    # Redis (content-hash index for deduplication)
+    REDIS_HOST: str = "redis"
+    REDIS_PORT: int = 6379
+
+    # MongoDB (links from users to videos they uploaded as duplicates)
+    MONGO_URI: str = "mongodb://mongo:27017"
+
+    # Resumable uploads
+    UPLOAD_SESSION_PREFIX: str = "_upload_sessions/" # Session manifests live next to the videos
+
+    # Direct-to-MinIO uploads (presigned URLs)
+    MINIO_PUBLIC_ENDPOINT: str = "localhost:9000" # Host clients use to reach MinIO
+    MINIO_REGION: str = "us-east-1"
+    PRESIGNED_URL_EXPIRY_SECONDS: int = 3600
+    PRESIGNED_RECONCILE_SECONDS: int = 60 # Sweep for uploads whose notification was missed
+
+    # Bulk import
+    BULK_IMPORT_CONCURRENCY: int = 4 # Videos streamed into MinIO at once
+
+    # Audio extraction profile per pipeline (sent as audio_profile with every upload event)
+    AUDIO_PROFILE_INTERACTIVE: str = "source" # Stream copy: the transcript starts sooner
+    AUDIO_PROFILE_BATCH: str = "speech_opus" # Imports and backfills: smallest audio objects, no one is waiting
+
+    def audio_profile(self, urgency):
+        return self.AUDIO_PROFILE_BATCH if urgency == "batch" else self.AUDIO_PROFILE_INTERACTIVE
 
     class Config:
         env_file = ".env" # It will look for .env in the root when running via Docker
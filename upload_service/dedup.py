@@ -0,0 +1,21 @@
+def failure_marker(video_id: str):
+    """Written next to the video by the pipeline stage that gave up on it"""
+    return f"{video_id}-failed.json"
+
+def claim_content(sha256: str, video_id: str, user_id: str, minio, hash_index, links):
+    """
+    Registers video_id as the owner of this content. Returns None when the
+    pipeline should run for it, otherwise the video_id that already owns it.
+
+    - A different upload owns it: the uploader is linked to that video so it
+      shows up in their /my-videos.
+    - The owner's pipeline failed: this upload takes over and runs it again.
+    """
+    existing_id = hash_index.claim(sha256, video_id)
+    while existing_id and existing_id != video_id:
+        if minio.get_json(failure_marker(existing_id)) is None:
+            links.link(user_id, existing_id)
+            return existing_id
+        # Concurrent re-uploads race here; the loser links to the winner
+        existing_id = hash_index.replace(sha256, existing_id, video_id)
+    return None
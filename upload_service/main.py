@@ -1,10 +1,15 @@
 import logging
 import uuid
 import time
-from fastapi import FastAPI, UploadFile, HTTPException, Form, File
+from fastapi import FastAPI, UploadFile, HTTPException, Form, File, Request
+from fastapi.concurrency import run_in_threadpool
 from contextlib import asynccontextmanager
 from minio_utils import MinioClient
 from rabbitmq_utils import RabbitMQClient
+from redis_utils import VideoHashIndex, PendingDirectUploads
+from mongo_utils import VideoLinks
+from dedup import claim_content, failure_marker
+from config import settings
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
@@ -13,31 +18,104 @@ logger = logging.getLogger("upload_service")
 # Global clients
 minio_client = None
 rabbitmq_client = None
+hash_index = None
+pending_uploads = None
+video_links = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global minio_client, rabbitmq_client
-    
+    global minio_client, rabbitmq_client, hash_index, pending_uploads, video_links
+
     logger.info("Waiting for infrastructure to be ready...")
-    time.sleep(5) 
-    
+    time.sleep(5)
+
     minio_client = MinioClient()
     rabbitmq_client = RabbitMQClient()
-    
+    await rabbitmq_client.connect()
+    hash_index = VideoHashIndex()
+    pending_uploads = PendingDirectUploads()
+    video_links = VideoLinks()
+
     logger.info("Infrastructure connected successfully.")
     yield
-    
+
     # Cleanup
     if rabbitmq_client:
-        rabbitmq_client.close()
+        await rabbitmq_client.close()
+    if hash_index:
+        hash_index.close()
+    if pending_uploads:
+        pending_uploads.close()
+    if video_links:
+        video_links.close()
 
 app = FastAPI(lifespan=lifespan)
 
+# "interactive" sessions are analyzed right away; "batch" ones (backfills, overnight
+# imports) go through the cheaper, slower OpenAI Batch API in the analyzer
+URGENCY_LEVELS = ("interactive", "batch")
+
+def check_urgency(urgency: str):
+    if urgency not in URGENCY_LEVELS:
+        raise HTTPException(status_code=400, detail=f"urgency must be one of: {', '.join(URGENCY_LEVELS)}")
+
+async def publish_uploaded(user_id: str, video_id: str, filename: str, original_name: str, urgency: str):
+    """Kicks off the pipeline for a video that is fully stored in MinIO"""
+    event = {
+        "user_id": user_id,
+        "video_id": video_id,
+        "filename": filename,
+        "original_name": original_name,
+        "urgency": urgency,
+        "audio_profile": settings.audio_profile(urgency),
+        "status": "uploaded"
+    }
+    try:
+        await rabbitmq_client.publish_event(event, wait_for_confirm=True)
+    except Exception as e:
+        logger.error(f"Could not queue {video_id}: {e}")
+        # The video is stored and owns its hash; mark it failed so uploading it again re-runs the pipeline
+        await run_in_threadpool(minio_client.put_json, {"video_id": video_id, "error": str(e)}, failure_marker(video_id))
+        raise HTTPException(status_code=503, detail="Upload stored but the pipeline could not be started; please retry")
+
+    logger.info(f"Successfully uploaded and queued: {video_id}")
+
+    return {
+        "message": "Upload successful",
+        "user_id": user_id,
+        "video_id": video_id,
+        "status": "processing_started"
+    }
+
+async def finish_upload(user_id: str, video_id: str, filename: str, original_name: str, sha256: str, urgency: str):
+    """
+    Starts the pipeline, unless identical content was uploaded before.
+    Duplicates are linked to the existing video_id (and its audio, transcript
+    and analysis) and the redundant copy is dropped; if that video's pipeline
+    failed, this upload runs it again instead.
+    """
+    existing_id = await run_in_threadpool(
+        claim_content, sha256, video_id, user_id, minio_client, hash_index, video_links
+    )
+    if existing_id:
+        await run_in_threadpool(minio_client.remove, filename)
+        logger.info(f"Upload {video_id} is a duplicate of {existing_id}. Skipping pipeline.")
+        return {
+            "message": "Identical video already uploaded",
+            "user_id": user_id,
+            "video_id": existing_id,
+            "duplicate_of": existing_id,
+            "status": "duplicate"
+        }
+
+    return await publish_uploaded(user_id, video_id, filename, original_name, urgency)
+
 @app.post("/upload")
-async def upload_video(user_id: str = Form(...), file: UploadFile = File(...)):
+async def upload_video(user_id: str = Form(...), file: UploadFile = File(...), urgency: str = Form("interactive")):
     # Validation
     if not file.content_type.startswith("video/"):
         raise HTTPException(status_code=400, detail="File must be a video")
+    check_urgency(urgency)
 
     # Generate unique ID
     session_id = str(uuid.uuid4())
@@ -46,27 +124,201 @@ async def upload_video(user_id: str = Form(...), file: UploadFile = File(...)):
 
     logger.info(f"Starting process for User: {user_id}, Session: {session_id}")
 
-    # Read content
-    content = await file.read()
-    
-    # Upload to MinIO
-    minio_client.upload_file(content, new_filename, file.content_type)
-    
+    # Stream the spooled upload to MinIO in parts (hashing as we go), off the event loop
+    sha256 = await run_in_threadpool(minio_client.upload_stream, file.file, new_filename, file.content_type)
+
     # Publish Event
-    event = {
+    return await finish_upload(user_id, session_id, new_filename, file.filename, sha256, urgency)
+
+# --- Resumable chunked uploads ---
+# 1. POST   /uploads                        -> create session
+# 2. PUT    /uploads/{id}/chunks/{n}        -> send chunk n (1-based, CHUNK_SIZE bytes except the last)
+# 3. GET    /uploads/{id}                   -> which chunks arrived / resume offset
+# 4. POST   /uploads/{id}/complete          -> assemble parts and start the pipeline
+# Chunks can also go straight to MinIO: GET /uploads/{id}/chunks/{n}/url returns a presigned part URL.
+
+def _session_object(upload_session_id: str):
+    return f"{settings.UPLOAD_SESSION_PREFIX}{upload_session_id}.json"
+
+async def _load_session(upload_session_id: str):
+    session = await run_in_threadpool(minio_client.get_json, _session_object(upload_session_id))
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+def _progress(session: dict, parts):
+    """Offset is the length of the contiguous prefix of received chunks"""
+    offset = 0
+    next_part = 1
+    for part in parts:
+        if part.part_number != next_part:
+            break
+        offset += part.size
+        next_part += 1
+
+    return {
+        "upload_id": session["video_id"],
+        "chunk_size": session["chunk_size"],
+        "received_parts": [p.part_number for p in parts],
+        "next_part": next_part,
+        "offset": offset
+    }
+
+@app.post("/uploads")
+async def create_upload_session(
+    user_id: str = Form(...),
+    filename: str = Form(...),
+    content_type: str = Form(...),
+    urgency: str = Form("interactive")
+):
+    if not content_type.startswith("video/"):
+        raise HTTPException(status_code=400, detail="File must be a video")
+    check_urgency(urgency)
+
+    video_id = str(uuid.uuid4())
+    file_ext = filename.split(".")[-1]
+    new_filename = f"{video_id}.{file_ext}"
+
+    multipart_id = await run_in_threadpool(minio_client.start_multipart, new_filename, content_type)
+    session = {
         "user_id": user_id,
-        "video_id": session_id,
+        "video_id": video_id,
         "filename": new_filename,
-        "original_name": file.filename,
-        "status": "uploaded"
+        "original_name": filename,
+        "content_type": content_type,
+        "urgency": urgency,
+        "multipart_id": multipart_id,
+        "chunk_size": settings.MINIO_PART_SIZE
     }
-    rabbitmq_client.publish_event(event)
-    
-    logger.info(f"Successfully uploaded and queued: {session_id}")
+    await run_in_threadpool(minio_client.put_json, session, _session_object(video_id))
+
+    logger.info(f"Opened upload session for User: {user_id}, Session: {video_id}")
+    return {"upload_id": video_id, "chunk_size": settings.MINIO_PART_SIZE}
+
+@app.put("/uploads/{upload_id}/chunks/{part_number}")
+async def upload_chunk(upload_id: str, part_number: int, request: Request):
+    if not 1 <= part_number <= 10000:
+        raise HTTPException(status_code=400, detail="Chunk number must be between 1 and 10000")
+
+    session = await _load_session(upload_id)
+
+    # Read at most one chunk; anything larger is a client error
+    data = bytearray()
+    async for piece in request.stream():
+        data.extend(piece)
+        if len(data) > session["chunk_size"]:
+            raise HTTPException(status_code=413, detail=f"Chunk exceeds {session['chunk_size']} bytes")
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty chunk")
 
+    # Re-sending a chunk simply replaces that part
+    etag = await run_in_threadpool(
+        minio_client.upload_part, session["filename"], session["multipart_id"], part_number, bytes(data)
+    )
+    return {"upload_id": upload_id, "part_number": part_number, "size": len(data), "etag": etag}
+
+@app.get("/uploads/{upload_id}/chunks/{part_number}/url")
+async def get_chunk_upload_url(upload_id: str, part_number: int):
+    if not 1 <= part_number <= 10000:
+        raise HTTPException(status_code=400, detail="Chunk number must be between 1 and 10000")
+
+    session = await _load_session(upload_id)
+    url = minio_client.presigned_part_url(session["filename"], session["multipart_id"], part_number)
     return {
-        "message": "Upload successful", 
+        "upload_id": upload_id,
+        "part_number": part_number,
+        "url": url,
+        "expires_in": settings.PRESIGNED_URL_EXPIRY_SECONDS
+    }
+
+@app.get("/uploads/{upload_id}")
+async def get_upload_status(upload_id: str):
+    session = await _load_session(upload_id)
+    if session.get("assembled"):
+        return {"upload_id": upload_id, "status": "assembled"} # Completing; POST /complete again to retry
+    parts = await run_in_threadpool(minio_client.list_parts, session["filename"], session["multipart_id"])
+    return _progress(session, parts)
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str):
+    """
+    Assembles the parts and starts the pipeline. Safe to retry: the manifest
+    records that the parts were assembled and is only deleted once the
+    pipeline event is published.
+    """
+    session = await _load_session(upload_id)
+    retry = session.get("assembled", False)
+    if not retry:
+        parts = await run_in_threadpool(minio_client.list_parts, session["filename"], session["multipart_id"])
+
+        # Every chunk but the last must be present and full-sized
+        progress = _progress(session, parts)
+        if not parts or progress["next_part"] - 1 != len(parts):
+            raise HTTPException(status_code=409, detail={"message": "Missing chunks", **progress})
+        if any(p.size != session["chunk_size"] for p in parts[:-1]):
+            raise HTTPException(status_code=409, detail={"message": "Only the last chunk may be short", **progress})
+
+        await run_in_threadpool(minio_client.complete_multipart, session["filename"], session["multipart_id"], parts)
+        session["assembled"] = True
+        await run_in_threadpool(minio_client.put_json, session, _session_object(upload_id))
+
+    # Chunks may arrive out of order or be resent, so hash the assembled object
+    sha256 = await run_in_threadpool(minio_client.hash_object, session["filename"])
+
+    result = await finish_upload(
+        session["user_id"], upload_id, session["filename"], session["original_name"], sha256,
+        session.get("urgency", "interactive")
+    )
+    if retry:
+        # Queued now; a failed earlier attempt may have marked the video failed
+        await run_in_threadpool(minio_client.remove, failure_marker(upload_id))
+    await run_in_threadpool(minio_client.remove, _session_object(upload_id))
+    return result
+
+@app.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    session = await _load_session(upload_id)
+    if session.get("assembled"):
+        await run_in_threadpool(minio_client.remove, session["filename"])
+    else:
+        await run_in_threadpool(minio_client.abort_multipart, session["filename"], session["multipart_id"])
+    await run_in_threadpool(minio_client.remove, _session_object(upload_id))
+    return {"upload_id": upload_id, "status": "aborted"}
+
+# --- Direct-to-MinIO uploads ---
+# The client PUTs the video to the presigned URL; notification_listener.py
+# turns MinIO's object-created event into the video_processing_queue event.
+
+@app.post("/uploads/presigned")
+async def create_presigned_upload(
+    user_id: str = Form(...),
+    filename: str = Form(...),
+    content_type: str = Form(...),
+    urgency: str = Form("interactive")
+):
+    if not content_type.startswith("video/"):
+        raise HTTPException(status_code=400, detail="File must be a video")
+    check_urgency(urgency)
+
+    video_id = str(uuid.uuid4())
+    file_ext = filename.split(".")[-1]
+    new_filename = f"{video_id}.{file_ext}"
+
+    await run_in_threadpool(pending_uploads.add, new_filename, {
         "user_id": user_id,
-        "video_id": session_id,
-        "status": "processing_started"
-    }
\ No newline at end of file
+        "video_id": video_id,
+        "filename": new_filename,
+        "original_name": filename,
+        "urgency": urgency
+    })
+    url = minio_client.presigned_put_url(new_filename)
+
+    logger.info(f"Issued presigned upload for User: {user_id}, Session: {video_id}")
+    return {
+        "user_id": user_id,
+        "video_id": video_id,
+        "method": "PUT",
+        "url": url,
+        "headers": {"Content-Type": content_type},
+        "expires_in": settings.PRESIGNED_URL_EXPIRY_SECONDS
+    }
@@ -1,7 +1,26 @@
 from minio import Minio
+from datetime import timedelta
+from minio.datatypes import Part
+from minio.error import S3Error
 import io
+import json
+import hashlib
 from config import settings
 
+class HashingReader:
+    """File-like wrapper that feeds every byte read through SHA-256"""
+    def __init__(self, stream):
+        self.stream = stream
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.sha256.update(data)
+        return data
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
 class MinioClient:
     def __init__(self):
         self.client = Minio(
@@ -13,6 +32,16 @@ class MinioClient:
         self.bucket = settings.MINIO_BUCKET_NAME
         self._ensure_bucket_exists()
 
+        # Presigned URLs are signed for the host the client will talk to.
+        # A fixed region keeps signing local (no lookup round-trip).
+        self.public_client = Minio(
+            settings.MINIO_PUBLIC_ENDPOINT,
+            access_key=settings.MINIO_ROOT_USER,
+            secret_key=settings.MINIO_ROOT_PASSWORD,
+            secure=False,
+            region=settings.MINIO_REGION
+        )
+
     def _ensure_bucket_exists(self):
         if not self.client.bucket_exists(self.bucket):
             self.client.make_bucket(self.bucket)
@@ -26,4 +55,130 @@ class MinioClient:
             length=len(file_data),
             content_type=content_type
         )
-        return filename
\ No newline at end of file
+        return filename
+
+    def upload_stream(self, file_stream, filename: str, content_type: str):
+        """
+        Streams a file-like object to MinIO as a multipart upload.
+        Parts are sent sequentially so only one part (MINIO_PART_SIZE)
+        is held in memory at a time. Returns the SHA-256 of the content.
+        """
+        reader = HashingReader(file_stream)
+        self.client.put_object(
+            self.bucket,
+            filename,
+            reader,
+            length=-1,
+            part_size=settings.MINIO_PART_SIZE,
+            num_parallel_uploads=1,
+            content_type=content_type
+        )
+        return reader.hexdigest()
+
+    def hash_object(self, filename: str):
+        """SHA-256 of a stored object, streamed part by part"""
+        sha256 = hashlib.sha256()
+        response = self.client.get_object(self.bucket, filename)
+        try:
+            for data in response.stream(settings.MINIO_PART_SIZE):
+                sha256.update(data)
+        finally:
+            response.close()
+            response.release_conn()
+        return sha256.hexdigest()
+
+    # --- Chunked (resumable) uploads ---
+    # Each chunk maps 1:1 onto a MinIO multipart part, so MinIO itself is the
+    # source of truth for what has been received.
+    # The SDK only exposes multipart uploads through these private methods;
+    # requirements.txt pins the minio version they were written against.
+
+    def start_multipart(self, filename: str, content_type: str):
+        return self.client._create_multipart_upload(
+            self.bucket, filename, {"Content-Type": content_type}
+        )
+
+    def upload_part(self, filename: str, upload_id: str, part_number: int, data: bytes):
+        return self.client._upload_part(
+            self.bucket, filename, data, None, upload_id, part_number
+        )
+
+    def list_parts(self, filename: str, upload_id: str):
+        parts = []
+        marker = None
+        while True:
+            result = self.client._list_parts(
+                self.bucket, filename, upload_id, part_number_marker=marker
+            )
+            parts.extend(result.parts)
+            if not result.is_truncated:
+                return sorted(parts, key=lambda p: p.part_number)
+            marker = result.next_part_number_marker
+
+    def complete_multipart(self, filename: str, upload_id: str, parts):
+        self.client._complete_multipart_upload(
+            self.bucket,
+            filename,
+            upload_id,
+            [Part(p.part_number, p.etag) for p in parts]
+        )
+        return filename
+
+    def abort_multipart(self, filename: str, upload_id: str):
+        self.client._abort_multipart_upload(self.bucket, filename, upload_id)
+
+    # --- Presigned (direct-to-MinIO) uploads ---
+
+    def presigned_put_url(self, filename: str):
+        return self.public_client.presigned_put_object(
+            self.bucket,
+            filename,
+            expires=timedelta(seconds=settings.PRESIGNED_URL_EXPIRY_SECONDS)
+        )
+
+    def presigned_part_url(self, filename: str, upload_id: str, part_number: int):
+        return self.public_client.get_presigned_url(
+            "PUT",
+            self.bucket,
+            filename,
+            expires=timedelta(seconds=settings.PRESIGNED_URL_EXPIRY_SECONDS),
+            extra_query_params={"uploadId": upload_id, "partNumber": str(part_number)}
+        )
+
+    def listen_for_uploads(self):
+        """Blocking iterator over object-created notifications for the bucket"""
+        return self.client.listen_bucket_notification(
+            self.bucket, events=("s3:ObjectCreated:*",)
+        )
+
+    # --- Small JSON records (upload session manifests) ---
+
+    def put_json(self, data: dict, object_name: str):
+        json_bytes = json.dumps(data).encode("utf-8")
+        self.upload_file(json_bytes, object_name, "application/json")
+
+    def get_json(self, object_name: str):
+        """Returns the parsed object, or None if it does not exist"""
+        try:
+            response = self.client.get_object(self.bucket, object_name)
+        except S3Error as e:
+            if e.code == "NoSuchKey":
+                return None
+            raise
+        try:
+            return json.load(response)
+        finally:
+            response.close()
+            response.release_conn()
+
+    def exists(self, object_name: str):
+        try:
+            self.client.stat_object(self.bucket, object_name)
+            return True
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchObject"):
+                return False
+            raise
+
+    def remove(self, object_name: str):
+        self.client.remove_object(self.bucket, object_name)
@@ -0,0 +1,24 @@
+from datetime import datetime, timezone
+from pymongo import ASCENDING, MongoClient
+from config import settings
+
+class VideoLinks:
+    """
+    Videos a user uploaded that turned out to be duplicates of someone else's.
+    The query service lists them in /my-videos next to the user's own analyses.
+    """
+    def __init__(self):
+        self.client = MongoClient(settings.MONGO_URI, serverSelectionTimeoutMS=5000)
+        self.collection = self.client["therapy_db"]["video_links"]
+        self.collection.create_index([("user_id", ASCENDING), ("video_id", ASCENDING)], unique=True)
+
+    def link(self, user_id: str, video_id: str):
+        # Upsert: uploading the same file again keeps the original link time
+        self.collection.update_one(
+            {"user_id": user_id, "video_id": video_id},
+            {"$setOnInsert": {"created_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    def close(self):
+        self.client.close()
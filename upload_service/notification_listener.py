@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from urllib.parse import unquote_plus
+from minio_utils import MinioClient
+from rabbitmq_utils import RabbitMQClient
+from redis_utils import PendingDirectUploads
+from config import settings
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("upload_listener")
+
+async def publish_pending(object_name, pending, rabbitmq):
+    # Only presigned uploads are pending; everything else was published by the API.
+    # Claiming is atomic, so the stream and the sweep never both publish an upload.
+    upload = await asyncio.to_thread(pending.claim, object_name)
+    if upload is None:
+        return False
+
+    event = {**upload, "audio_profile": settings.audio_profile(upload.get("urgency")), "status": "uploaded"}
+    try:
+        await rabbitmq.publish_event(event, wait_for_confirm=True)
+    except BaseException:
+        # Not confirmed: keep the record so the sweep publishes it (if we crash, the lease expires)
+        await asyncio.to_thread(pending.release, object_name)
+        raise
+    await asyncio.to_thread(pending.done, object_name)
+    logger.info(f"Direct upload received and queued: {upload['video_id']}")
+    return True
+
+async def handle_notification(notification, pending, rabbitmq):
+    for record in notification.get("Records", []):
+        object_name = unquote_plus(record["s3"]["object"]["key"])
+        await publish_pending(object_name, pending, rabbitmq)
+
+async def reconcile(minio, pending, rabbitmq):
+    """
+    The notification stream is not durable: events sent while no listener was
+    connected are lost. Publish every pending upload whose object already exists.
+    """
+    published = 0
+    for object_name in await asyncio.to_thread(pending.object_names):
+        if await asyncio.to_thread(minio.exists, object_name):
+            published += await publish_pending(object_name, pending, rabbitmq)
+    if published:
+        logger.info(f"Reconciled {published} direct uploads with missed notifications")
+
+async def reconcile_forever(minio, pending, rabbitmq):
+    while True:
+        try:
+            await reconcile(minio, pending, rabbitmq)
+        except Exception as e:
+            logger.error(f"Reconciliation sweep failed: {e}", exc_info=True)
+        await asyncio.sleep(settings.PRESIGNED_RECONCILE_SECONDS)
+
+async def listen():
+    minio = MinioClient()
+    rabbitmq = RabbitMQClient()
+    await rabbitmq.connect()
+    pending = PendingDirectUploads()
+
+    # Catches uploads that finished while the listener was down, then anything the stream drops
+    sweeper = asyncio.create_task(reconcile_forever(minio, pending, rabbitmq))
+
+    while True:
+        try:
+            logger.info(f"Listening for uploads in bucket '{minio.bucket}'...")
+            with minio.listen_for_uploads() as notifications:
+                while True:
+                    # The notification stream is blocking; read it off the event loop
+                    notification = await asyncio.to_thread(next, notifications)
+                    await handle_notification(notification, pending, rabbitmq)
+        except Exception as e:
+            # The notification stream is a long-lived HTTP response; reconnect on drop
+            logger.error(f"Notification stream failed: {e}", exc_info=True)
+            await asyncio.sleep(5)
+
+if __name__ == "__main__":
+    asyncio.run(listen())
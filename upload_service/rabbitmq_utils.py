@@ -1,43 +1,132 @@
-import pika
+import asyncio
 import json
+import logging
+import aio_pika
+from aio_pika.pool import Pool
 from config import settings
 
+logger = logging.getLogger("upload_service")
+
 class RabbitMQClient:
+    """
+    asyncio publisher for the upload service.
+
+    publish_event() only enqueues the message; background workers drain the
+    queue in batches, publish each batch on a pooled channel with publisher
+    confirms and await all of the batch's confirms together. The queue is
+    bounded, so at most RABBITMQ_MAX_IN_FLIGHT messages wait for the broker
+    and callers are slowed down (not failed) when it is full. Robust
+    connections reconnect automatically.
+    """
     def __init__(self):
-        self.connection = None
-        self.channel = None
+        self.connection_pool = None
+        self.channel_pool = None
+        self.queue = None
+        self.workers = []
+
+    async def connect(self):
+        self.connection_pool = Pool(self._get_connection, max_size=settings.RABBITMQ_CONNECTION_POOL_SIZE)
+        self.channel_pool = Pool(self._get_channel, max_size=settings.RABBITMQ_CHANNEL_POOL_SIZE)
+        self.queue = asyncio.Queue(maxsize=settings.RABBITMQ_MAX_IN_FLIGHT)
 
-    def _connect(self):
-       
-        credentials = pika.PlainCredentials(settings.RABBITMQ_USER, settings.RABBITMQ_PASS)
-        parameters = pika.ConnectionParameters(
+        async with self.channel_pool.acquire() as channel:
+            await channel.declare_queue('video_processing_queue', durable=True)
+
+        self.workers = [
+            asyncio.create_task(self._publish_batches())
+            for _ in range(settings.RABBITMQ_CHANNEL_POOL_SIZE)
+        ]
+        logger.info("Connected to RabbitMQ")
+
+    async def _get_connection(self):
+        return await aio_pika.connect_robust(
             host=settings.RABBITMQ_HOST,
             port=settings.RABBITMQ_PORT,
-            credentials=credentials,
-            heartbeat=600,
-            blocked_connection_timeout=300
+            login=settings.RABBITMQ_USER,
+            password=settings.RABBITMQ_PASS,
+            heartbeat=600
         )
-        self.connection = pika.BlockingConnection(parameters)
-        self.channel = self.connection.channel()
-        self.channel.queue_declare(queue='video_processing_queue', durable=True)
-        print("Connected to RabbitMQ")
 
-    def publish_event(self, message: dict):
+    async def _get_channel(self):
+        async with self.connection_pool.acquire() as connection:
+            return await connection.channel(publisher_confirms=True)
+
+    async def publish_event(self, message: dict, queue_name='video_processing_queue', wait_for_confirm=False):
         """
         Publishes a message.
+        By default returns as soon as the message is queued for the broker;
+        with wait_for_confirm=True it returns once the broker confirmed it.
         """
-        self._ensure_connection()
-        self.channel.basic_publish(
-            exchange='',
-            routing_key='video_processing_queue',
-            body=json.dumps(message),
-            properties=pika.BasicProperties(delivery_mode=2)
-        )
+        future = asyncio.get_running_loop().create_future() if wait_for_confirm else None
+        await self.queue.put((queue_name, json.dumps(message).encode(), future))
+        if future:
+            await future
+
+    async def publish_batch(self, messages, queue_name='video_processing_queue'):
+        """
+        Publishes several messages and waits until the broker settled all of them.
+        Returns one entry per message: None once confirmed, else the exception
+        that kept it from being confirmed.
+        """
+        loop = asyncio.get_running_loop()
+        futures = []
+        for message in messages:
+            future = loop.create_future()
+            await self.queue.put((queue_name, json.dumps(message).encode(), future))
+            futures.append(future)
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        return [result if isinstance(result, BaseException) else None for result in results]
+
+    async def _publish_batches(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < settings.RABBITMQ_CONFIRM_BATCH_SIZE and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            try:
+                await self._publish_with_retry(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
 
-    def _ensure_connection(self):
-        if self.connection is None or self.connection.is_closed:
-            self._connect()
+    async def _publish_with_retry(self, batch):
+        for attempt in range(1, settings.RABBITMQ_PUBLISH_RETRIES + 1):
+            try:
+                async with self.channel_pool.acquire() as channel:
+                    # Publish the whole batch, then wait for every confirm at once
+                    await asyncio.gather(*(
+                        channel.default_exchange.publish(
+                            aio_pika.Message(body, delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
+                            routing_key=queue_name
+                        )
+                        for queue_name, body, _ in batch
+                    ))
+                for _, _, future in batch:
+                    if future and not future.done():
+                        future.set_result(True)
+                return
+            except Exception as e:
+                # Already-confirmed messages may be resent; consumers tolerate redelivery
+                logger.warning(f"Publish attempt {attempt} failed for {len(batch)} messages: {e}")
+                if attempt == settings.RABBITMQ_PUBLISH_RETRIES:
+                    # Callers waiting for confirms get the error; fire-and-forget messages are lost
+                    logger.error(f"Giving up on {len(batch)} messages after {attempt} attempts")
+                    for _, _, future in batch:
+                        if future and not future.done():
+                            future.set_exception(e)
+                    return
+                await asyncio.sleep(min(2 ** attempt, 30))
 
-    def close(self):
-        if self.connection and not self.connection.is_closed:
-            self.connection.close()
\ No newline at end of file
+    async def close(self):
+        # Drain queued messages before shutting the connections down, but not forever
+        if self.queue is not None:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout=settings.RABBITMQ_CLOSE_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                logger.error(f"Closing with {self.queue.qsize()} messages still unpublished")
+        for worker in self.workers:
+            worker.cancel()
+        if self.channel_pool:
+            await self.channel_pool.close()
+        if self.connection_pool:
+            await self.connection_pool.close()
@@ -0,0 +1,115 @@
+import redis
+import json
+from config import settings
+
+class VideoHashIndex:
+    """
+    Maps the SHA-256 of an uploaded video to the video_id that owns its artifacts.
+    One key per hash, so a lookup is a single O(1) GET.
+    """
+    # Compare-and-set: only hand the content over if the expected owner still has it
+    REPLACE_SCRIPT = """
+    local owner = redis.call('GET', KEYS[1])
+    if owner and owner ~= ARGV[1] then
+        return owner
+    end
+    redis.call('SET', KEYS[1], ARGV[2])
+    return ARGV[2]
+    """
+
+    def __init__(self):
+        self.client = redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            decode_responses=True
+        )
+        self._replace = self.client.register_script(self.REPLACE_SCRIPT)
+
+    def _key(self, sha256: str):
+        return f"video_sha256:{sha256}"
+
+    def claim(self, sha256: str, video_id: str):
+        """
+        Registers video_id as the owner of this content.
+        Returns None if it was new, otherwise the video_id that already owns it.
+        SET NX makes concurrent uploads of the same file agree on one owner.
+        """
+        if self.client.set(self._key(sha256), video_id, nx=True):
+            return None
+        return self.client.get(self._key(sha256))
+
+    def replace(self, sha256: str, old_video_id: str, video_id: str):
+        """
+        Makes video_id the owner if old_video_id still owns the content.
+        Returns the owner afterwards (another upload may have taken over first).
+        """
+        return self._replace(keys=[self._key(sha256)], args=[old_video_id, video_id])
+
+    def lookup(self, sha256: str):
+        return self.client.get(self._key(sha256))
+
+    def close(self):
+        self.client.close()
+
+
+class PendingDirectUploads:
+    """
+    Uploads handed out as presigned URLs, waiting for MinIO to report the object.
+    Keyed by object name. A publisher claims a record (a short lease, so the
+    notification stream and the sweep never both publish it) and removes it only
+    once the broker confirmed the event; a failed or crashed publish leaves the
+    record for the next sweep.
+    """
+    PUBLISH_LEASE_SECONDS = 60
+
+    # KEYS: record, lease. ARGV: lease seconds. The record, or nil if absent or already claimed.
+    CLAIM_SCRIPT = """
+    local upload = redis.call('GET', KEYS[1])
+    if not upload then
+        return nil
+    end
+    if not redis.call('SET', KEYS[2], '1', 'NX', 'EX', ARGV[1]) then
+        return nil
+    end
+    return upload
+    """
+
+    def __init__(self):
+        self.client = redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            decode_responses=True
+        )
+        self._claim = self.client.register_script(self.CLAIM_SCRIPT)
+
+    def _key(self, object_name: str):
+        return f"presigned_upload:{object_name}"
+
+    def _lease_key(self, object_name: str):
+        return f"presigned_upload_publishing:{object_name}"
+
+    def add(self, object_name: str, upload: dict):
+        # Keep the record a little longer than the URL is valid for
+        ttl = settings.PRESIGNED_URL_EXPIRY_SECONDS + 600
+        self.client.set(self._key(object_name), json.dumps(upload), ex=ttl)
+
+    def claim(self, object_name: str):
+        """Returns the pending upload for this object, or None if it is not ours or someone is publishing it"""
+        data = self._claim(keys=[self._key(object_name), self._lease_key(object_name)], args=[self.PUBLISH_LEASE_SECONDS])
+        return json.loads(data) if data else None
+
+    def done(self, object_name: str):
+        """The event was confirmed: forget the upload"""
+        self.client.delete(self._key(object_name), self._lease_key(object_name))
+
+    def release(self, object_name: str):
+        """The publish failed: leave the upload for the next attempt"""
+        self.client.delete(self._lease_key(object_name))
+
+    def object_names(self):
+        """Every object still waiting for its notification"""
+        prefix = self._key("")
+        return [key[len(prefix):] for key in self.client.scan_iter(match=f"{prefix}*", count=500)]
+
+    def close(self):
+        self.client.close()